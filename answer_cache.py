@@ -0,0 +1,154 @@
+# answer_cache.py
+"""
+Semantic answer cache for BibleChatAgent.
+
+An answer is reused when a new question's embedding is within a cosine
+threshold of a cached question AND retrieval produced the identical set of
+references, so a near-duplicate phrasing of a question grounded in the same
+passages returns in milliseconds instead of a full decode.
+
+Entries are bounded by count and total bytes (LRU) plus a TTL, persisted in
+SQLite, and stamped with the model file, prompt template version and sampling
+parameters: any change to those makes every older entry unreachable.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def answer_stamp(model_path: str, template_version: int, sampling: dict) -> str:
+    """Identity of everything that shapes an answer besides the question."""
+    try:
+        st = os.stat(model_path)
+        model_id = [os.path.basename(model_path), st.st_size, st.st_mtime_ns]
+    except OSError:
+        model_id = [str(model_path)]
+    blob = json.dumps([model_id, template_version, sampling], sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, stamp: str, path=None, threshold: float = 0.92,
+                 max_entries: int = 2000, max_bytes: int = 8 * 1024 * 1024,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        self.stamp = stamp
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # id -> (refs_key, vector, answer, created, size)
+        self._by_refs = {}              # refs_key -> {id, ...}
+        self._bytes = 0
+        self._next_id = 0
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " id INTEGER PRIMARY KEY, stamp TEXT, refs TEXT, vector BLOB,"
+                " answer TEXT, created REAL, used REAL)"
+            )
+            self._db.execute("DELETE FROM answers WHERE stamp != ?", (stamp,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT id, refs, vector, answer, created FROM answers ORDER BY used"
+            ).fetchall()
+            for row_id, refs, vector, answer, created in rows:
+                self._insert(row_id, refs, np.frombuffer(vector, dtype=np.float32), answer, created)
+                self._next_id = max(self._next_id, row_id + 1)
+            self._evict()
+
+    @staticmethod
+    def refs_key(refs) -> str:
+        return "\n".join(sorted(set(refs)))
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    # --- internal bookkeeping ----------------------------------------------
+    def _insert(self, entry_id, refs_key, vector, answer, created):
+        size = vector.nbytes + len(answer.encode("utf-8")) + len(refs_key)
+        self._entries[entry_id] = (refs_key, vector, answer, created, size)
+        self._by_refs.setdefault(refs_key, set()).add(entry_id)
+        self._bytes += size
+
+    def _remove(self, entry_id):
+        refs_key, _, _, _, size = self._entries.pop(entry_id)
+        ids = self._by_refs[refs_key]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_refs[refs_key]
+        self._bytes -= size
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def _evict(self):
+        now = time.time()
+        expired = [i for i, e in self._entries.items() if now - e[3] > self.ttl]
+        for i in expired:
+            self._remove(i)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        if self._db is not None:
+            self._db.commit()
+
+    # --- public API -----------------------------------------------------------
+    def lookup(self, question_vector, refs):
+        """Return a cached answer or None."""
+        key = self.refs_key(refs)
+        q = self._unit(question_vector)
+        with self._lock:
+            best, best_score = None, self.threshold
+            now = time.time()
+            for entry_id in self._by_refs.get(key, ()):
+                _, vector, _, created, _ = self._entries[entry_id]
+                if now - created > self.ttl:
+                    continue
+                score = float(vector @ q)
+                if score >= best_score:
+                    best, best_score = entry_id, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            if self._db is not None:
+                self._db.execute("UPDATE answers SET used = ? WHERE id = ?", (now, best))
+                self._db.commit()
+            return self._entries[best][2]
+
+    def store(self, question_vector, refs, answer: str):
+        key = self.refs_key(refs)
+        vector = self._unit(question_vector)
+        now = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._insert(entry_id, key, vector, answer, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO answers (id, stamp, refs, vector, answer, created, used)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry_id, self.stamp, key, vector.tobytes(), answer, now, now),
+                )
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self._entries), "bytes": self._bytes,
+            }
@@ -0,0 +1,172 @@
+# batch.py
+"""
+Answer a whole file of questions.
+
+    python batch.py questions.jsonl answers.jsonl
+    python batch.py curriculum.csv answers.jsonl
+
+Input is JSONL ({"id": ..., "question": ...}, id optional) or CSV with a
+"question" column and an optional "id" column. Output is JSONL, one record per
+question, appended and synced as each answer completes. Rerunning with the same
+output file skips ids already answered, so an interrupted run resumes where it
+stopped.
+
+Pipeline:
+  1. every question is classified up front;
+  2. a producer thread takes the questions in blocks of BATCH_BLOCK: the ones
+     that need retrieval are embedded in one encoder call and searched as a
+     block (BibleRAG.query_docs_batch), then each item is planned;
+  3. plans go through a bounded queue to the main thread, which runs the LLM,
+     so retrieval of later blocks overlaps generation of earlier items.
+"""
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+def read_questions(path):
+    """Return [{"id", "question"}] from a JSONL or CSV file."""
+    path = Path(path)
+    items = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for n, row in enumerate(rows, 1):
+            question = (row.get("question") or "").strip()
+            if question:
+                item_id = row.get("id")
+                items.append({"id": n if item_id in (None, "") else item_id, "question": question})
+    return items
+
+
+def completed_ids(output_path):
+    """Ids already written to output_path. A torn final line (interrupted
+    write) is cut off so the file stays valid JSONL."""
+    path = Path(output_path)
+    done = set()
+    if not path.exists():
+        return done
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError, TypeError):
+                break
+            good += len(line)
+    if good < path.stat().st_size:
+        with open(path, "r+b") as f:
+            f.truncate(good)
+    return done
+
+
+def run_batch(agent, items, output_path, block_size: int = 32, queue_size: int = 8):
+    """Answer items ({"id", "question"}) into output_path (JSONL, resumable).
+    Returns a summary dict."""
+    done = completed_ids(output_path)
+    skipped = len(items)
+    items = [it for it in items if str(it["id"]) not in done]
+    skipped -= len(items)
+    categories = [agent.classify_question(it["question"]) for it in items]
+
+    plans = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    failure = []
+
+    def produce():
+        try:
+            for start in range(0, len(items), block_size):
+                block = range(start, min(start + block_size, len(items)))
+                retrieve = [i for i in block if categories[i] == "bible_question"]
+                docs = {}
+                if retrieve:
+                    try:
+                        found = agent.rag.query_docs_batch(
+                            [(items[i]["question"], agent.retrieval_scope(items[i]["question"])) for i in retrieve],
+                            k=5,
+                        )
+                        docs = dict(zip(retrieve, found))
+                    except Exception as e:
+                        print(f"⚠️ Block retrieval failed ({e}); searching per question.")
+                for i in block:
+                    if stop.is_set():
+                        return
+                    plan = agent.plan(items[i]["question"], category=categories[i], docs=docs.get(i))
+                    plans.put((items[i], plan))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            plans.put(None)
+
+    producer = threading.Thread(target=produce, name="batch-retrieval", daemon=True)
+    producer.start()
+
+    t0 = time.monotonic()
+    answered = llm_calls = prompt_tokens = 0
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            while True:
+                entry = plans.get()
+                if entry is None:
+                    break
+                item, plan = entry
+                started = time.monotonic()
+                answer = "".join(agent.generate(plan))
+                record = {
+                    "id": item["id"],
+                    "question": plan.question,
+                    "category": plan.category,
+                    "answer": answer,
+                    "llm": plan.needs_llm,
+                    "prompt_tokens": plan.prompt_tokens,
+                    "ms": round((time.monotonic() - started) * 1000, 1),
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())   # each answer is a checkpoint
+                answered += 1
+                llm_calls += plan.needs_llm
+                prompt_tokens += plan.prompt_tokens
+                print(f"   [{answered}/{len(items)}] {item['id']}", end="\r")
+    finally:
+        stop.set()
+        while producer.is_alive():
+            try:
+                plans.get_nowait()   # unblock a producer waiting on a full queue
+            except queue.Empty:
+                producer.join(0.05)
+    print()
+    if failure:
+        raise failure[0]
+    return {
+        "answered": answered,
+        "skipped": skipped,
+        "llm_calls": llm_calls,
+        "prompt_tokens": prompt_tokens,
+        "seconds": round(time.monotonic() - t0, 2),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python batch.py QUESTIONS.(jsonl|csv) ANSWERS.jsonl")
+        sys.exit(2)
+    from chat_agent import BibleChatAgent
+
+    questions = read_questions(sys.argv[1])
+    agent = BibleChatAgent("./bible/bible_books")
+    summary = run_batch(
+        agent, questions, sys.argv[2],
+        block_size=int(os.getenv("BATCH_BLOCK", "32")),
+        queue_size=int(os.getenv("BATCH_QUEUE", "8")),
+    )
+    print(f"✅ Batch done: {json.dumps(summary)}")
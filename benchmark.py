@@ -0,0 +1,305 @@
+# benchmark.py
+"""
+Reproducible latency benchmark.
+
+    python benchmark.py                      real model (downloads it if missing)
+    python benchmark.py --fake-llm           deterministic stand-in, no GGUF needed
+    python benchmark.py --fake-llm -o run.json
+
+Measures, over the versioned question set in bench_questions.json:
+
+    startup     cold (first launch of the run) and warm (later launches)
+                process start to ready, in fresh subprocesses, plus the
+                time to load each background stage
+    analysis    per-question classification/parsing cost (µs)
+    retrieval   query_docs latency p50/p95/p99 for the retrieval questions,
+                with an empty query cache and again with it warm
+    end_to_end  plan + generate per question and per category, prompt
+                tokens, time to first token, prefill and decode tokens/sec
+
+Caches that persist between runs (query cache, answer cache) are kept in
+memory here, so one run never benefits from another. The report is JSON with
+the commit, machine and settings, so runs can be compared across both.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+BENCHMARK_VERSION = 1
+QUESTIONS_PATH = Path(__file__).with_name("bench_questions.json")
+BIBLE_PATH = "./bible/bible_books"
+SETTINGS = ("N_CTX", "N_BATCH", "N_THREADS", "N_THREADS_BATCH", "MAX_TOKENS", "VECTOR_BACKEND",
+            "FLAT_INDEX_DTYPE", "RETRIEVAL_MODE", "PREFIX_CACHE", "PROMPT_BUDGET", "PASSAGE_CHARS",
+            "SPECULATIVE", "SPEC_NUM_PRED", "SPEC_NGRAM")
+_TOKEN = re.compile(rb"\w+|[^\w\s]|\s+")
+
+
+class FakeLlama:
+    """Deterministic stand-in for llama_cpp.Llama: the same prompt always
+    gives the same answer. prefill_tps/decode_tps > 0 add simulated compute
+    time; 0 makes it instantaneous, so only the pipeline is measured."""
+
+    def __init__(self, answer_tokens: int = 64, prefill_tps: float = 0.0, decode_tps: float = 0.0):
+        self.answer_tokens = answer_tokens
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False):
+        tokens = [zlib.crc32(t) & 0x7FFF for t in _TOKEN.findall(text)]
+        return ([1] if add_bos else []) + tokens
+
+    def _answer(self, prompt: str, max_tokens: int):
+        # Echo the first context line, as a grounded answer would quote it
+        lines = [l for l in prompt.split("\n") if " — " in l]
+        source = lines[0].split(" — ", 1)[1] if lines else "The passages do not answer this directly."
+        words = (source + " ") * 8
+        pieces = [t.decode("utf-8", "ignore") for t in _TOKEN.findall(words.encode("utf-8"))]
+        return pieces[:min(max_tokens, self.answer_tokens)]
+
+    def __call__(self, prompt, max_tokens: int = 256, stream: bool = False, **kwargs):
+        if self.prefill_tps:
+            time.sleep(len(self.tokenize(prompt.encode("utf-8"))) / self.prefill_tps)
+        pieces = self._answer(prompt, max_tokens)
+        if not stream:
+            if self.decode_tps:
+                time.sleep(len(pieces) / self.decode_tps)
+            return {"choices": [{"text": "".join(pieces)}]}
+        return self._stream(pieces)
+
+    def _stream(self, pieces):
+        for piece in pieces:
+            if self.decode_tps:
+                time.sleep(1.0 / self.decode_tps)
+            yield {"choices": [{"text": piece}]}
+
+
+def percentiles(values):
+    """Summary of a list of milliseconds (nearest-rank percentiles)."""
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+    return {
+        "n": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": round(pick(50), 3),
+        "p95": round(pick(95), 3),
+        "p99": round(pick(99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def load_questions(path=QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["version"], data["questions"]
+
+
+def make_agent(fake_llm, fake_options=None):
+    from chat_agent import BibleChatAgent, _Stage
+
+    agent = BibleChatAgent(BIBLE_PATH, warm_up=False)
+    if fake_llm:
+        def load():
+            llm = FakeLlama(**(fake_options or {}))
+            agent.tokens.bind(llm)
+            return llm
+        agent._stages["model_file"] = _Stage("model_file", lambda: "fake-llm", agent.timings)
+        agent._stages["llm"] = _Stage("llm", load, agent.timings)
+    return agent
+
+
+# --- startup ------------------------------------------------------------------
+def probe_startup(fake_llm):
+    """Run in a fresh process: time imports, init and each stage."""
+    t0 = time.perf_counter()
+    import chat_agent  # noqa: F401
+    imports = time.perf_counter() - t0
+    agent = make_agent(fake_llm)
+    out = {"imports_ms": imports * 1000, "ready_ms": (time.perf_counter() - t0) * 1000}
+    for name in agent.WARM_UP:
+        try:
+            agent._stages[name].get()
+        except Exception as e:
+            out[f"{name}_error"] = str(e)
+    out.update({f"{name}_ms": s * 1000 for name, s in agent.timings.items()})
+    out["total_ms"] = (time.perf_counter() - t0) * 1000
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in out.items()}
+
+
+def bench_startup(fake_llm, runs):
+    cmd = [sys.executable, __file__, "--probe-startup"] + (["--fake-llm"] if fake_llm else [])
+    env = dict(os.environ, WARMUP="0")
+    launches = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        done = subprocess.run(cmd, capture_output=True, text=True, env=env, cwd=Path(__file__).parent)
+        wall = (time.perf_counter() - t0) * 1000
+        if done.returncode != 0:
+            return {"error": done.stderr.strip().splitlines()[-1:] or ["probe failed"]}
+        result = json.loads(done.stdout.strip().splitlines()[-1])
+        result["process_ms"] = round(wall, 1)
+        launches.append(result)
+    warm = {}
+    for key in launches[0]:
+        values = [r[key] for r in launches[1:] if isinstance(r.get(key), (int, float))]
+        if values:
+            warm[key] = sorted(values)[len(values) // 2]
+    return {"cold": launches[0], "warm_median": warm, "launches": len(launches)}
+
+
+# --- in-process stages --------------------------------------------------------
+def bench_analysis(agent, questions, rounds=200):
+    per_question = {}
+    by_category = {}
+    for q in questions:
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            agent.analyzer._analyze(q["question"])
+        us = (time.perf_counter() - t0) / rounds * 1e6
+        per_question[q["question"]] = round(us, 2)
+        by_category.setdefault(q["category"], []).append(us)
+    mismatches = [
+        {"question": q["question"], "expected": q["category"], "got": agent.classify_question(q["question"])}
+        for q in questions if agent.classify_question(q["question"]) != q["category"]
+    ]
+    return {
+        "us": percentiles(list(per_question.values())),
+        "us_by_category": {c: percentiles(v) for c, v in by_category.items()},
+        "misclassified": mismatches,
+    }
+
+
+def bench_retrieval(agent, questions):
+    todo = [q["question"] for q in questions if q["category"] == "bible_question"]
+    out = {}
+    for label in ("cold_cache", "warm_cache"):
+        times = []
+        for question in todo:
+            t0 = time.perf_counter()
+            try:
+                agent.rag.query_docs(question, k=5, **agent.retrieval_scope(question))
+            except Exception as e:
+                return dict(out, error=f"{type(e).__name__}: {e}")
+            times.append((time.perf_counter() - t0) * 1000)
+        out[label] = percentiles(times)
+    return out
+
+
+def bench_end_to_end(agent, questions):
+    by_category, totals, ttfts = {}, [], []
+    prompt_tokens = completion_tokens = 0
+    prefill_s = decode_s = 0.0
+    for q in questions:
+        t0 = time.perf_counter()
+        plan = agent.plan(q["question"])
+        planned = time.perf_counter()
+        timing = {}
+        pieces = list(agent.generate(plan, timing))
+        end = time.perf_counter()
+        first = timing.get("first")   # first raw chunk, before tidying holds any text
+        total = (end - t0) * 1000
+        totals.append(total)
+        entry = by_category.setdefault(plan.category, {"total": [], "plan": []})
+        entry["total"].append(total)
+        entry["plan"].append((planned - t0) * 1000)
+        if plan.needs_llm and first is not None:
+            n_out = agent.tokens.count("".join(pieces), cache=False)
+            ttfts.append((first - planned) * 1000)
+            prompt_tokens += plan.prompt_tokens
+            completion_tokens += n_out
+            prefill_s += first - planned
+            decode_s += end - first
+    return {
+        "ms": percentiles(totals),
+        "ms_by_category": {c: {k: percentiles(v) for k, v in e.items()} for c, e in by_category.items()},
+        "llm_calls": len(ttfts),
+        "ttft_ms": percentiles(ttfts),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_exact": agent.tokens.exact,
+        "prefill_tok_s": round(prompt_tokens / prefill_s, 1) if prefill_s else None,
+        "decode_tok_s": round(completion_tokens / decode_s, 1) if decode_s else None,
+        "speculative_acceptance": agent.draft.acceptance_rate if agent.draft is not None else None,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    version, questions = load_questions(args.questions)
+    report = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "questions_version": version,
+        "questions": len(questions),
+        "commit": _commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "llm": "fake" if args.fake_llm else "llama.cpp",
+        "settings": {k: os.environ[k] for k in SETTINGS if k in os.environ},
+    }
+    if args.startup_runs:
+        print("⏱ startup...", file=sys.stderr)
+        report["startup"] = bench_startup(args.fake_llm, args.startup_runs)
+
+    agent = make_agent(args.fake_llm, {"prefill_tps": args.fake_prefill_tps, "decode_tps": args.fake_decode_tps})
+    report["corpus_ms"] = round(agent.timings["corpus"] * 1000, 2)
+    print("⏱ analysis...", file=sys.stderr)
+    report["analysis"] = bench_analysis(agent, questions)
+    print("⏱ retrieval...", file=sys.stderr)
+    report["retrieval"] = bench_retrieval(agent, questions)
+    print("⏱ end to end...", file=sys.stderr)
+    report["end_to_end"] = bench_end_to_end(agent, questions)
+    report["stage_ms"] = {k: round(v * 1000, 1) for k, v in agent.timings.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fake-llm", action="store_true", help="use the deterministic stand-in LLM")
+    parser.add_argument("--fake-prefill-tps", type=float, default=0.0)
+    parser.add_argument("--fake-decode-tps", type=float, default=0.0)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--startup-runs", type=int, default=3, help="process launches (0 skips startup)")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--probe-startup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Nothing persisted by an earlier run may speed this one up
+    os.environ.setdefault("QUERY_CACHE_PATH", "")
+    os.environ.setdefault("ANSWER_CACHE_PATH", "")
+    os.environ.setdefault("SESSION_STORE_PATH", "")
+    if args.fake_llm:
+        os.environ.setdefault("PREFIX_CACHE", "0")
+
+    if args.probe_startup:
+        print(json.dumps(probe_startup(args.fake_llm)))
+        return
+    report = json.dumps(run(args), indent=1, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+        print(f"✅ Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
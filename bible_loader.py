@@ -1,31 +1,62 @@
 # bible_loader.py
-import json
 from pathlib import Path
-from thefuzz import process
+from corpus import load_corpus
+from book_resolver import BookResolver
+from references import ReferenceParser, resolve
 
 class Bible:
     def __init__(self, data_path):
-        self.verse_map = {}
-        self.book_aliases = {}
+        self.corpus = None
+        self.books = None
         self.load_bible(data_path)
 
     def load_bible(self, data_path):
-        path = Path(data_path)
-        for file in path.glob("*.json"):
-            book_name = file.stem.lower()
-            with open(file, encoding="utf-8") as f:
-                verses = json.load(f)
-            for v in verses:
-                if v.get("type") != "paragraph text":
-                    continue
-                key = (book_name, str(v["chapterNumber"]), str(v["verseNumber"]))
-                self.verse_map[key] = v["value"]
-            self.book_aliases[book_name.replace("_", " ")] = book_name
+        # Compiled, memory-mapped corpus (shared with BibleRAG); rebuilt if stale
+        self.corpus = load_corpus(Path(data_path))
+        # Alias index is built once here; get_verse never scans book names
+        self.books = BookResolver(self.corpus.books)
+        single = [b for b in self.corpus.books if self.corpus.chapter_count(b) == 1]
+        self.references = ReferenceParser(self.books, single)
+
+    def resolve_book(self, book):
+        """Return the corpus book id for a user-typed name, or None."""
+        return self.books.resolve(book)
 
     def get_verse(self, book, chapter, verse):
-        normalized = book.lower().replace("_", " ")
-        match, score = process.extractOne(normalized, self.book_aliases.keys())
-        if score < 70:
+        stem = self.resolve_book(book)
+        if stem is None:
             return "Hmmm, not seeing that book. Please check your spelling."
-        key = (self.book_aliases[match], str(chapter), str(verse))
-        return self.verse_map.get(key, "Verse not found.")
\ No newline at end of file
+        text = self.corpus.get(stem, int(chapter), int(verse))
+        return text if text is not None else "Verse not found."
+
+    def get_verses(self, book, chapter, start_verse, end_verse):
+        """Return [(verse, text), ...] for a range, resolving the book once.
+        Returns None when the book name cannot be resolved."""
+        stem = self.resolve_book(book)
+        if stem is None:
+            return None
+        verses = []
+        for v in range(int(start_verse), int(end_verse) + 1):
+            text = self.corpus.get(stem, int(chapter), v)
+            if text is not None:
+                verses.append((v, text))
+        return verses
+
+    def lookup(self, text):
+        """Parse every reference in text and resolve each to a corpus slice.
+        Returns [(Reference, (start, end))]; unresolvable references are dropped."""
+        return self.resolve_all(self.references.parse(text))
+
+    def resolve_all(self, refs):
+        """[(Reference, (start, end))] for already parsed references."""
+        found = []
+        for ref in refs:
+            span = resolve(self.corpus, ref)
+            if span is not None:
+                found.append((ref, span))
+        return found
+
+    def passage(self, span):
+        """Yield (chapter, verse, text) for a slice returned by lookup()."""
+        for _, chapter, verse, text in self.corpus.iter_range(*span):
+            yield chapter, verse, text
\ No newline at end of file
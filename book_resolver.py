@@ -0,0 +1,167 @@
+# book_resolver.py
+"""
+Book-name resolution built once at load time.
+
+Every canonical name, common abbreviation and ordinal/spacing variant is
+normalized into one dict, so the usual case ("Gen", "1 Cor", "First John",
+"I John", "Psalm") is a single O(1) lookup. Misspellings fall back to a small
+character-trigram index whose results are kept in an LRU cache.
+"""
+import re
+from functools import lru_cache
+from thefuzz import fuzz
+
+# stem -> (display name, extra aliases). Numbered books list their aliases
+# WITHOUT the number; the number prefix is added for every alias.
+BOOK_NAMES = {
+    "genesis": ("Genesis", ["gen", "gn", "ge"]),
+    "exodus": ("Exodus", ["exod", "exo", "ex"]),
+    "leviticus": ("Leviticus", ["lev", "lv"]),
+    "numbers": ("Numbers", ["num", "nm", "nb"]),
+    "deuteronomy": ("Deuteronomy", ["deut", "dt"]),
+    "joshua": ("Joshua", ["josh", "jos", "jsh"]),
+    "judges": ("Judges", ["judg", "jdg", "jdgs", "jg"]),
+    "ruth": ("Ruth", ["rth", "ru"]),
+    "1samuel": ("1 Samuel", ["sam", "sa", "sm"]),
+    "2samuel": ("2 Samuel", ["sam", "sa", "sm"]),
+    "1kings": ("1 Kings", ["kgs", "ki", "kg", "kin"]),
+    "2kings": ("2 Kings", ["kgs", "ki", "kg", "kin"]),
+    "1chronicles": ("1 Chronicles", ["chron", "chr", "ch"]),
+    "2chronicles": ("2 Chronicles", ["chron", "chr", "ch"]),
+    "ezra": ("Ezra", ["ezr"]),
+    "nehemiah": ("Nehemiah", ["neh"]),
+    "esther": ("Esther", ["esth", "est"]),
+    "job": ("Job", ["jb"]),
+    "psalms": ("Psalms", ["psalm", "ps", "psa", "pss", "psm"]),
+    "proverbs": ("Proverbs", ["prov", "pro", "prv", "pr", "proverb"]),
+    "ecclesiastes": ("Ecclesiastes", ["eccl", "eccles", "ecc", "qoh", "qoheleth"]),
+    "songofsolomon": ("Song of Solomon", ["song", "song of songs", "sos", "sng", "canticles", "song of sol"]),
+    "isaiah": ("Isaiah", ["isa"]),
+    "jeremiah": ("Jeremiah", ["jer", "jr"]),
+    "lamentations": ("Lamentations", ["lam"]),
+    "ezekiel": ("Ezekiel", ["ezek", "eze", "ezk"]),
+    "daniel": ("Daniel", ["dan", "dn"]),
+    "hosea": ("Hosea", ["hos"]),
+    "joel": ("Joel", ["jl"]),
+    "amos": ("Amos", []),
+    "obadiah": ("Obadiah", ["obad", "ob"]),
+    "jonah": ("Jonah", ["jnh", "jon"]),
+    "micah": ("Micah", ["mic", "mc"]),
+    "nahum": ("Nahum", ["nah"]),
+    "habakkuk": ("Habakkuk", ["hab", "hb"]),
+    "zephaniah": ("Zephaniah", ["zeph", "zep", "zp"]),
+    "haggai": ("Haggai", ["hag", "hg"]),
+    "zechariah": ("Zechariah", ["zech", "zec", "zc"]),
+    "malachi": ("Malachi", ["mal", "ml"]),
+    "matthew": ("Matthew", ["matt", "mat", "mt"]),
+    "mark": ("Mark", ["mrk", "mk", "mar"]),
+    "luke": ("Luke", ["luk", "lk"]),
+    "john": ("John", ["jn", "jhn", "joh"]),
+    "acts": ("Acts", ["act", "acts of the apostles"]),
+    "romans": ("Romans", ["rom", "rm"]),
+    "1corinthians": ("1 Corinthians", ["cor", "co"]),
+    "2corinthians": ("2 Corinthians", ["cor", "co"]),
+    "galatians": ("Galatians", ["gal"]),
+    "ephesians": ("Ephesians", ["eph", "ephes"]),
+    "philippians": ("Philippians", ["phil", "php", "pp"]),
+    "colossians": ("Colossians", ["col"]),
+    "1thessalonians": ("1 Thessalonians", ["thess", "thes", "th"]),
+    "2thessalonians": ("2 Thessalonians", ["thess", "thes", "th"]),
+    "1timothy": ("1 Timothy", ["tim", "ti", "tm"]),
+    "2timothy": ("2 Timothy", ["tim", "ti", "tm"]),
+    "titus": ("Titus", ["tit"]),
+    "philemon": ("Philemon", ["philem", "phlm", "phm"]),
+    "hebrews": ("Hebrews", ["heb"]),
+    "james": ("James", ["jas", "jm"]),
+    "1peter": ("1 Peter", ["pet", "pe", "pt"]),
+    "2peter": ("2 Peter", ["pet", "pe", "pt"]),
+    "1john": ("1 John", ["jn", "jhn", "jo"]),
+    "2john": ("2 John", ["jn", "jhn", "jo"]),
+    "3john": ("3 John", ["jn", "jhn", "jo"]),
+    "jude": ("Jude", ["jud"]),
+    "revelation": ("Revelation", ["rev", "revelations", "apocalypse", "revelation of john"]),
+}
+
+_ORDINALS = {
+    "1": "1", "i": "1", "1st": "1", "first": "1",
+    "2": "2", "ii": "2", "2nd": "2", "second": "2",
+    "3": "3", "iii": "3", "3rd": "3", "third": "3",
+}
+_NUMBERED = re.compile(r"^([1-3])(\D.*)$")
+_PUNCT = re.compile(r"[._\-']")
+
+
+def normalize_book(name: str) -> str:
+    """Lowercase, map a leading ordinal to its digit and drop spaces/punctuation.
+
+    "First John", "I John", "1st Jn.", "1john" → "1john" / "1jn".
+    """
+    tokens = _PUNCT.sub(" ", name.lower()).split()
+    if len(tokens) > 1 and tokens[0] in _ORDINALS:
+        tokens[0] = _ORDINALS[tokens[0]]
+    return "".join(tokens)
+
+
+def display_name(stem: str) -> str:
+    entry = BOOK_NAMES.get(stem)
+    return entry[0] if entry else stem.replace("_", " ").title()
+
+
+def _trigrams(key: str):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BookResolver:
+    """Map user-typed book names to corpus stems ("1 Cor" → "1corinthians")."""
+
+    def __init__(self, stems, fuzzy_threshold: int = 70, cache_size: int = 512):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.aliases = {}
+        for stem in stems:
+            display, extra = BOOK_NAMES.get(stem, (stem, []))
+            m = _NUMBERED.match(stem)
+            prefix, base = (m.group(1), m.group(2)) if m else ("", stem)
+            names = [stem, display, base] + extra
+            for n in names:
+                key = normalize_book(n)
+                if prefix and not key.startswith(prefix):
+                    key = prefix + key
+                # first writer wins, so canonical names beat abbreviations
+                self.aliases.setdefault(key, stem)
+
+        # trigram -> alias keys; only used on exact-lookup misses
+        self._grams = {}
+        for key in self.aliases:
+            for g in _trigrams(key):
+                self._grams.setdefault(g, []).append(key)
+
+        self._fuzzy = lru_cache(maxsize=cache_size)(self._fuzzy_lookup)
+
+    def resolve(self, name: str, fuzzy: bool = True):
+        """Return the corpus stem for a book name, or None if nothing is close.
+        fuzzy=False accepts exact (normalized) aliases only."""
+        key = normalize_book(name)
+        if not key:
+            return None
+        stem = self.aliases.get(key)
+        if stem is not None or not fuzzy:
+            return stem
+        return self._fuzzy(key)
+
+    def _fuzzy_lookup(self, key: str):
+        # short words ("the", "and") are never misspelled book names
+        if len(key) < 4:
+            return None
+        votes = {}
+        for g in _trigrams(key):
+            for alias in self._grams.get(g, ()):
+                votes[alias] = votes.get(alias, 0) + 1
+        if not votes:
+            return None
+        candidates = sorted(votes, key=votes.get, reverse=True)[:8]
+        best, score = max(((a, fuzz.ratio(key, a)) for a in candidates), key=lambda t: t[1])
+        return self.aliases[best] if score >= self.fuzzy_threshold else None
+
+    def cache_info(self):
+        return self._fuzzy.cache_info()
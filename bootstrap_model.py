@@ -1,5 +1,11 @@
 # bootstrap_model.py
+import json
 import os
+import platform
+import re
+import socket
+import sys
+import time
 from pathlib import Path
 
 # Defaults (you can override with env vars)
@@ -16,10 +22,11 @@ def _available_ram_gb():
         print("[bootstrap_model] psutil not available — skipping RAM check.")
         return None
 
-def _select_filename():
+def _select_filename(models_dir: str = "models"):
     """
     Pick filename by RAM (or env override).
     - MODEL_FILENAME env var wins.
+    - Then the quantization chosen by this host's calibrated profile.
     - Else choose LARGE if >= ~24 GB available, else SMALL.
     """
     override = os.getenv("MODEL_FILENAME")
@@ -27,6 +34,15 @@ def _select_filename():
         print(f"[bootstrap_model] Using MODEL_FILENAME override: {override}")
         return override
 
+    profile = load_profile(models_dir)
+    if profile and (Path(models_dir) / profile["model_filename"]).exists():
+        print(f"[bootstrap_model] Using calibrated model: {profile['model_filename']}")
+        return profile["model_filename"]
+    return _ram_filename()
+
+
+def _ram_filename():
+    """The quantization the memory rule picks: LARGE with >= ~24 GB available."""
     ram = _available_ram_gb()
     if ram is None:
         print("[bootstrap_model] Defaulting to SMALL model.")
@@ -38,7 +54,7 @@ def _select_filename():
         print(f"[bootstrap_model] Detected ~{ram:.1f} GB available — choosing SMALL model.")
         return SMALL_FILE
 
-def ensure_model(models_dir: str = "models", auto_download: bool = True) -> str:
+def ensure_model(models_dir: str = "models", auto_download: bool = True, filename: str = None) -> str:
     """
     Ensure the chosen GGUF file exists locally. If not and auto_download=True,
     fetch it from Hugging Face (resumable). Returns absolute path to the file.
@@ -49,7 +65,7 @@ def ensure_model(models_dir: str = "models", auto_download: bool = True) -> str:
     models_path.mkdir(parents=True, exist_ok=True)
 
     repo_id = os.getenv("MODEL_REPO", DEFAULT_REPO)
-    filename = _select_filename()
+    filename = filename or _select_filename(models_dir)
     target = models_path / filename
 
     if target.exists():
@@ -92,9 +108,250 @@ def ensure_model(models_dir: str = "models", auto_download: bool = True) -> str:
             f"Details: {e}"
         )
 
+# --- runtime profile ------------------------------------------------------------
+PROFILE_VERSION = 1
+# A typical answer: retrieved passages + question in, a short summary out
+TYPICAL_PROMPT_TOKENS = 800
+TYPICAL_ANSWER_TOKENS = 250
+BATCH_SIZES = (256, 512, 1024)
+# Long enough that every n_batch in BATCH_SIZES takes several batches to prefill
+CALIBRATION_PROMPT_TOKENS = max(TYPICAL_PROMPT_TOKENS, 2 * max(BATCH_SIZES))
+
+
+def _total_ram_gb():
+    try:
+        import psutil
+        return psutil.virtual_memory().total / (1024 ** 3)
+    except Exception:
+        try:
+            return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 ** 3)
+        except (ValueError, OSError, AttributeError):
+            return None
+
+
+def physical_cores():
+    """Physical cores (SMT siblings excluded). llama.cpp decode is memory-bound,
+    so a thread per hyper-thread usually makes it slower, not faster."""
+    try:
+        import psutil
+        n = psutil.cpu_count(logical=False)
+        if n:
+            return n
+    except Exception:
+        pass
+    try:
+        cores, ids = set(), {}
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key in ("physical id", "core id"):
+                    ids[key] = value.strip()
+                elif not key:
+                    if ids:
+                        cores.add((ids.get("physical id"), ids.get("core id")))
+                    ids = {}
+        if ids:
+            cores.add((ids.get("physical id"), ids.get("core id")))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 4
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _host():
+    """What a profile was measured on; a different host (or new hardware)
+    invalidates it."""
+    ram = _total_ram_gb()
+    return {
+        "hostname": socket.gethostname(),
+        "cpu": _cpu_model(),
+        "logical_cores": os.cpu_count(),
+        "physical_cores": physical_cores(),
+        "ram_gb": round(ram) if ram else None,
+    }
+
+
+def _profile_path(models_dir):
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", socket.gethostname()) or "host"
+    return Path(models_dir) / f"runtime_profile.{name}.json"
+
+
+def load_profile(models_dir: str = "models"):
+    """This host's calibrated runtime profile, or None (RUNTIME_PROFILE=0 ignores it)."""
+    if os.getenv("RUNTIME_PROFILE", "1") == "0":
+        return None
+    try:
+        with open(_profile_path(models_dir), encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if profile.get("version") != PROFILE_VERSION or profile.get("host") != _host():
+        print("[bootstrap_model] Runtime profile is for other hardware; "
+              "run `python bootstrap_model.py --calibrate` again.")
+        return None
+    return profile
+
+
+def _thread_candidates():
+    physical, logical = physical_cores(), os.cpu_count() or 1
+    candidates = {physical, max(1, physical // 2), max(1, physical - 1), logical}
+    return sorted(candidates)
+
+
+def _fits(path, n_ctx):
+    """Whether the model (mmap'd weights + KV cache for n_ctx) fits in available RAM."""
+    ram = _available_ram_gb()
+    if ram is None:
+        return True, None
+    # f16 KV cache of a 7B model is ~0.125 MB per token; plus runtime buffers
+    need = path.stat().st_size / (1024 ** 3) + n_ctx * 0.125 / 1024 + 0.5
+    return need <= ram, need
+
+
+def _mlock_ok(path):
+    """mlock keeps the weights resident only if the limit and free RAM allow it."""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+        if soft != resource.RLIM_INFINITY and soft < path.stat().st_size:
+            return False
+    except (ImportError, ValueError, OSError):
+        return False
+    ram = _available_ram_gb()
+    return ram is not None and ram >= 1.5 * path.stat().st_size / (1024 ** 3) + 2
+
+
+def _measure(path, n_threads, n_threads_batch, n_batch, prompt_tokens=CALIBRATION_PROMPT_TOKENS,
+             decode_tokens=32):
+    """(prefill tok/s, decode tok/s) for one configuration."""
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=str(path), n_ctx=prompt_tokens + decode_tokens + 64, n_threads=n_threads,
+                n_threads_batch=n_threads_batch, n_batch=n_batch, use_mmap=True, verbose=False)
+    try:
+        sentence = llm.tokenize(b" In the beginning God created the heavens and the earth.", add_bos=False)
+        tokens = (sentence * (prompt_tokens // len(sentence) + 1))[:prompt_tokens]
+        llm.reset()
+        t0 = time.perf_counter()
+        llm.eval(tokens)
+        prefill = len(tokens) / (time.perf_counter() - t0)
+
+        llm.reset()
+        stream = llm("Summarize Genesis 1 in one paragraph:", max_tokens=decode_tokens,
+                     temperature=0.0, stream=True)
+        first, n = None, 0
+        for _ in stream:
+            n += 1
+            if first is None:
+                first = time.perf_counter()
+        decode = (n - 1) / (time.perf_counter() - first) if n > 1 else 0.0
+        return prefill, decode
+    finally:
+        del llm
+
+
+def calibrate(models_dir: str = "models", n_ctx: int = None, any_quantization: bool = False):
+    """Benchmark thread counts and batch sizes for the quantization the
+    memory rule picks (MODEL_FILENAME overrides), and save the fastest
+    configuration as this host's runtime profile.
+
+    any_quantization=True also races every other local GGUF and may pick a
+    smaller, lower-quality one for speed; the profile records that trade."""
+    import llama_cpp
+
+    n_ctx = n_ctx or int(os.getenv("N_CTX", "4096"))
+    default = os.getenv("MODEL_FILENAME") or _ram_filename()
+    models = [Path(ensure_model(models_dir, filename=default))]
+    if any_quantization:
+        models += sorted(p for p in Path(models_dir).glob("*.gguf") if p.name != default)
+    host = _host()
+    print(f"[bootstrap_model] Calibrating on {host['cpu']} "
+          f"({host['physical_cores']} physical / {host['logical_cores']} logical cores, "
+          f"{host['ram_gb']} GB RAM)")
+
+    results, best = [], None
+    for path in models:
+        fits, need = _fits(path, n_ctx)
+        if not fits:
+            print(f"  {path.name}: skipped, needs ~{need:.1f} GB with n_ctx={n_ctx}")
+            continue
+        # Decode speed depends on n_threads; prefill on n_threads_batch and n_batch
+        runs = []
+        for threads in _thread_candidates():
+            prefill, decode = _measure(path, threads, threads, max(BATCH_SIZES))
+            runs.append({"n_threads": threads, "n_batch": max(BATCH_SIZES),
+                         "prefill_tok_s": round(prefill, 1), "decode_tok_s": round(decode, 2)})
+            print(f"  {path.name}: threads {threads:>3}  prefill {prefill:8.1f} tok/s  decode {decode:6.2f} tok/s")
+        decode_threads = max(runs, key=lambda r: r["decode_tok_s"])["n_threads"]
+        batch_threads = max(runs, key=lambda r: r["prefill_tok_s"])["n_threads"]
+        decode = max(r["decode_tok_s"] for r in runs)
+        best_batch, prefill = max(BATCH_SIZES), max(r["prefill_tok_s"] for r in runs)
+        for n_batch in BATCH_SIZES[:-1]:
+            p, _ = _measure(path, decode_threads, batch_threads, n_batch, decode_tokens=2)
+            runs.append({"n_threads": batch_threads, "n_batch": n_batch, "prefill_tok_s": round(p, 1)})
+            print(f"  {path.name}: batch {n_batch:>5}  prefill {p:8.1f} tok/s")
+            if p > prefill:
+                best_batch, prefill = n_batch, p
+
+        answer_s = TYPICAL_PROMPT_TOKENS / prefill + TYPICAL_ANSWER_TOKENS / max(decode, 1e-6)
+        config = {
+            "model_filename": path.name,
+            "n_threads": decode_threads,
+            "n_threads_batch": batch_threads,
+            "n_batch": best_batch,
+            "use_mmap": True,
+            "use_mlock": _mlock_ok(path),
+            "prefill_tok_s": round(prefill, 1),
+            "decode_tok_s": round(decode, 2),
+            "typical_answer_s": round(answer_s, 2),
+        }
+        results.append({"model_filename": path.name, "runs": runs, "typical_answer_s": round(answer_s, 2)})
+        if best is None or answer_s < best["typical_answer_s"]:
+            best = config
+
+    if best is None:
+        raise RuntimeError("[bootstrap_model] No local model fits in available memory.")
+    quality_traded = best["model_filename"] != default
+    profile = dict(best, version=PROFILE_VERSION, host=host, n_ctx=n_ctx,
+                   default_model_filename=default, quality_traded=quality_traded,
+                   llama_cpp=getattr(llama_cpp, "__version__", "?"),
+                   calibrated_at=time.strftime("%Y-%m-%dT%H:%M:%S"), measured=results)
+    path = _profile_path(models_dir)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(profile, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+    print(f"[bootstrap_model] ✅ Chose {best['model_filename']}: ~{best['typical_answer_s']} s for a "
+          f"{TYPICAL_PROMPT_TOKENS}-token prompt and {TYPICAL_ANSWER_TOKENS}-token answer "
+          f"(prefill {best['prefill_tok_s']} tok/s, decode {best['decode_tok_s']} tok/s), "
+          f"n_threads={best['n_threads']} (decode), n_threads_batch={best['n_threads_batch']}, "
+          f"n_batch={best['n_batch']}, mlock={'on' if best['use_mlock'] else 'off'}.")
+    if quality_traded:
+        print(f"[bootstrap_model] ⚠️ {best['model_filename']} was chosen for speed over {default}, "
+              f"the quantization this host's memory allows: answer quality was traded away.")
+    print(f"[bootstrap_model] Profile saved to {path}")
+    return profile
+
+
 # Backwards-compat alias
 def bootstrap_model():
     return ensure_model()
 
 if __name__ == "__main__":
-    print(ensure_model())
+    if "--calibrate" in sys.argv:
+        calibrate(any_quantization="--any-quantization" in sys.argv)
+    else:
+        print(ensure_model())
@@ -1,40 +1,225 @@
 # chat_agent.py
 import re
 import os
+import threading
+import time
+from typing import NamedTuple
 os.environ["LLAMA_LOG_LEVEL"] = "40"  # Suppress llama.cpp logs
-from llama_cpp import Llama
 from rag_chain import BibleRAG
 from bible_loader import Bible
-from thefuzz import process
-from bootstrap_model import bootstrap_model
+from references import Reference
+from book_resolver import display_name
+from bootstrap_model import bootstrap_model, load_profile, physical_cores
+from answer_cache import AnswerCache, answer_stamp
+from direct_answers import DirectResponder
+from query_analyzer import QueryAnalyzer
+from prefix_cache import PrefixCache
+from llm_pool import LLMPool
+from session_store import SessionStore
+from speculative import draft_from_env
+from prompt_packer import PromptPacker, TokenCounter, prompt_budget
+from telemetry import Telemetry
+
+# Bump whenever _build_answer_prompt or the fallback prompt changes meaningfully;
+# it is part of the answer-cache key so old answers are never served.
+PROMPT_TEMPLATE_VERSION = 2
+
+# Session of the terminal (ask/ask_stream without one); it resumes across runs
+LOCAL_SESSION = "local"
+
+
+LLM_STOP = ["\nUser:", "\nQ:", "\nQuestion:", "Answer format:"]
+
+# Fixed preamble of every answer prompt. It must stay the first thing in the
+# prompt: its KV cache is evaluated once and reused (see prefix_cache.py).
+ANSWER_INSTRUCTIONS = (
+    "INSTRUCTIONS:\n"
+    "- You are a Bible study assistant.\n"
+    "- Use ONLY the Context passages below; do NOT quote or cite anything not present in Context.\n"
+    "- If Context is insufficient, say so briefly.\n"
+    "- Begin with a concise summary (2–4 sentences) that directly answers the question.\n"
+    "- You may weave in 1–3 direct Bible verse quotations naturally within the summary **only if they add clarity**.\n"
+    "- Avoid bullet points or separate verse lists unless absolutely necessary.\n"
+    "- Do NOT fabricate content or references.\n"
+    "- Do NOT include a line that starts with 'Supporting verses:'.\n\n"
+)
+
+
+_CITATION = re.compile(r"\b\d+:\d+\b")
+_CITATION_START = re.compile(r"\b\d+:\d$")
+_CITATION_PREFIX = re.compile(r"\b\d+:?$")   # digits that may still become Chap:Verse
+_QUOTES = ('"', "“", "”")
+
+
+def _quotes_unbalanced(line: str) -> bool:
+    return (line.count('"') % 2) == 1 or line.count("“") != line.count("”")
+
+
+class StreamTidier:
+    """Tidies answer text as it streams; BibleChatAgent._tidy_answer runs the
+    same pass over a whole answer, so both paths give identical text.
+
+    An answer cut off inside a quotation that cites Chap:Verse ends with a
+    broken verse line; that unfinished part is dropped. Text is released as
+    it arrives, except from the first quote or Chap:Verse of the current
+    line on: that tail is held until the line ends, and dropped if the answer
+    ends while the line still has an unclosed quote and a citation. Digits
+    that may begin a Chap:Verse wait for the next character. Trailing
+    whitespace is never emitted.
+    """
+
+    def __init__(self):
+        self.started = False   # leading whitespace is stripped
+        self.line = ""         # full text of the current line
+        self.buf = ""          # text not yet released (whitespace gap first)
+        self.holding = False   # buf holds the line from a quote or citation on
+        self.ended = False     # the held line has ended with a newline
+
+    @staticmethod
+    def _droppable(line: str) -> bool:
+        return _quotes_unbalanced(line) and _CITATION.search(line) is not None
+
+    def _release(self, out, keep: int = 0):
+        """Emit buf except its last keep characters and trailing whitespace."""
+        head, tail = self.buf[:len(self.buf) - keep], self.buf[len(self.buf) - keep:]
+        text = head.rstrip()
+        if text:
+            out.append(text)
+        self.buf = head[len(text):] + tail
+
+    def feed(self, text: str) -> str:
+        out = []
+        for ch in text:
+            if not self.started:
+                if ch.isspace():
+                    continue
+                self.started = True
+            if self.ended and not ch.isspace():
+                # another line started, so the held one was not the last line
+                self._release(out)
+                self.holding = self.ended = False
+            self.buf += ch
+            if ch == "\n":
+                if self.holding and self._droppable(self.line):
+                    self.ended = True
+                else:
+                    self._release(out)
+                    self.holding = False
+                self.line = ""
+                continue
+            self.line += ch
+            if self.holding:
+                continue
+            if ch in _QUOTES:
+                self.holding = True
+                self._release(out, keep=1)
+            elif _CITATION_START.search(self.line):
+                self.holding = True   # the citation's digits are still in buf
+            else:
+                prefix = _CITATION_PREFIX.search(self.line)
+                self._release(out, keep=len(prefix.group()) if prefix else 0)
+        return "".join(out)
+
+    def finish(self) -> str:
+        buf, self.buf = self.buf, ""
+        if self.holding and (self.ended or self._droppable(self.line)):
+            return ""
+        return buf.rstrip()
+
+
+class TurnPlan(NamedTuple):
+    """What answering one question takes, decided before any LLM call."""
+    question: str
+    category: str
+    prompt: str = None   # LLM prompt, or None when text is the whole answer
+    text: str = ""       # answer that needs no LLM (casual reply, cached answer)
+    tail: str = ""       # fixed text appended after the answer
+    cache: tuple = None  # (question vector, refs) to store the LLM answer under
+    prompt_tokens: int = 0
+    trace: object = None # telemetry Trace of this turn, closed by generate()
+    session: str = None  # conversation id; keeps its turns on one LLM worker
+    refs: tuple = ()     # references the turn is grounded in, for its history entry
+
+    @property
+    def needs_llm(self) -> bool:
+        return self.prompt is not None
+
+
+class _Stage:
+    """One component of the agent that is loaded on first use, or earlier by
+    the warm-up thread. Callers block only while that component loads; a
+    failed load is retried by the next caller."""
+
+    def __init__(self, name, load, timings):
+        self.name = name
+        self._load = load
+        self._timings = timings
+        self._lock = threading.Lock()
+        self._value = None
+        self.ready = False
+
+    def get(self):
+        if not self.ready:
+            with self._lock:
+                if not self.ready:
+                    t0 = time.perf_counter()
+                    self._value = self._load()
+                    self._timings[self.name] = time.perf_counter() - t0
+                    self.ready = True
+        return self._value
 
 
 class BibleChatAgent:
-    def __init__(self, bible_data_path):
-        self.chat_history = []
-        self.rag = BibleRAG(bible_data_path)
+    # Background warm-up order: retrieval first, the LLM last
+    WARM_UP = ("index", "embeddings", "answer_cache", "llm")
+
+    def __init__(self, bible_data_path, warm_up=None):
+        """Only the verse corpus and reference parser load here; the vector
+        store, embedding model and LLM are stages loaded by a background
+        warm-up thread (WARMUP=0 disables it) or on first use."""
+        self.timings = {}
+        # Stage spans, token counts and cache hit rates (TELEMETRY=0 disables)
+        self.telemetry = Telemetry()
+
+        t0 = time.perf_counter()
         self.bible = Bible(bible_data_path)
-
-        self.rag.load_or_build_vectorstore()
-
-        # Pick model file (small/large) and ensure it exists locally
-        model_path = bootstrap_model()
-
-        # Basic, portable params (no psutil required)
-        cores = os.cpu_count() or 4
-        n_ctx = int(os.getenv("N_CTX", "4096"))
-        n_batch = int(os.getenv("N_BATCH", "1024"))
-
-        print(f"⏳ Loading local LLM from: {model_path}")
-        self.llm = Llama(
-            model_path=model_path,
-            n_ctx=n_ctx,
-            n_threads=cores,
-            n_batch=n_batch,
-            verbose=False,
-            chat_format=None
+        self.direct = DirectResponder(self.bible)
+        self.timings["corpus"] = time.perf_counter() - t0
+        self.rag = BibleRAG(bible_data_path, telemetry=self.telemetry)
+
+        self.sampling = {
+            "max_tokens": int(os.getenv("MAX_TOKENS", "500")),
+            "temperature": 0.33,
+            "top_p": 0.9,
+            "top_k": 40,
+            "repeat_penalty": 1.2,
+        }
+        self.prefix_cache = None
+        self.draft = None
+        # LLM_WORKERS > 1 generates in that many worker processes (llm_pool.py)
+        self.llm_workers = max(1, int(os.getenv("LLM_WORKERS", "1")))
+        self.pool = None
+        # Retrieved passages and history are packed into N_CTX - MAX_TOKENS
+        self.tokens = TokenCounter()
+        self.packer = PromptPacker(self.bible.corpus, self.tokens, prompt_budget(self.sampling["max_tokens"]))
+        # Compact per-session turns, persisted; prompts take HISTORY_TOKENS of them
+        self.sessions = SessionStore(
+            lambda text: self.tokens.count(text, cache=False),
+            path=os.getenv("SESSION_STORE_PATH", ".sessions.sqlite") or None,
+            max_turns=int(os.getenv("SESSION_TURNS", "10")),
+            max_sessions=int(os.getenv("SESSION_LIMIT", "1000")),
+            max_bytes=int(os.getenv("SESSION_BYTES", str(4 * 1024 * 1024))),
         )
-        print("✅ LLM loaded.")
+        self.history_tokens = int(os.getenv("HISTORY_TOKENS", "384"))
+        self._stages = {
+            "index": _Stage("index", self.rag.ensure_vectorstore, self.timings),
+            "embeddings": _Stage("embeddings", lambda: self.rag.embedding.model, self.timings),
+            # Pick model file (small/large) and ensure it exists locally
+            "model_file": _Stage("model_file", bootstrap_model, self.timings),
+            "answer_cache": _Stage("answer_cache", self._load_answer_cache, self.timings),
+            "llm": _Stage("llm", self._load_llm, self.timings),
+        }
+
         # Expanded casual responses
         self.casual_responses = {
             "hello": "Hey there! Ready to dive into the Word?",
@@ -53,18 +238,129 @@ class BibleChatAgent:
 
         # Keys used for greeting fuzzy-match
         self.greeting_keys = list(self.casual_responses.keys())
+        # One compiled pass per question: category, references, hints, keywords
+        self.analyzer = QueryAnalyzer(self.bible, self.direct, self.casual_responses)
+
+        self.timings["init"] = time.perf_counter() - t0
+
+        if warm_up is None:
+            warm_up = os.getenv("WARMUP", "1") != "0"
+        if warm_up:
+            threading.Thread(target=self._warm_up, name="warm-up", daemon=True).start()
+
+    def _warm_up(self):
+        for name in self.WARM_UP:
+            try:
+                self._stages[name].get()
+            except Exception as e:
+                print(f"⚠️ Warm-up of {name} failed ({e}); it will be retried on first use.")
+                return
+        print(f"\n⏱ Warm-up done: {self.format_timings(self.WARM_UP + ('model_file',))}")
+
+    def format_timings(self, names=None):
+        names = names or list(self.timings)
+        return ", ".join(f"{n} {self.timings[n] * 1000:.0f} ms" for n in names if n in self.timings)
+
+    @property
+    def llm(self):
+        return self._stages["llm"].get()
+
+    @property
+    def answer_cache(self):
+        return self._stages["answer_cache"].get()
+
+    def _load_answer_cache(self):
+        # Near-duplicate questions over the same references reuse a prior answer
+        return AnswerCache(
+            answer_stamp(self._stages["model_file"].get(), PROMPT_TEMPLATE_VERSION, self.sampling),
+            path=os.getenv("ANSWER_CACHE_PATH", ".answer_cache.sqlite") or None,
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.getenv("ANSWER_CACHE_ENTRIES", "2000")),
+            max_bytes=int(os.getenv("ANSWER_CACHE_BYTES", str(8 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+        )
+
+    def _load_llm(self):
+        from llama_cpp import Llama
+
+        model_path = self._stages["model_file"].get()
+
+        # This host's calibrated profile (python bootstrap_model.py --calibrate);
+        # without one, a thread per physical core. Env vars override both.
+        profile = load_profile() or {}
+        if profile.get("model_filename") != os.path.basename(model_path):
+            profile = {}
+        cores = physical_cores()
+        n_ctx = int(os.getenv("N_CTX", "4096"))
+        n_threads = int(os.getenv("N_THREADS", profile.get("n_threads", cores)))
+        n_threads_batch = int(os.getenv("N_THREADS_BATCH", profile.get("n_threads_batch", n_threads)))
+        n_batch = int(os.getenv("N_BATCH", profile.get("n_batch", 1024)))
+        use_mlock = os.getenv("USE_MLOCK", "1" if profile.get("use_mlock") else "0") == "1"
+
+        if self.llm_workers > 1:
+            return self._load_pool(model_path, n_ctx, cores, n_batch, use_mlock)
+
+        # Optional prompt-lookup drafting (SPECULATIVE=prompt_lookup)
+        self.draft = draft_from_env()
+
+        print(f"⏳ Loading local LLM from: {model_path}")
+        print(f"⚙️ {'Calibrated profile' if profile else 'Default runtime'}: n_threads={n_threads}, "
+              f"n_threads_batch={n_threads_batch}, n_batch={n_batch}, mlock={'on' if use_mlock else 'off'}")
+        llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_threads_batch=n_threads_batch,
+            n_batch=n_batch,
+            use_mmap=True,
+            use_mlock=use_mlock,
+            draft_model=self.draft,
+            verbose=False,
+            chat_format=None
+        )
+        print("✅ LLM loaded.")
+        self.tokens.bind(llm)
+
+        # Evaluate (or restore from disk) the answer preamble's KV state once
+        if os.getenv("PREFIX_CACHE", "1") != "0":
+            try:
+                self.prefix_cache = PrefixCache(llm, ANSWER_INSTRUCTIONS, model_path, n_ctx)
+                self.prefix_cache.warm()
+            except Exception as e:
+                print(f"⚠️ Prompt preamble cache disabled ({e}).")
+                self.prefix_cache = None
+        return llm
+
+    def _load_pool(self, model_path, n_ctx, cores, n_batch, use_mlock):
+        from llama_cpp import Llama
+
+        # Workers split the cores; each maps the same GGUF, so only their KV
+        # caches add memory. Drafting and the preamble cache live in the workers.
+        n_threads = int(os.getenv("LLM_WORKER_THREADS", max(1, cores // self.llm_workers)))
+        print(f"⏳ Starting {self.llm_workers} LLM workers on: {model_path}")
+        print(f"⚙️ Worker pool: {self.llm_workers} x n_threads={n_threads}, n_batch={n_batch}, "
+              f"mlock={'on' if use_mlock else 'off'}")
+        self.pool = LLMPool(
+            model_path,
+            workers=self.llm_workers,
+            threads=n_threads,
+            n_ctx=n_ctx,
+            n_batch=n_batch,
+            sampling=self.sampling,
+            stop=LLM_STOP,
+            prefix=ANSWER_INSTRUCTIONS if os.getenv("PREFIX_CACHE", "1") != "0" else None,
+            use_mlock=use_mlock,
+        )
+        print(f"✅ LLM workers ready (pids {', '.join(str(w['pid']) for w in self.pool.stats())}).")
+        # The parent only tokenizes (token budgets, counters)
+        llm = Llama(model_path=model_path, vocab_only=True, verbose=False)
+        self.tokens.bind(llm)
+        return llm
+
     def _build_answer_prompt(self, context: str, question: str, allowed_refs: list[str]) -> str:
         allowed = "; ".join(allowed_refs)
         return (
-            "INSTRUCTIONS:\n"
-            "- You are a Bible study assistant.\n"
-            "- Use ONLY the Context passages below; do NOT quote or cite anything not present in Context.\n"
-            "- If Context is insufficient, say so briefly.\n"
-            "- Begin with a concise summary (2–4 sentences) that directly answers the question.\n"
-            "- You may weave in 1–3 direct Bible verse quotations naturally within the summary **only if they add clarity**.\n"
-            "- Avoid bullet points or separate verse lists unless absolutely necessary.\n"
-            "- Do NOT fabricate content or references.\n"
-            "- Do NOT include a line that starts with 'Supporting verses:'.\n\n"
+            ANSWER_INSTRUCTIONS +
             f"Allowed references (must ONLY cite from this set): {allowed}\n\n"
             f"Context passages:\n{context}\n\n"
             f"Question:\n{question}\n\n"
@@ -72,200 +368,309 @@ class BibleChatAgent:
         )
 
     def _extract_book_chapter(self, question: str):
-        """Return (book_lower, chapter_str_or_None) inferred from the question.
+        """Return (book_id, chapter_int_or_None) inferred from the question.
+        book_id is a corpus book id (e.g. "1john") or None.
         Special-case Nicodemus → John 3."""
-        q = question.lower()
-
-        # direct pattern like "john 3", "1 john 4", "romans 8"
-        m = re.search(r"\b([1-3]?\s?[a-z]+)\s+(\d{1,3})\b", q)
-        book = chapter = None
-        if m:
-            book = m.group(1).strip()          # e.g., "john" or "1 john"
-            chapter = m.group(2).strip()       # e.g., "3"
-
-        # phrases like "gospel of john", "book of john"
-        if not book and ("gospel of john" in q or "book of john" in q or "john's gospel" in q):
-            book = "john"
-
-        # Nicodemus almost always refers to John 3
-        if "nicodemus" in q and (book is None or book == "john"):
-            book = "john"
-            chapter = chapter or "3"
-
-        # normalize spacing for comparison (metadata likely lowercased file stems)
-        if book:
-            book = book.replace("  ", " ").strip().lower()
-
-        return book, chapter
-
-    def ask(self, question: str) -> str:
-        memory_context = "\n".join(
-            [f"Q: {q}\nA: {a}" for q, a in self.chat_history[-3:]]
-        ) if self.chat_history else ""
+        analysis = self.analyzer.analyze(question)
+        return analysis.book, analysis.chapter
+
+    def retrieval_scope(self, question: str) -> dict:
+        """query_docs scope arguments inferred from the question. The scope is
+        applied inside the search, so hits are always from that passage."""
+        analysis = self.analyzer.analyze(question)
+        return {"book": analysis.book, "chapter": analysis.chapter, "testament": analysis.testament}
+
+    def ask(self, question: str, session: str = LOCAL_SESSION) -> str:
+        return "".join(self.ask_stream(question, session))
+
+    def ask_stream(self, question: str, session: str = LOCAL_SESSION):
+        """Same as ask(), but yields the answer in pieces as the LLM produces
+        them. Closing the generator (e.g. on Ctrl-C) stops decoding; an
+        interrupted turn is not added to the session's history."""
+        plan = self.plan(question, session=session)
+        pieces = []
+        for piece in self.generate(plan):
+            pieces.append(piece)
+            yield piece
+        self.remember(session, plan, "".join(pieces))
+
+    def remember(self, session: str, plan: TurnPlan, answer: str):
+        """Store a finished turn in the session's compact history, with the
+        references its plan resolved (never ones parsed from generated text)."""
+        if not answer:
+            return
+        self.sessions.append(session, plan.question, answer, plan.refs[:5])
+
+    def plan(self, question: str, history=None, category=None, docs=None, session=None) -> TurnPlan:
+        """Everything before the LLM: classification, retrieval and the
+        answer-cache lookup. The plan's prompt is None when no LLM is needed.
+
+        category and docs may be passed in when already computed (batch mode);
+        an empty docs list still falls back to an unscoped search. session
+        selects the stored history (unless history, a list of Turns, is
+        given) and routes the generation to that conversation's LLM worker.
+        """
+        if history is None:
+            history = self.sessions.recent(session, self.history_tokens) if session else []
+        trace = self.telemetry.trace()
+        with trace, self.telemetry.span("plan"):
+            plan = self._plan(question, history, category, docs)
+        return plan._replace(trace=trace, session=session)
+
+    def _plan(self, question, history, category, docs):
+        history = list(history)
         question = question.strip()
 
-        category = self.classify_question(question)
+        span = self.telemetry.span
+        with span("analyze"):
+            analysis = self.analyzer.analyze(question)
+        category = category or analysis.category
 
-        # 1. Verse lookup
+        # 1. Verse lookups, counts and outlines: straight from the corpus
+        cited = tuple(dict.fromkeys(ref.label() for ref in analysis.references))
         if category == "verse_lookup":
-            answer = self.handle_verse_reference(question, memory_context)
-
-        # 2. Bible question
-        elif category == "bible_question":
+            return TurnPlan(question, category, text=self.handle_verse_reference(
+                question, refs=analysis.references), refs=cited)
+        if category == "structure":
+            return TurnPlan(question, category, text=self.direct.structured_answer(question))
+
+        # 2. Explaining a passage: the LLM, grounded in the referenced verses
+        if category == "verse_explain":
+            with span("pack"):
+                prompt = self._verse_reference_prompt(question, history, refs=analysis.references)
+            if prompt:
+                return TurnPlan(question, category, prompt=prompt, refs=cited,
+                                prompt_tokens=self.tokens.count(prompt, cache=False))
+            return TurnPlan(question, category, text=self.handle_verse_reference(
+                question, refs=analysis.references), refs=cited)
+
+        # 3. Bible question
+        if category == "bible_question":
+            scope = {"book": analysis.book, "chapter": analysis.chapter, "testament": analysis.testament}
             try:
-                docs = self.rag.query_docs(question, k=10)
+                with span("retrieve"):
+                    if docs is None:
+                        docs = self.rag.query_docs(question, k=5, **scope)
+                    if not docs and any(scope.values()):
+                        # e.g. a chapter number the book doesn't have
+                        docs = self.rag.query_docs(question, k=5)
             except Exception:
                 docs = []
 
-            # Try to infer a target book/chapter from the question
-            book_hint, chap_hint = self._extract_book_chapter(question)
-
-            # Narrow by book / chapter if we found a hint
-            if docs and (book_hint or chap_hint):
-                filtered = []
-                for d in docs:
-                    meta = d.metadata or {}
-                    mb = str(meta.get("book", "")).replace("_", " ").strip().lower()
-                    mc = str(meta.get("chapter", "")).strip().lower()
-                    keep = True
-                    if book_hint and mb != book_hint:
-                        keep = False
-                    if chap_hint and mc != chap_hint:
-                        keep = False
-                    if keep:
-                        filtered.append(d)
-                docs = filtered[:5] if filtered else docs[:5]
-
             # If we have passages, format them with refs; else provide fallback
             if docs:
-                # Build the formatted context and the list of allowed references
-                ctx_lines = []
-                allowed_refs = []
-                for d in docs:
-                    m = d.metadata or {}
-                    book = (m.get('book','') or '').strip()
-                    chap = str(m.get('chapter','?'))
-                    verse = str(m.get('verse','?'))
-                    ref = f"{book} {chap}:{verse}".strip()
-                    allowed_refs.append(ref)
-                    ctx_lines.append(f"{ref} — {d.page_content}")
-
-                context = "\n".join(ctx_lines)
-                prompt = self._build_answer_prompt(context, question, allowed_refs)
-                answer = self.run_llm(prompt)
-
-            else:
-                context = "No directly relevant passages were found in the index for this query."
-                prompt = (
-                    "INSTRUCTIONS:\n"
-                    "- You are a Bible study assistant.\n"
-                    "- No specific passages were retrieved; answer from general biblical teaching in 2–3 sentences.\n"
-                    "- If appropriate, you may reference well-known verses by book name (e.g., John 3:16) without quoting.\n"
-                    "- Do NOT invent tasks, math problems, hypotheticals, or numbered lists.\n\n"
-                    f"Context:\n{context}\n\n"
-                    f"Question:\n{question}\n\n"
-                    "Answer:"
+                # Fragments and neighbours merge into whole-verse passages, and
+                # only as many as fit the token budget go into the prompt
+                with span("pack"):
+                    packed = self.packer.pack(
+                        self._build_answer_prompt("", question, []), self.packer.passages(docs))
+                return self._plan_with_cache(
+                    question, category, packed.refs,
+                    lambda: self._build_answer_prompt(packed.context, question, packed.refs),
                 )
-                answer = self.run_llm(prompt)
-                answer += "\n\nNote: No specific passages were retrieved for this question; response is based on general biblical teaching."
-
-        # 3. Casual chat (fallback)
-        else:
-            matches = process.extract(question.lower(), self.casual_responses.keys(), limit=3)
-            if matches and matches[0][1] > 75:
-                answer = self.casual_responses[matches[0][0]]
+
+            context = "No directly relevant passages were found in the index for this query."
+            return self._plan_with_cache(question, category, [], lambda: (
+                "INSTRUCTIONS:\n"
+                "- You are a Bible study assistant.\n"
+                "- No specific passages were retrieved; answer from general biblical teaching in 2–3 sentences.\n"
+                "- If appropriate, you may reference well-known verses by book name (e.g., John 3:16) without quoting.\n"
+                "- Do NOT invent tasks, math problems, hypotheticals, or numbered lists.\n\n"
+                f"Context:\n{context}\n\n"
+                f"Question:\n{question}\n\n"
+                "Answer:"
+            ), tail="\n\nNote: No specific passages were retrieved for this question; response is based on general biblical teaching.")
+
+        # 4. Casual chat (fallback)
+        if analysis.greeting is not None:
+            return TurnPlan(question, category, text=self.casual_responses[analysis.greeting])
+        return TurnPlan(question, category, text=(
+            "Hi there! I'm here to help with your Bible study. "
+            "You can ask about a verse, a topic, or just say hello."
+        ))
+
+    def _plan_with_cache(self, question, category, refs, build_prompt, tail=""):
+        """Reuse a semantically cached answer for the same references, or plan
+        an LLM call whose result generate() will remember."""
+        try:
+            qvec = self.rag.embed_question(question)
+        except Exception:
+            qvec = None
+        # Never wait for the model file just to consult the cache: until the
+        # stage is ready the answer is generated (and stored) instead
+        if qvec is not None and self._stages["answer_cache"].ready:
+            with self.telemetry.span("answer_cache"):
+                cached = self.answer_cache.lookup(qvec, refs)
+            if cached is not None:
+                self.telemetry.count("answer_cache.hit")
+                return TurnPlan(question, category, text=cached, tail=tail, refs=self._labels(refs))
+            self.telemetry.count("answer_cache.miss")
+        cache = (qvec, refs) if qvec is not None else None
+        prompt = build_prompt()
+        return TurnPlan(question, category, prompt=prompt, tail=tail, cache=cache, refs=self._labels(refs),
+                        prompt_tokens=self.tokens.count(prompt, cache=False))
+
+    @staticmethod
+    def _labels(refs):
+        """Display labels for packed passage refs ("1john 4:8" -> "1 John 4:8")."""
+        out = []
+        for ref in refs:
+            book, _, place = ref.rpartition(" ")
+            out.append(f"{display_name(book)} {place}" if book else ref)
+        return tuple(dict.fromkeys(out))
+
+    def generate(self, plan: TurnPlan, timing: dict = None):
+        """Yield the answer for a plan, streaming the LLM if it needs one.
+        timing, if given, receives "first": the perf_counter() time of the
+        first chunk llama.cpp generated."""
+        trace = plan.trace or self.telemetry.trace()
+        completed = False
+        try:
+            if plan.prompt is None:
+                if plan.text:
+                    yield plan.text
             else:
-                answer = (
-                    "Hi there! I'm here to help with your Bible study. "
-                    "You can ask about a verse, a topic, or just say hello."
-                )
+                pieces = []
+                timing = {} if timing is None else timing
+                t0 = time.perf_counter()
+                for piece in self.run_llm_stream(plan.prompt, trace, plan.session, timing):
+                    pieces.append(piece)
+                    yield piece
+                answer = "".join(pieces)
+                # Timed from the first raw chunk: the tidier may hold text back
+                first = timing.get("first", t0)
+                trace.record("prefill", first - t0)
+                trace.record("decode", time.perf_counter() - first)
+                trace.count("prompt_tokens", plan.prompt_tokens)
+                trace.count("completion_tokens", self.tokens.count(answer, cache=False))
+                if plan.cache is not None and answer:
+                    self.answer_cache.store(plan.cache[0], plan.cache[1], answer)
+            if plan.tail:
+                yield plan.tail
+            completed = True
+        finally:
+            trace.finish(question=plan.question, category=plan.category,
+                         llm=plan.needs_llm, completed=completed)
 
-        self.chat_history.append((question, answer))
+    def classify_question(self, question: str) -> str:
+        """verse_lookup | verse_explain | structure | casual_chat | bible_question"""
+        return self.analyzer.analyze(question.strip()).category
+
+    def _verse_reference_prompt(self, question, history=(), refs=None):
+        # Whole reference lists: "John 3:16-4:2; Rom 8:28, 31-39", "Psalm 23", "Matthew 5:3-"
+        found = self.bible.lookup(question) if refs is None else self.bible.resolve_all(refs)
+        if not found:
+            return None
+        fixed = f"Context:\n\n\n\nQuestion: {question}\nAnswer:"
+        # Cross-references from the neighbor graph fill what budget is left
+        packed = self.packer.pack(fixed, self.packer.spans(found + self._related(found)), history,
+                                  max_verses=int(os.getenv("MAX_LOOKUP_VERSES", "40")))
+        if not packed.refs:
+            return None
+        return f"Context:\n{packed.history}\n{packed.context}\n\nQuestion: {question}\nAnswer:"
+
+    def handle_verse_reference(self, question, refs=None):
+        """The referenced verses, verbatim; no LLM round trip."""
+        answer = self.direct.passage_answer(question, refs)
+        if not answer:
+            return "I'm sorry, I couldn't understand the verse reference."
+        found = self.bible.lookup(question) if refs is None else self.bible.resolve_all(refs)
+        related = self._related(found)
+        if related:
+            answer += "\n\nSee also: " + "; ".join(ref.label() for ref, _ in related)
         return answer
 
-    def classify_question(self, question: str) -> str:
-        q = question.strip().lower()
-        wc = len(q.split())
-
-        # 1) Verse reference pattern: e.g., "john 3:16" or "1 john 4:8-10"
-        if re.search(r"\b[1-3]?\s?[a-z]+(?:\s[a-z]+)?\s+\d+:\d+(?:[-–]\d+)?\b", q):
-            return "verse_lookup"
-
-        # 2) Greetings via fuzzy match (ONLY for short inputs)
-        if wc <= 4 or len(q) <= 25:
-            match = process.extractOne(q, self.greeting_keys)
-            if match and match[1] >= 90:  # stricter threshold
-                return "casual_chat"
-
-        # 3) Heuristics for bible-themed questions
-        bible_terms = [
-            "bible","scripture","verse","passage","god","jesus","holy spirit","paul","john",
-            "gospel","commandment","sin","grace","salvation","love","faith","hope","spirit",
-            "pray","prayer","wisdom","proverb","psalm","law","covenant","testament","nicodemus"
-        ]
-        questiony_phrases = [
-            "what does","what do","what is","teach","say about","meaning of","where does","how does",
-            "tell me about","explain","describe"
-        ]
-        if any(p in q for p in questiony_phrases) or any(t in q for t in bible_terms):
-            return "bible_question"
-
-        # 4) Safe default: treat as bible_question rather than casual
-        return "bible_question"
-
-    def handle_verse_reference(self, question, memory_context):
-        ref = re.search(r'([1-3]?\s?[A-Za-z ]+?)\s+(\d+):(\d+)(?:[-–](\d+))?', question)
-        if ref:
-            book = ref.group(1).strip()
-            chapter = int(ref.group(2))
-            start_verse = int(ref.group(3))
-            end_verse = int(ref.group(4)) if ref.group(4) else start_verse
-            verses = []
-            for v in range(start_verse, end_verse + 1):
-                text = self.bible.get_verse(book, chapter, v)
-                if "not found" not in text.lower():
-                    verses.append(f"{chapter}:{v} — {text}")
-            combined = "\n".join(verses)
-            prompt = f"Context:\n{memory_context}\n{combined}\n\nQuestion: {question}\nAnswer:"
-            return self.run_llm(prompt)
-        return "I'm sorry, I couldn't understand the verse reference."
+    def _related(self, found):
+        """[(Reference, span)] of passages related to Bible.lookup() results,
+        from the precomputed neighbor graph (python neighbors.py); one array
+        lookup, no embedding. RELATED_VERSES=0 disables."""
+        k = int(os.getenv("RELATED_VERSES", "3"))
+        if k <= 0 or not found:
+            return []
+        chosen = []
+        for _, (start, end) in found:
+            chosen.extend(p for p, _ in self.rag.related_passages(start, end, k) if p not in chosen)
+        corpus, passages = self.bible.corpus, self.rag.passages
+        related = []
+        for p in chosen[:k]:
+            start, end = passages.span(p)
+            book, chapter, verse = corpus.locate(start)
+            related.append((Reference(book, chapter, verse, chapter, corpus.verse_number(end - 1)), (start, end)))
+        return related
 
     def _tidy_answer(self, text: str) -> str:
-        """
-        If the last line appears to have an unclosed double-quote, drop it.
-        Safer than the previous regex which could remove valid lines.
-        """
-        lines = text.rstrip().splitlines()
-        if not lines:
-            return text
-
-        last = lines[-1].strip()
-
-        # Count ASCII double-quotes and check curly pair balance
-        ascii_unbalanced = (last.count('"') % 2) == 1
-        curly_unbalanced = last.count("“") != last.count("”")
-
-        if ascii_unbalanced or curly_unbalanced:
-            # Only drop if it actually looks like a verse line (has Chap:Verse)
-            if re.search(r"\b\d+:\d+\b", last):
-                lines = lines[:-1]
-
-        return "\n".join(lines).rstrip()
-
-
-    def run_llm(self, prompt):
-        out = self.llm(
+        """Drop an unfinished quoted verse at the end of an answer (see
+        StreamTidier, which run_llm_stream applies incrementally)."""
+        tidy = StreamTidier()
+        return (tidy.feed(text) + tidy.finish()).strip()
+
+
+    def _prime(self, prompt):
+        # Restore the preamble state if another prompt displaced it, so
+        # llama.cpp's prefix match only has to prefill the request tail
+        if self.prefix_cache is not None:
+            self.prefix_cache.prime(prompt)
+
+    def _count_draft(self, proposed, accepted, trace=None):
+        """Record how many drafted tokens one generation proposed and kept."""
+        counter = trace or self.telemetry
+        counter.count("speculative.hit", accepted)
+        counter.count("speculative.miss", proposed - accepted)
+
+    def _complete(self, prompt, trace=None, session=None):
+        """Yield raw generated text, from the local Llama or a pool worker."""
+        llm = self.llm   # waits for the LLM stage if it is still loading
+        if self.pool is not None:
+            stats = {}
+            stream = self.pool.stream(prompt, session, stats)
+            try:
+                yield from stream
+            finally:
+                stream.close()
+                if stats.get("proposed") is not None:
+                    self._count_draft(stats["proposed"], stats["accepted"], trace)
+            return
+
+        self._prime(prompt)
+        before = (self.draft.proposed, self.draft.accepted) if self.draft is not None else None
+        stream = llm(
             prompt,
-            max_tokens=int(os.getenv("MAX_TOKENS", "500")),
-            temperature=0.33,
-            top_p=0.9,
-            top_k=40,
-            repeat_penalty=1.2,
-            stop=[
-                "\nUser:", "\nQ:", "\nQuestion:", "Answer format:"
-            ]
+            **self.sampling,
+            stop=LLM_STOP,
+            stream=True,
         )
-        text = out["choices"][0].get("text", "").strip()
+        try:
+            for chunk in stream:
+                text = chunk["choices"][0].get("text", "")
+                if text:
+                    yield text
+        finally:
+            # Stops decoding early when the consumer goes away (Ctrl-C)
+            stream.close()
+            if self.draft is not None:
+                self.draft.settle(llm.input_ids[:llm.n_tokens])
+                self._count_draft(self.draft.proposed - before[0], self.draft.accepted - before[1], trace)
+
+    def run_llm_stream(self, prompt, trace=None, session=None, timing: dict = None):
+        """Yield answer text as llama.cpp generates it, tidied incrementally.
+        timing, if given, receives "first" (see generate)."""
+        tidy = StreamTidier()
+        stream = self._complete(prompt, trace, session)
+        try:
+            for text in stream:
+                if timing is not None and "first" not in timing:
+                    timing["first"] = time.perf_counter()
+                piece = tidy.feed(text)
+                if piece:
+                    yield piece
+        finally:
+            stream.close()
+        piece = tidy.finish()
+        if piece:
+            yield piece
+
+    def run_llm(self, prompt, session=None):
+        text = "".join(self._complete(prompt, session=session)).strip()
         text = self._tidy_answer(text)
         return text
 
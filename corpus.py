@@ -0,0 +1,355 @@
+# corpus.py
+"""
+Compiled verse corpus.
+
+The JSON files in bible/bible_books are mostly layout markers; parsing all of
+them on every start is slow and both Bible and BibleRAG used to do it. This
+module compiles them once into a flat binary file that is memory-mapped at
+startup:
+
+    header | book names | book->chapter starts | chapter->verse starts
+           | text offsets | verse numbers | verse flags | UTF-8 text buffer
+
+Verse fragments ("paragraph text" / "line text" records sharing a chapter and
+verse) are merged in source order. A verse is flagged FLAG_PARAGRAPH when a
+paragraph or stanza of the source layout starts with it. Arrays use native
+byte order; the file is a local cache and is rebuilt whenever the source
+files change.
+"""
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+MAGIC = b"BBVC"
+FORMAT_VERSION = 2
+TEXT_TYPES = ("paragraph text", "line text")
+START_TYPES = ("paragraph start", "stanza start")
+FLAG_PARAGRAPH = 1
+CORPUS_FILENAME = "verse_corpus.bin"
+
+# magic, version, n_books, n_chapters, n_verses, text_len, names_len, fingerprint
+_HEADER = struct.Struct("<4sHHIIII32s")
+
+# Canonical (Protestant) order of the file stems in bible/bible_books.
+BOOK_ORDER = [
+    "genesis", "exodus", "leviticus", "numbers", "deuteronomy", "joshua",
+    "judges", "ruth", "1samuel", "2samuel", "1kings", "2kings",
+    "1chronicles", "2chronicles", "ezra", "nehemiah", "esther", "job",
+    "psalms", "proverbs", "ecclesiastes", "songofsolomon", "isaiah",
+    "jeremiah", "lamentations", "ezekiel", "daniel", "hosea", "joel", "amos",
+    "obadiah", "jonah", "micah", "nahum", "habakkuk", "zephaniah", "haggai",
+    "zechariah", "malachi",
+    "matthew", "mark", "luke", "john", "acts", "romans", "1corinthians",
+    "2corinthians", "galatians", "ephesians", "philippians", "colossians",
+    "1thessalonians", "2thessalonians", "1timothy", "2timothy", "titus",
+    "philemon", "hebrews", "james", "1peter", "2peter", "1john", "2john",
+    "3john", "jude", "revelation",
+]
+TESTAMENTS = {"old": BOOK_ORDER[:39], "new": BOOK_ORDER[39:]}
+
+_CORPORA = {}
+
+
+def _source_files(data_path: Path):
+    files = {f.stem.lower(): f for f in Path(data_path).glob("*.json")}
+    ordered = [b for b in BOOK_ORDER if b in files]
+    ordered += sorted(b for b in files if b not in BOOK_ORDER)
+    return [(b, files[b]) for b in ordered]
+
+
+def source_fingerprint(data_path) -> bytes:
+    """Cheap staleness signature: name, size and mtime of every source file."""
+    h = hashlib.sha256()
+    for book, f in _source_files(Path(data_path)):
+        st = f.stat()
+        h.update(f"{book}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.digest()
+
+
+def _align(n: int, to: int = 4) -> int:
+    return (n + to - 1) // to * to
+
+
+def _read_book(path: Path):
+    """Return ({chapter: {verse: text}}, {(chapter, verse), ...} paragraph
+    starts) with fragments merged in source order."""
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    fragments = {}
+    starts = set()
+    pending = False
+    for r in records:
+        if r.get("type") in START_TYPES:
+            pending = True
+            continue
+        if r.get("type") not in TEXT_TYPES:
+            continue
+        value = r.get("value", "")
+        if not value.strip():
+            continue
+        key = (int(r["chapterNumber"]), int(r["verseNumber"]))
+        if pending:
+            # A paragraph opening mid-verse belongs to the next whole verse
+            if key not in fragments:
+                starts.add(key)
+                pending = False
+        fragments.setdefault(key, []).append(value)
+
+    chapters = {}
+    for (chapter, verse), parts in fragments.items():
+        text = " ".join(" ".join(parts).split())
+        chapters.setdefault(chapter, {})[verse] = text
+    return chapters, starts
+
+
+def compile_corpus(data_path, corpus_path) -> Path:
+    """Parse the JSON books once and write the binary corpus (atomically)."""
+    data_path = Path(data_path)
+    corpus_path = Path(corpus_path)
+    fingerprint = source_fingerprint(data_path)
+
+    books = []
+    book_chapter_start = array("I", [0])
+    chapter_verse_start = array("I", [0])
+    text_offsets = array("I", [0])
+    verse_numbers = array("H")
+    flags = bytearray()
+    text = bytearray()
+
+    for book, path in _source_files(data_path):
+        chapters, starts = _read_book(path)
+        books.append(book)
+        last = max(chapters) if chapters else 0
+        # chapters are stored densely 1..last so chapter lookup is an index
+        for chapter in range(1, last + 1):
+            verses = chapters.get(chapter, {})
+            for verse in sorted(verses):
+                text += verses[verse].encode("utf-8")
+                text_offsets.append(len(text))
+                verse_numbers.append(verse)
+                flags.append(FLAG_PARAGRAPH if (chapter, verse) in starts else 0)
+            chapter_verse_start.append(len(verse_numbers))
+        book_chapter_start.append(len(chapter_verse_start) - 1)
+
+    names = "\n".join(books).encode("utf-8")
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(books), len(chapter_verse_start) - 1,
+        len(verse_numbers), len(text), len(names), fingerprint,
+    )
+
+    corpus_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = corpus_path.with_suffix(corpus_path.suffix + ".tmp")
+    with open(tmp, "wb") as out:
+        out.write(header)
+        out.write(names)
+        out.write(b"\0" * (_align(out.tell()) - out.tell()))
+        # 4-byte arrays first, then 2-byte, then 1-byte, so every section stays aligned
+        for arr in (book_chapter_start, chapter_verse_start, text_offsets, verse_numbers):
+            out.write(arr.tobytes())
+        out.write(flags)
+        out.write(b"\0" * (_align(out.tell()) - out.tell()))
+        out.write(text)
+    os.replace(tmp, corpus_path)
+
+    print(f"[corpus] Compiled {len(verse_numbers)} verses from {len(books)} books → {corpus_path}")
+    return corpus_path
+
+
+class VerseCorpus:
+    """Read-only, memory-mapped view of a compiled corpus.
+
+    Verses are addressed by a global index in canonical order; every chapter
+    is a contiguous [start, end) slice of that index space.
+    """
+
+    def __init__(self, corpus_path):
+        self.path = Path(corpus_path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+
+        (magic, version, n_books, n_chapters, n_verses,
+         text_len, names_len, fingerprint) = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus file: {self.path}")
+        self.fingerprint = fingerprint
+
+        pos = _HEADER.size
+        self.books = bytes(buf[pos:pos + names_len]).decode("utf-8").split("\n") if n_books else []
+        pos = _align(pos + names_len)
+
+        def take(fmt, count):
+            nonlocal pos
+            size = struct.calcsize(fmt) * count
+            view = buf[pos:pos + size].cast(fmt)
+            pos += size
+            return view
+
+        self._book_chapter_start = take("I", n_books + 1)
+        self._chapter_verse_start = take("I", n_chapters + 1)
+        self._text_offsets = take("I", n_verses + 1)
+        self._verse_numbers = take("H", n_verses)
+        self._flags = take("B", n_verses)
+        pos = _align(pos)
+        self._text = buf[pos:pos + text_len]
+
+        self._book_index = {b: i for i, b in enumerate(self.books)}
+
+    def __len__(self):
+        return len(self._verse_numbers)
+
+    # --- addressing -------------------------------------------------------
+    def book_index(self, book: str):
+        return self._book_index.get(book)
+
+    def chapter_count(self, book: str) -> int:
+        b = self._book_index.get(book)
+        if b is None:
+            return 0
+        return self._book_chapter_start[b + 1] - self._book_chapter_start[b]
+
+    def book_span(self, book: str):
+        """Return the [start, end) verse-index slice of a whole book, or None."""
+        b = self._book_index.get(book)
+        if b is None:
+            return None
+        first, last = self._book_chapter_start[b], self._book_chapter_start[b + 1]
+        return self._chapter_verse_start[first], self._chapter_verse_start[last]
+
+    def chapter_span(self, book: str, chapter: int):
+        """Return the [start, end) verse-index slice of a chapter, or None."""
+        b = self._book_index.get(book)
+        if b is None or chapter < 1 or chapter > self.chapter_count(book):
+            return None
+        c = self._book_chapter_start[b] + chapter - 1
+        return self._chapter_verse_start[c], self._chapter_verse_start[c + 1]
+
+    def verse_index(self, book: str, chapter: int, verse: int):
+        span = self.chapter_span(book, chapter)
+        if span is None:
+            return None
+        start, end = span
+        # verses are nearly always dense, so try the direct slot first
+        guess = start + verse - 1
+        if start <= guess < end and self._verse_numbers[guess] == verse:
+            return guess
+        i = bisect.bisect_left(self._verse_numbers, verse, start, end)
+        if i < end and self._verse_numbers[i] == verse:
+            return i
+        return None
+
+    def range_span(self, book: str, chapter: int, verse, end_chapter: int, end_verse):
+        """Return the [start, end) slice for chapter:verse through end_chapter:end_verse.
+
+        A verse of None means the edge of that chapter, so (3, None, 4, None)
+        is chapters 3-4 and (5, 3, 5, None) is "5:3-". Chapters are contiguous
+        in the index, so cross-chapter ranges are one slice found by two
+        bisects, whatever their length.
+        """
+        first = self.chapter_span(book, chapter)
+        if first is None:
+            return None
+        if end_chapter > self.chapter_count(book):
+            # Past the last chapter: run to the end of the book
+            end_chapter, end_verse = self.chapter_count(book), None
+        last = self.chapter_span(book, end_chapter) if end_chapter >= chapter else None
+        if last is None:
+            return None
+        vn = self._verse_numbers
+        start = first[0] if verse is None else bisect.bisect_left(vn, verse, first[0], first[1])
+        end = last[1] if end_verse is None else bisect.bisect_right(vn, end_verse, last[0], last[1])
+        return (start, end) if start < end else None
+
+    def locate(self, index: int):
+        """Return (book, chapter, verse) for a global verse index."""
+        c = bisect.bisect_right(self._chapter_verse_start, index) - 1
+        b = bisect.bisect_right(self._book_chapter_start, c) - 1
+        return self.books[b], c - self._book_chapter_start[b] + 1, self._verse_numbers[index]
+
+    # --- text -------------------------------------------------------------
+    def text(self, index: int) -> str:
+        a, b = self._text_offsets[index], self._text_offsets[index + 1]
+        return bytes(self._text[a:b]).decode("utf-8")
+
+    def verse_number(self, index: int) -> int:
+        return self._verse_numbers[index]
+
+    def is_paragraph_start(self, index: int) -> bool:
+        return bool(self._flags[index] & FLAG_PARAGRAPH)
+
+    def paragraph_starts(self, start: int, end: int):
+        """Indices in [start, end) that begin a paragraph or stanza; start
+        itself is always included so the result partitions the slice."""
+        if start >= end:
+            return []
+        return [start] + [i for i in range(start + 1, end) if self._flags[i] & FLAG_PARAGRAPH]
+
+    def get(self, book: str, chapter: int, verse: int):
+        i = self.verse_index(book, chapter, verse)
+        return None if i is None else self.text(i)
+
+    def iter_range(self, start: int, end: int):
+        """Yield (book, chapter, verse, text) for verse indices [start, end)."""
+        if start >= end:
+            return
+        book, chapter, _ = self.locate(start)
+        b = self._book_index[book]
+        c = self._book_chapter_start[b] + chapter - 1
+        for i in range(start, end):
+            while i >= self._chapter_verse_start[c + 1]:
+                c += 1
+                if c >= self._book_chapter_start[b + 1]:
+                    b += 1
+                    book = self.books[b]
+                chapter = c - self._book_chapter_start[b] + 1
+            yield book, chapter, self._verse_numbers[i], self.text(i)
+
+    def iter_verses(self):
+        """Yield (book, chapter, verse, text) for the whole corpus in order."""
+        for b, book in enumerate(self.books):
+            first = self._book_chapter_start[b]
+            for c in range(first, self._book_chapter_start[b + 1]):
+                for i in range(self._chapter_verse_start[c], self._chapter_verse_start[c + 1]):
+                    yield book, c - first + 1, self._verse_numbers[i], self.text(i)
+
+
+def load_corpus(data_path, corpus_path=None) -> VerseCorpus:
+    """Open the compiled corpus for data_path, (re)compiling it if stale.
+
+    Instances are cached per path so Bible and BibleRAG share one mapping.
+    """
+    data_path = Path(data_path)
+    corpus_path = Path(corpus_path) if corpus_path else data_path.parent / CORPUS_FILENAME
+    key = (str(data_path.resolve()), str(corpus_path.resolve()))
+    cached = _CORPORA.get(key)
+    fingerprint = source_fingerprint(data_path)
+    if cached is not None and cached.fingerprint == fingerprint:
+        return cached
+
+    corpus = None
+    if corpus_path.exists():
+        try:
+            corpus = VerseCorpus(corpus_path)
+        except (ValueError, struct.error, OSError):
+            corpus = None
+        if corpus is not None and corpus.fingerprint != fingerprint:
+            print("[corpus] Source files changed — recompiling verse corpus.")
+            corpus = None
+    if corpus is None:
+        compile_corpus(data_path, corpus_path)
+        corpus = VerseCorpus(corpus_path)
+
+    _CORPORA[key] = corpus
+    return corpus
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else "./bible/bible_books"
+    dst = sys.argv[2] if len(sys.argv) > 2 else Path(src).parent / CORPUS_FILENAME
+    compile_corpus(src, dst)
@@ -0,0 +1,176 @@
+# direct_answers.py
+"""
+Deterministic answers straight from the verse corpus, with no LLM involved:
+
+    John 3:16 / Rom 8:28-39; Psalm 23      the verse text, formatted
+    how many chapters are in Isaiah?       counts from the corpus index
+    how many verses does John 3 have?
+    outline of Romans 8 / Ruth outline     paragraph (stanza) outline
+
+Every answer is a dict lookup, a bisect or a slice of the memory-mapped
+corpus, so it takes well under a millisecond and quotes Scripture verbatim.
+"""
+import os
+import re
+
+from book_resolver import display_name
+from corpus import TESTAMENTS
+
+_BOOK = r"(?P<book>(?:[1-3]|i{1,3}|first|second|third)?\s*[a-z][a-z.' ]*?)"
+_CHAPTER = r"(?:\s*(?:chapter|ch\.?)?\s*(?P<chapter>\d{1,3}))?"
+_COUNT_RE = re.compile(
+    r"^how many (?P<what>chapters|verses) (?:are )?(?:there )?(?:in|does|do|has)\s+"
+    rf"(?:the )?(?:book of )?{_BOOK}{_CHAPTER}\s*(?:have|has|contain|there)?\s*[?.!]*$",
+    re.IGNORECASE,
+)
+_OUTLINE_RES = (
+    re.compile(
+        r"^(?:(?:give me|show me|show)\s+)?(?:an?\s+|the\s+)?(?:outline|overview|structure|paragraphs)"
+        rf"(?:\s+of|\s+for)?\s+(?:the )?(?:book of )?{_BOOK}{_CHAPTER}\s*[?.!]*$",
+        re.IGNORECASE,
+    ),
+    re.compile(rf"^{_BOOK}{_CHAPTER}\s+(?:outline|overview|structure|paragraphs)\s*[?.!]*$", re.IGNORECASE),
+)
+_WHOLE_BIBLE = {"bible", "the bible", "scripture", "scriptures"}
+_OPENING_WORDS = 10
+
+
+def _plural(n: int, word: str) -> str:
+    return f"{n} {word}" if n == 1 else f"{n} {word}s"
+
+
+class DirectResponder:
+    def __init__(self, bible, max_verses: int = None):
+        self.bible = bible
+        self.corpus = bible.corpus
+        self.max_verses = max_verses or int(os.getenv("MAX_RENDER_VERSES", "200"))
+
+    # --- passages -------------------------------------------------------------
+    def passage_answer(self, question: str, refs=None):
+        """The formatted text of every reference in question (or of refs, when
+        already parsed); a short explanation when a reference does not exist;
+        None if there is none."""
+        if refs is None:
+            refs = self.bible.references.parse(question)
+        found = self.bible.resolve_all(refs)
+        if found:
+            return self.render(found)
+        if not refs:
+            return None
+        ref = refs[0]
+        chapters = self.corpus.chapter_count(ref.book)
+        if ref.chapter > chapters:
+            return f"{display_name(ref.book)} has only {_plural(chapters, 'chapter')}."
+        return f"I couldn't find {ref.label()} in this translation."
+
+    def render(self, found):
+        """Format [(Reference, span)] from Bible.lookup as plain text."""
+        blocks = []
+        budget = self.max_verses
+        for n, (ref, (start, end)) in enumerate(found):
+            if budget <= 0:
+                rest = "; ".join(r.label() for r, _ in found[n:])
+                blocks.append(f"(Not shown, to keep this short: {rest}.)")
+                break
+            if end - start == 1:
+                blocks.append(f"{ref.label()} — {self.corpus.text(start)}")
+                budget -= 1
+                continue
+            shown = min(end, start + budget)
+            one_chapter = self.corpus.locate(start)[1] == self.corpus.locate(end - 1)[1]
+            lines = [ref.label()]
+            for chapter, verse, text in self.bible.passage((start, shown)):
+                lines.append(f"{verse} {text}" if one_chapter else f"{chapter}:{verse} {text}")
+            if shown < end:
+                lines.append(f"… {_plural(end - shown, 'more verse')} not shown; ask for a narrower range.")
+            budget -= shown - start
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    # --- counts and outlines ----------------------------------------------------
+    def _target(self, m):
+        """(books, display name, chapter or None) named by a regex match."""
+        name = " ".join(m.group("book").lower().split())
+        chapter = int(m.group("chapter")) if m.group("chapter") else None
+        if name in _WHOLE_BIBLE and chapter is None:
+            return list(self.corpus.books), "Bible", None
+        for testament, books in TESTAMENTS.items():
+            if name in (f"{testament} testament", f"the {testament} testament") and chapter is None:
+                return [b for b in books if b in self.corpus.books], f"{testament.title()} Testament", None
+        book = self.bible.resolve_book(name)
+        if book is None:
+            return None
+        return [book], display_name(book), chapter
+
+    def match_structured(self, question: str):
+        """Parse a count/outline question into (kind, books, name, chapter)."""
+        q = question.strip()
+        m = _COUNT_RE.match(q)
+        if m:
+            target = self._target(m)
+            if target is None or (m.group("what").lower() == "chapters" and target[2] is not None):
+                return None
+            return (m.group("what").lower(),) + target
+        for rx in _OUTLINE_RES:
+            m = rx.match(q)
+            if m:
+                target = self._target(m)
+                # Outlines are per book or chapter, never a whole testament
+                if target is None or len(target[0]) != 1:
+                    return None
+                return ("outline",) + target
+        return None
+
+    def structured_answer(self, question: str):
+        """Answer a count/outline question, or None if it is not one."""
+        intent = self.match_structured(question)
+        if intent is None:
+            return None
+        kind, books, name, chapter = intent
+        if chapter is not None:
+            chapters = self.corpus.chapter_count(books[0])
+            if chapter > chapters:
+                return f"{name} has only {_plural(chapters, 'chapter')}."
+        if kind == "outline":
+            return self.outline(books[0], chapter)
+        if kind == "chapters":
+            n = sum(self.corpus.chapter_count(b) for b in books)
+            if len(books) == 1:
+                return f"{name} has {_plural(n, 'chapter')}."
+            return f"The {name} has {_plural(n, 'chapter')} in {len(books)} books."
+        if chapter is not None:
+            start, end = self.corpus.chapter_span(books[0], chapter)
+            return f"{name} {chapter} has {_plural(end - start, 'verse')}."
+        n = sum(end - start for start, end in (self.corpus.book_span(b) for b in books))
+        if len(books) == 1:
+            chapters = self.corpus.chapter_count(books[0])
+            return f"{name} has {_plural(n, 'verse')} in {_plural(chapters, 'chapter')}."
+        return f"The {name} has {_plural(n, 'verse')} in {len(books)} books."
+
+    def _opening(self, index: int) -> str:
+        words = self.corpus.text(index).split()
+        opening = " ".join(words[:_OPENING_WORDS])
+        return opening + "…" if len(words) > _OPENING_WORDS else opening
+
+    def outline(self, book: str, chapter: int = None) -> str:
+        """Paragraph outline of a chapter, or a chapter-by-chapter outline of a book."""
+        name = display_name(book)
+        if chapter is None:
+            start, end = self.corpus.book_span(book)
+            chapters = self.corpus.chapter_count(book)
+            lines = [f"{name} — {_plural(chapters, 'chapter')}, {_plural(end - start, 'verse')}"]
+            for c in range(1, chapters + 1):
+                c_start, c_end = self.corpus.chapter_span(book, c)
+                if c_start < c_end:
+                    lines.append(f"{c} ({_plural(c_end - c_start, 'verse')}) {self._opening(c_start)}")
+            return "\n".join(lines)
+
+        start, end = self.corpus.chapter_span(book, chapter)
+        starts = self.corpus.paragraph_starts(start, end)
+        lines = [f"{name} {chapter} — {_plural(end - start, 'verse')}, {_plural(len(starts), 'section')}"]
+        for first, nxt in zip(starts, starts[1:] + [end]):
+            v1 = self.corpus.verse_number(first)
+            v2 = self.corpus.verse_number(nxt - 1)
+            verses = f"{chapter}:{v1}" if v1 == v2 else f"{chapter}:{v1}–{v2}"
+            lines.append(f"{verses} {self._opening(first)}")
+        return "\n".join(lines)
@@ -0,0 +1,315 @@
+# flat_index.py
+"""
+In-process exact vector index for the fixed verse corpus.
+
+One embedding matrix (float16, or int8 with a per-row scale) is stored as a
+memory-mapped .npy; chunk metadata lives in parallel arrays and chunk text in
+one UTF-8 buffer. Nothing is pickled, so opening the index is a handful of
+np.load(mmap_mode="r") calls. Search is an exact top-k: one blocked
+matrix-vector product followed by argpartition.
+
+Exposes similarity_search() returning langchain Documents with the same
+metadata ({"book", "chapter", "verse", "end_verse"}) the Chroma backend returns.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_FILENAME = "manifest.json"
+DTYPES = ("float16", "int8")
+_BLOCK_ROWS = 8192
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _quantize(vectors, dtype):
+    """Return (stored matrix, per-row scales or None)."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    q = np.rint(vectors / scales[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scales
+
+
+class FlatIndex:
+    def __init__(self, directory, embedding, dtype: str = "float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported flat index dtype: {dtype} (choose from {DTYPES})")
+        self.directory = Path(directory)
+        self.embedding = embedding
+        self.dtype = dtype
+        self.manifest = None
+        self.books = []
+
+    def __len__(self):
+        return 0 if self.manifest is None else len(self._verse)
+
+    # --- persistence ------------------------------------------------------
+    def _path(self, name):
+        return self.directory / name
+
+    def read_manifest(self):
+        try:
+            with open(self._path(MANIFEST_FILENAME), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self):
+        """Memory-map the stored arrays. Returns False if there is no index."""
+        manifest = self.read_manifest()
+        if manifest is None or not self._path("end_verse.npy").exists():
+            return False   # no index, or one from before passage chunking
+        load = lambda name: np.load(self._path(name), mmap_mode="r", allow_pickle=False)
+        self._matrix = load("embeddings.npy")
+        self._scales = load("scales.npy") if manifest.get("dtype") == "int8" else None
+        self._book = load("book.npy")
+        self._chapter = load("chapter.npy")
+        self._verse = load("verse.npy")
+        self._end_verse = load("end_verse.npy")
+        self._text_offsets = load("text_offsets.npy")
+        self._text = np.memmap(self._path("text.bin"), dtype=np.uint8, mode="r") \
+            if self._text_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.books = manifest["book_names"]
+        self._book_ids = {b: i for i, b in enumerate(self.books)}
+        # Rows are stored in canonical (book, chapter, verse) order, so this
+        # packed key is sorted and any book/chapter/verse filter is a
+        # contiguous row range found by searchsorted.
+        self._keys = (self._book.astype(np.uint32) << 20) \
+            | (self._chapter.astype(np.uint32) << 10) | self._verse.astype(np.uint32)
+        self.manifest = manifest
+        return True
+
+    def build(self, expected, book_chunks, batch_size: int = 256):
+        """Write the index for `expected` (a BibleRAG manifest dict).
+
+        Rows of books whose hash is unchanged are copied from the current
+        index; only new or changed books are embedded, via book_chunks(book)
+        -> (chunks, ids), in batches of batch_size.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        old = self.manifest if self.manifest is not None else {}
+        reusable = old.get("dtype") == self.dtype and all(
+            old.get(k) == v for k, v in expected.items() if k != "books"
+        )
+        old_books = old.get("books", {}) if reusable else {}
+
+        book_names = list(expected["books"])
+        matrices, scales, book_ids, chapters, verses, end_verses, texts = [], [], [], [], [], [], []
+        todo = [b for b in book_names if old_books.get(b) != expected["books"][b]]
+        if todo:
+            print(f"⚠️ Embedding {len(todo)} of {len(book_names)} books into the flat index...")
+
+        for b_id, book in enumerate(book_names):
+            if book not in todo:
+                rows = np.flatnonzero(self._book == self.books.index(book))
+                matrices.append(np.asarray(self._matrix[rows]))
+                if self._scales is not None:
+                    scales.append(np.asarray(self._scales[rows]))
+                chapters.append(np.asarray(self._chapter[rows]))
+                verses.append(np.asarray(self._verse[rows]))
+                end_verses.append(np.asarray(self._end_verse[rows]))
+                texts.extend(self._row_text(r) for r in rows)
+                book_ids.append(np.full(len(rows), b_id, dtype=np.uint8))
+                continue
+
+            chunks, _ = book_chunks(book)
+            n = todo.index(book) + 1
+            vectors = []
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                vectors.append(self.embedding.embed_documents([c.page_content for c in batch]))
+                print(f"   [{n}/{len(todo)}] {book}: {min(start + batch_size, len(chunks))}/{len(chunks)} chunks", end="\r")
+            print()
+            if not chunks:
+                continue
+            m, s = _quantize(_normalize(np.concatenate(vectors)), self.dtype)
+            matrices.append(m)
+            if s is not None:
+                scales.append(s)
+            chapters.append(np.array([c.metadata["chapter"] for c in chunks], dtype=np.uint16))
+            verses.append(np.array([c.metadata["verse"] for c in chunks], dtype=np.uint16))
+            end_verses.append(np.array([c.metadata["end_verse"] for c in chunks], dtype=np.uint16))
+            texts.extend(c.page_content for c in chunks)
+            book_ids.append(np.full(len(chunks), b_id, dtype=np.uint8))
+
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+        np.cumsum([len(t) for t in encoded], out=offsets[1:])
+
+        arrays = {
+            "embeddings.npy": np.concatenate(matrices),
+            "book.npy": np.concatenate(book_ids),
+            "chapter.npy": np.concatenate(chapters),
+            "verse.npy": np.concatenate(verses),
+            "end_verse.npy": np.concatenate(end_verses),
+            "text_offsets.npy": offsets,
+        }
+        if self.dtype == "int8":
+            arrays["scales.npy"] = np.concatenate(scales)
+
+        # Drop our own mappings before replacing the files underneath them
+        self.manifest = None
+        self._matrix = self._scales = self._text = None
+        # Invalidate the index first: until the new manifest is written, an
+        # interrupted rebuild leaves arrays that open() must not accept
+        try:
+            os.remove(self._path(MANIFEST_FILENAME))
+        except FileNotFoundError:
+            pass
+        for name, arr in arrays.items():
+            tmp = self._path(name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+            os.replace(tmp, self._path(name))
+        tmp = self._path("text.bin.tmp")
+        tmp.write_bytes(b"".join(encoded))
+        os.replace(tmp, self._path("text.bin"))
+
+        # The manifest goes last: it is what marks the index as complete
+        manifest = dict(expected, dtype=self.dtype, book_names=book_names,
+                        dim=int(arrays["embeddings.npy"].shape[1]))
+        tmp = self._path(MANIFEST_FILENAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self._path(MANIFEST_FILENAME))
+        self.open()
+
+    def vectors(self):
+        """(metadata of every row, float32 unit vectors), dequantized."""
+        matrix = np.asarray(self._matrix, dtype=np.float32)
+        if self._scales is not None:
+            matrix = _normalize(matrix * self._scales[:, None])
+        metadata = [
+            {"book": self.books[b], "chapter": int(c), "verse": int(v)}
+            for b, c, v in zip(self._book.tolist(), self._chapter.tolist(), self._verse.tolist())
+        ]
+        return metadata, matrix
+
+    # --- search -----------------------------------------------------------
+    def _row_text(self, row):
+        a, b = int(self._text_offsets[row]), int(self._text_offsets[row + 1])
+        return self._text[a:b].tobytes().decode("utf-8")
+
+    def _document(self, row):
+        metadata = {
+            "book": self.books[int(self._book[row])],
+            "chapter": int(self._chapter[row]),
+            "verse": int(self._verse[row]),
+            "end_verse": int(self._end_verse[row]),
+        }
+        from langchain_core.documents import Document
+        return Document(page_content=self._row_text(row), metadata=metadata)
+
+    @staticmethod
+    def _key(book_id, chapter, verse):
+        return (book_id << 20) | (chapter << 10) | verse
+
+    def filter_rows(self, books=None, chapter=None, verses=None):
+        """Rows matching the constraints: a slice when they are contiguous
+        (always true for one book), else an index array. None = all rows.
+
+        chapter and verses=(first, last) only apply with a single book; a
+        verse range matches every row (passage) that overlaps it.
+        """
+        if not books:
+            return None
+        ids = sorted(self._book_ids[b] for b in books if b in self._book_ids)
+        if len(ids) == 1 and chapter is not None:
+            first, last = verses if verses else (0, 1023)
+            lo = self._key(ids[0], chapter, first)
+            hi = self._key(ids[0], chapter, last) + 1
+        else:
+            ranges = []
+            for i in ids:
+                lo_i, hi_i = self._key(i, 0, 0), self._key(i + 1, 0, 0)
+                if ranges and ranges[-1][1] == lo_i:
+                    ranges[-1][1] = hi_i
+                else:
+                    ranges.append([lo_i, hi_i])
+            if len(ranges) != 1:
+                return np.concatenate([
+                    np.arange(*np.searchsorted(self._keys, r)) for r in ranges
+                ]) if ranges else slice(0, 0)
+            lo, hi = ranges[0]
+        start, stop = np.searchsorted(self._keys, [lo, hi])
+        if verses and start > 0 and (self._keys[start - 1] >> 10) == (lo >> 10) \
+                and self._end_verse[start - 1] >= verses[0]:
+            start -= 1   # the passage that begins before the range runs into it
+        return slice(int(start), int(stop))
+
+    def scores(self, query_vector, rows=None):
+        """Cosine similarity of the query against every row (or the given rows)."""
+        q = _normalize(query_vector)
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        out = np.empty(len(matrix), dtype=np.float32)
+        # Blocked so the float32 upcast never materializes the whole matrix
+        for start in range(0, len(matrix), _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ q
+        if self._scales is not None:
+            out *= self._scales if rows is None else self._scales[rows]
+        return out
+
+    def top_k(self, query_vector, k: int = 4, rows=None):
+        """Return [(row, score)] of the k best rows (within rows), best first."""
+        s = self.scores(query_vector, rows)
+        k = min(k, len(s))
+        if k <= 0:
+            return []
+        top = np.argpartition(-s, k - 1)[:k]
+        top = top[np.argsort(-s[top])]
+        if isinstance(rows, slice):
+            base = [rows.start + int(r) for r in top]
+        elif rows is not None:
+            base = [int(rows[r]) for r in top]
+        else:
+            base = [int(r) for r in top]
+        return [(row, float(s[r])) for row, r in zip(base, top)]
+
+    def top_k_many(self, query_vectors, k: int = 4, rows=None):
+        """top_k for several queries sharing the same rows: one blocked
+        matrix-matrix product instead of a matrix-vector product per query."""
+        q = _normalize(query_vectors)
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        s = np.empty((len(matrix), len(q)), dtype=np.float32)
+        for start in range(0, len(matrix), _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            s[start:start + len(block)] = block @ q.T
+        if self._scales is not None:
+            s *= (self._scales if rows is None else self._scales[rows])[:, None]
+        k = min(k, len(s))
+        if k <= 0:
+            return [[] for _ in q]
+        top = np.argpartition(-s, k - 1, axis=0)[:k]
+        out = []
+        for j in range(len(q)):
+            col = top[np.argsort(-s[top[:, j], j]), j]
+            if isinstance(rows, slice):
+                base = [rows.start + int(r) for r in col]
+            elif rows is not None:
+                base = [int(rows[r]) for r in col]
+            else:
+                base = [int(r) for r in col]
+            out.append([(row, float(s[r, j])) for row, r in zip(base, col)])
+        return out
+
+    def similarity_search_by_vectors(self, embeddings, k: int = 4, books=None, chapter=None, verses=None):
+        """similarity_search_by_vector for a block of queries with one scope."""
+        rows = self.filter_rows(books, chapter, verses)
+        return [[self._document(r) for r, _ in hits] for hits in self.top_k_many(embeddings, k, rows)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, books=None, chapter=None, verses=None):
+        rows = self.filter_rows(books, chapter, verses)
+        return [self._document(r) for r, _ in self.top_k(embedding, k, rows)]
+
+    def similarity_search(self, query: str, k: int = 4, books=None, chapter=None, verses=None):
+        # Filters select the rows BEFORE scoring, so only that subset is scanned
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, books, chapter, verses)
@@ -0,0 +1,189 @@
+# lexical_index.py
+"""
+BM25 inverted index with positional postings over the verse corpus.
+
+Built once from the compiled corpus and stored as flat .npy arrays next to
+it (bible/lexical_index/), memory-mapped on load:
+
+    vocab.txt        sorted terms, one per line
+    term_offsets     term -> [start, end) into the postings arrays
+    post_docs        verse index of each posting
+    post_tf          term frequency of each posting
+    pos_offsets      posting -> [start, end) into positions
+    positions        token positions within the verse
+    doc_len          tokens per verse
+
+Exact phrase queries ("be still and know") are answered from the postings
+alone, with no embedding call; free-text queries get BM25 scores that
+BibleRAG fuses with dense results.
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+INDEX_DIRNAME = "lexical_index"
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_ARRAYS = ("term_offsets", "post_docs", "post_tf", "pos_offsets", "positions", "doc_len")
+
+
+def tokenize(text: str):
+    return _TOKEN.findall(text.lower().replace("’", "'").replace("‘", "'"))
+
+
+def build_lexical_index(corpus, directory):
+    """Tokenize every verse and write the positional postings."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    postings = {}                      # term -> {doc: [positions]}
+    doc_len = np.zeros(len(corpus), dtype=np.uint16)
+    for doc in range(len(corpus)):
+        tokens = tokenize(corpus.text(doc))
+        doc_len[doc] = min(len(tokens), 65535)
+        for pos, tok in enumerate(tokens):
+            postings.setdefault(tok, {}).setdefault(doc, []).append(pos)
+
+    vocab = sorted(postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.uint32)
+    post_docs, post_tf, pos_offsets, positions = [], [], [0], []
+    for t, term in enumerate(vocab):
+        for doc, plist in postings[term].items():   # docs were added in order
+            post_docs.append(doc)
+            post_tf.append(len(plist))
+            positions.extend(plist)
+            pos_offsets.append(len(positions))
+        term_offsets[t + 1] = len(post_docs)
+
+    arrays = {
+        "term_offsets": term_offsets,
+        "post_docs": np.array(post_docs, dtype=np.uint32),
+        "post_tf": np.array(post_tf, dtype=np.uint16),
+        "pos_offsets": np.array(pos_offsets, dtype=np.uint32),
+        "positions": np.array(positions, dtype=np.uint16),
+        "doc_len": doc_len,
+    }
+    for name, arr in arrays.items():
+        tmp = directory / f"{name}.npy.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr, allow_pickle=False)
+        os.replace(tmp, directory / f"{name}.npy")
+    (directory / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "corpus_fingerprint": corpus.fingerprint.hex(),
+        "n_docs": len(corpus),
+        "avgdl": float(doc_len.mean()) if len(doc_len) else 0.0,
+    }
+    # Written last: a present, matching manifest marks a complete index
+    tmp = directory / "manifest.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, directory / "manifest.json")
+    print(f"[lexical_index] Indexed {len(vocab)} terms over {len(corpus)} verses → {directory}")
+
+
+class LexicalIndex:
+    def __init__(self, directory):
+        directory = Path(directory)
+        with open(directory / "manifest.json", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        for name in _ARRAYS:
+            setattr(self, "_" + name, np.load(directory / f"{name}.npy", mmap_mode="r", allow_pickle=False))
+        vocab = (directory / "vocab.txt").read_text(encoding="utf-8").split("\n")
+        self._terms = {t: i for i, t in enumerate(vocab) if t}
+        self.n_docs = self.manifest["n_docs"]
+        self.avgdl = self.manifest["avgdl"] or 1.0
+
+    def _postings(self, term):
+        t = self._terms.get(term)
+        if t is None:
+            return None
+        return int(self._term_offsets[t]), int(self._term_offsets[t + 1])
+
+    def _posting_positions(self, posting):
+        return self._positions[self._pos_offsets[posting]:self._pos_offsets[posting + 1]]
+
+    # --- BM25 -------------------------------------------------------------
+    def bm25(self, query: str, k: int = 10, mask=None):
+        """Return [(verse_index, score)] best first. mask: optional bool array
+        over verse indices restricting the candidates."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            span = self._postings(term)
+            if span is None:
+                continue
+            docs = self._post_docs[span[0]:span[1]]
+            tf = self._post_tf[span[0]:span[1]].astype(np.float32)
+            df = span[1] - span[0]
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            dl = self._doc_len[docs].astype(np.float32)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avgdl))
+        if mask is not None:
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(d), float(scores[d])) for d in top]
+
+    # --- phrases ----------------------------------------------------------
+    def phrase(self, text: str, limit: int = 10, mask=None):
+        """Return verse indices containing the exact token sequence, in order."""
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        spans = []
+        for term in tokens:
+            span = self._postings(term)
+            if span is None:
+                return []
+            spans.append(span)
+
+        # Intersect doc lists starting from the rarest term
+        order = sorted(range(len(tokens)), key=lambda i: spans[i][1] - spans[i][0])
+        candidates = np.asarray(self._post_docs[spans[order[0]][0]:spans[order[0]][1]])
+        for i in order[1:]:
+            candidates = np.intersect1d(candidates, self._post_docs[spans[i][0]:spans[i][1]], assume_unique=True)
+            if not len(candidates):
+                return []
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+
+        hits = []
+        for doc in candidates:
+            # Posting of each term for this doc (postings are sorted by doc)
+            starts = []
+            for (a, b) in spans:
+                p = a + int(np.searchsorted(self._post_docs[a:b], doc))
+                starts.append(set(int(x) for x in self._posting_positions(p)))
+            first = starts[0]
+            if any(all(p + i in starts[i] for i in range(1, len(starts))) for p in first):
+                hits.append(int(doc))
+                if len(hits) >= limit:
+                    break
+        return hits
+
+
+def load_lexical_index(corpus, directory=None) -> LexicalIndex:
+    """Open the index for a VerseCorpus, rebuilding it if the corpus changed."""
+    directory = Path(directory) if directory else corpus.path.parent / INDEX_DIRNAME
+    try:
+        with open(directory / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        fresh = (manifest.get("version") == FORMAT_VERSION
+                 and manifest.get("corpus_fingerprint") == corpus.fingerprint.hex())
+    except (OSError, ValueError):
+        fresh = False
+    if not fresh:
+        build_lexical_index(corpus, directory)
+    return LexicalIndex(directory)
@@ -0,0 +1,265 @@
+# llm_pool.py
+"""
+Pool of LLM worker processes for concurrent generation.
+
+One llama.cpp context decodes one sequence at a time, so a single Llama
+serializes every answer. The pool starts LLM_WORKERS processes, each with its
+own context and LLM_WORKER_THREADS threads (default: physical cores / workers).
+Weights are opened with mmap, so every worker maps the same GGUF pages from
+the page cache: the weights are resident once, and each additional worker
+costs its KV cache and compute buffers.
+
+Requests are routed by session: a conversation always lands on the same
+worker, whose context (and preamble state, see prefix_cache.py) still holds
+that conversation's prompt prefix. Requests without a session go to the
+least busy worker.
+
+A worker that dies (out of memory, a crash in llama.cpp) fails the request
+it was serving instead of leaving it waiting, and is started again.
+
+Processes are started with "spawn": the parent runs threads, and llama.cpp
+state must not be inherited through fork.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import zlib
+
+_POLL_SECONDS = 1.0
+_CANCEL_HORIZON = 4096   # cancelled ids kept per worker, behind the current job
+
+
+def _drain(cancels, cancelled):
+    """Move cancel requests that have arrived into the cancelled set."""
+    while True:
+        try:
+            cancelled.add(cancels.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _worker_main(index, config, jobs, results, cancels):
+    os.environ["LLAMA_LOG_LEVEL"] = "40"
+    from llama_cpp import Llama
+    from prefix_cache import PrefixCache
+    from speculative import draft_from_env
+
+    try:
+        draft = draft_from_env()
+        llm = Llama(
+            model_path=config["model_path"],
+            n_ctx=config["n_ctx"],
+            n_threads=config["n_threads"],
+            n_threads_batch=config["n_threads"],
+            n_batch=config["n_batch"],
+            use_mmap=True,
+            use_mlock=config["use_mlock"],
+            draft_model=draft,
+            verbose=False,
+        )
+        prefix = None
+        if config["prefix"]:
+            try:
+                prefix = PrefixCache(llm, config["prefix"], config["model_path"], config["n_ctx"])
+                prefix.warm()
+            except Exception:
+                prefix = None
+    except Exception as e:
+        results.put(("failed", index, str(e)))
+        return
+    results.put(("ready", index, os.getpid()))
+
+    cancelled = set()   # ids of this worker's jobs whose streams were closed
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, prompt = job
+        _drain(cancels, cancelled)
+        if len(cancelled) > _CANCEL_HORIZON:
+            # A cancel can arrive after its job finished; forget old ones
+            cancelled = {c for c in cancelled if c > job_id - _CANCEL_HORIZON}
+        if job_id in cancelled:
+            cancelled.discard(job_id)
+            results.put(("done", job_id, None, None))
+            continue
+        before = (draft.proposed, draft.accepted) if draft is not None else (0, 0)
+        try:
+            if prefix is not None:
+                prefix.prime(prompt)
+            stream = llm(prompt, stream=True, stop=config["stop"], **config["sampling"])
+            try:
+                for chunk in stream:
+                    text = chunk["choices"][0].get("text", "")
+                    if text:
+                        results.put(("piece", job_id, text))
+                    _drain(cancels, cancelled)
+                    if job_id in cancelled:
+                        cancelled.discard(job_id)
+                        break
+            finally:
+                stream.close()
+            if draft is not None:
+                draft.settle(llm.input_ids[:llm.n_tokens])
+                results.put(("done", job_id, draft.proposed - before[0], draft.accepted - before[1]))
+            else:
+                results.put(("done", job_id, None, None))
+        except Exception as e:
+            results.put(("error", job_id, str(e)))
+
+
+class _Worker:
+    def __init__(self, process, jobs, cancels):
+        self.process = process
+        self.jobs = jobs
+        self.cancels = cancels   # ids of jobs to stop, read by the worker between tokens
+        self.active = 0
+        self.pid = None
+
+
+class LLMPool:
+    def __init__(self, model_path, workers: int, threads: int, n_ctx: int, n_batch: int,
+                 sampling: dict, stop, prefix: str = None, use_mlock: bool = False,
+                 start_timeout: float = 600.0):
+        self._ctx = mp.get_context("spawn")
+        self._config = {
+            "model_path": model_path, "n_ctx": n_ctx, "n_threads": threads, "n_batch": n_batch,
+            "sampling": dict(sampling), "stop": list(stop), "prefix": prefix, "use_mlock": use_mlock,
+        }
+        self.start_timeout = start_timeout
+        self._results = self._ctx.Queue()
+        self._workers = [self._spawn(i) for i in range(workers)]
+        try:
+            self._wait_ready(range(workers))
+        except RuntimeError:
+            self.close()
+            raise
+
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        threading.Thread(target=self._route, name="llm-pool-results", daemon=True).start()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def _spawn(self, index):
+        jobs = self._ctx.Queue()
+        cancels = self._ctx.Queue()
+        process = self._ctx.Process(target=_worker_main, args=(index, self._config, jobs, self._results, cancels),
+                                    name=f"llm-worker-{index}", daemon=True)
+        process.start()
+        return _Worker(process, jobs, cancels)
+
+    def _wait_ready(self, indices):
+        """Block until the workers at indices report "ready"; fail as soon as
+        one reports a load error or exits without reporting."""
+        waiting = set(indices)
+        deadline = time.monotonic() + self.start_timeout
+        while waiting:
+            try:
+                kind, index, detail = self._results.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                dead = [i for i in waiting if not self._workers[i].process.is_alive()]
+                if dead:
+                    code = self._workers[dead[0]].process.exitcode
+                    raise RuntimeError(f"LLM worker {dead[0]} exited during startup (exit code {code}).")
+                if time.monotonic() > deadline:
+                    raise RuntimeError("LLM workers did not start in time.")
+                continue
+            if kind == "failed":
+                raise RuntimeError(f"LLM worker {index} failed to load the model: {detail}")
+            if kind == "ready":
+                self._workers[index].pid = detail
+                waiting.discard(index)
+
+    def _restart(self, index, dead):
+        """Replace a dead worker; its sessions move to the new process."""
+        with self._lock:
+            if self._workers[index] is not dead:
+                return   # another stream already restarted it
+            dead.process.join(0)
+            self._workers[index] = self._spawn(index)   # "ready" reaches the router
+
+    def _route(self):
+        while True:
+            try:
+                message = self._results.get()
+            except (EOFError, OSError):
+                return
+            if message[0] == "ready":
+                self._workers[message[1]].pid = message[2]
+                continue
+            if message[0] == "failed":
+                continue   # a restarted worker that could not load; stream() reports it dead
+            with self._lock:
+                out = self._streams.get(message[1])
+            if out is not None:   # pieces of an abandoned stream are dropped
+                out.put(message)
+
+    def worker_for(self, session=None) -> int:
+        """Stable worker for a session; the least busy one without a session."""
+        if session is not None:
+            return zlib.crc32(str(session).encode("utf-8")) % len(self._workers)
+        return min(range(len(self._workers)), key=lambda i: self._workers[i].active)
+
+    def stream(self, prompt: str, session=None, stats: dict = None):
+        """Yield raw generated text for prompt. Closing the generator stops the
+        worker after its next token. stats, if given, receives the drafted
+        ("proposed") and kept ("accepted") speculative token counts, or None
+        for both when the worker does not draft."""
+        index = self.worker_for(session)
+        worker = self._workers[index]
+        if not worker.process.is_alive():
+            self._restart(index, worker)
+            raise RuntimeError(f"LLM worker {worker.process.name} had exited; restarting it.")
+        job_id = next(self._ids)
+        out = queue.Queue()
+        with self._lock:
+            self._streams[job_id] = out
+            worker.active += 1
+        finished = False
+        try:
+            worker.jobs.put((job_id, prompt))
+            while True:
+                try:
+                    kind, _, *rest = out.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if worker.process.is_alive():
+                        continue
+                    # Crashed mid-job (OOM, segfault): nothing will answer
+                    finished = True
+                    code = worker.process.exitcode
+                    self._restart(index, worker)
+                    raise RuntimeError(f"LLM worker {worker.process.name} died (exit code {code}); restarting it.")
+                if kind == "piece":
+                    yield rest[0]
+                elif kind == "done":
+                    finished = True
+                    if stats is not None:
+                        stats["proposed"], stats["accepted"] = rest
+                    return
+                else:
+                    finished = True
+                    raise RuntimeError(f"LLM worker error: {rest[0]}")
+        finally:
+            if not finished:
+                worker.cancels.put(job_id)
+            with self._lock:
+                del self._streams[job_id]
+                worker.active -= 1
+
+    def stats(self):
+        return [{"pid": w.pid, "alive": w.process.is_alive(), "active": w.active} for w in self._workers]
+
+    def close(self):
+        for w in self._workers:
+            if w.process.is_alive():
+                w.jobs.put(None)
+        for w in self._workers:
+            w.process.join(5)
+            if w.process.is_alive():
+                w.process.terminate()
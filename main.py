@@ -1,15 +1,39 @@
 # main.py
+import json
+import time
+_t0 = time.perf_counter()
 from chat_agent import BibleChatAgent
+_import_s = time.perf_counter() - _t0
 
 if __name__ == "__main__":
     print("\n📖 Welcome to the Offline Biblical Bot CLI! Type 'exit' to quit.\n")
     agent = BibleChatAgent("./bible/bible_books")
+    # Verse lookups and greetings work now; models keep loading in the background
+    print(f"⏱ Ready in {(time.perf_counter() - _t0) * 1000:.0f} ms "
+          f"(imports {_import_s * 1000:.0f} ms, {agent.format_timings(['corpus', 'init'])})\n")
 
     while True:
         user_input = input("You: ").strip()
         if user_input.lower() in ["exit", "quit"]:
             print("👋 Goodbye. May your study be blessed.")
             break
+        if user_input.lower() in ["/stats", "/stats json", "/stats prom"]:
+            # Rolling per-stage latency percentiles, token counts, cache hit rates
+            if user_input.lower().endswith("json"):
+                print(json.dumps(agent.telemetry.snapshot(), indent=1), "\n")
+            elif user_input.lower().endswith("prom"):
+                print(agent.telemetry.prometheus())
+            else:
+                print(agent.telemetry.format_stats(), "\n")
+            continue
 
-        response = agent.ask(user_input)
-        print(f"Bot: {response}\n")
+        # Print tokens as they arrive; Ctrl-C stops a long answer
+        print("Bot: ", end="", flush=True)
+        stream = agent.ask_stream(user_input)
+        try:
+            for piece in stream:
+                print(piece, end="", flush=True)
+        except KeyboardInterrupt:
+            stream.close()
+            print(" [stopped]", end="")
+        print("\n")
@@ -0,0 +1,123 @@
+# neighbors.py
+"""
+Precomputed semantic neighbors of every passage ("related verses").
+
+The corpus never changes, so the k most similar passages of each passage are
+computed once, offline, from the embeddings already in the vector store:
+
+    python neighbors.py [--k 10]
+
+The all-pairs similarity is a blocked matrix product: a block of query rows
+against a block of candidate rows at a time, with a running top-k per query
+row, so memory stays at block_rows x block_cols scores however large the
+corpus. Passages of the query's own chapter are skipped; they are its context,
+not a cross-reference.
+
+The result is a CSR adjacency (indptr, indices, scores) in one .npz next to
+the other caches (NEIGHBORS_PATH, default .neighbors.npz), stamped with the
+vector index manifest so a graph from other passages or another model is
+ignored. At query time "related to passage p" is indices[indptr[p]:indptr[p + 1]]:
+no embedding, no search.
+"""
+import argparse
+import os
+
+import numpy as np
+
+NEIGHBORS_PATH = os.getenv("NEIGHBORS_PATH", ".neighbors.npz")
+NEIGHBORS_K = 10
+_BLOCK_ROWS = 1024
+_BLOCK_COLS = 4096
+
+
+class NeighborGraph:
+    def __init__(self, indptr, indices, scores):
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @classmethod
+    def build(cls, vectors, k: int = NEIGHBORS_K, groups=None,
+              block_rows: int = _BLOCK_ROWS, block_cols: int = _BLOCK_COLS):
+        """Top-k cosine neighbors of every row of vectors (unit-normalized
+        float32). Rows never neighbor themselves or rows of the same group."""
+        n = len(vectors)
+        k = max(0, min(k, n - 1))
+        if groups is None:
+            groups = np.arange(n)
+        best_i = np.empty((n, k), dtype=np.int64)
+        best_s = np.empty((n, k), dtype=np.float32)
+        for start in range(0, n, block_rows):
+            block = vectors[start:start + block_rows]
+            rows = len(block)
+            top_i = np.full((rows, k), -1, dtype=np.int64)
+            top_s = np.full((rows, k), -np.inf, dtype=np.float32)
+            for cstart in range(0, n, block_cols):
+                cand = vectors[cstart:cstart + block_cols]
+                s = block @ cand.T
+                s[groups[start:start + rows, None] == groups[None, cstart:cstart + len(cand)]] = -np.inf
+                # Merge this block's candidates into the running top-k
+                s = np.concatenate([top_s, s], axis=1)
+                ids = np.concatenate([top_i, np.broadcast_to(np.arange(cstart, cstart + len(cand)), (rows, len(cand)))], axis=1)
+                keep = np.argpartition(-s, k - 1, axis=1)[:, :k] if k else np.zeros((rows, 0), dtype=np.int64)
+                top_s = np.take_along_axis(s, keep, axis=1)
+                top_i = np.take_along_axis(ids, keep, axis=1)
+            order = np.argsort(-top_s, axis=1)
+            best_s[start:start + rows] = np.take_along_axis(top_s, order, axis=1)
+            best_i[start:start + rows] = np.take_along_axis(top_i, order, axis=1)
+            print(f"   neighbors: {start + rows}/{n} passages", end="\r")
+        print()
+
+        valid = np.isfinite(best_s) & (best_i >= 0)
+        indptr = np.zeros(n + 1, dtype=np.uint32)
+        np.cumsum(valid.sum(axis=1), out=indptr[1:])
+        index_type = np.uint16 if n <= np.iinfo(np.uint16).max else np.uint32
+        return cls(indptr, best_i[valid].astype(index_type), best_s[valid].astype(np.float16))
+
+    def save(self, path, stamp: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, indptr=self.indptr, indices=self.indices, scores=self.scores, stamp=np.array(stamp))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, stamp: str):
+        """The graph saved at path, or None if there is none or it is stale."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["stamp"]) != stamp:
+                    return None
+                return cls(data["indptr"], data["indices"], data["scores"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def neighbors(self, p: int):
+        """(indices, scores) of passage p, best first."""
+        a, b = self.indptr[p], self.indptr[p + 1]
+        return self.indices[a:b], self.scores[a:b]
+
+    def related(self, passages, k: int = 5):
+        """[(passage, score)] best neighbors of a set of passages, excluding
+        the passages themselves; a passage reached twice keeps its best score."""
+        own = set(passages)
+        best = {}
+        for p in own:
+            indices, scores = self.neighbors(p)
+            for q, s in zip(indices.tolist(), scores.tolist()):
+                if q not in own and s > best.get(q, -np.inf):
+                    best[q] = s
+        return sorted(best.items(), key=lambda item: -item[1])[:k]
+
+
+if __name__ == "__main__":
+    from rag_chain import BibleRAG
+
+    parser = argparse.ArgumentParser(description="Precompute the related-passage graph.")
+    parser.add_argument("--k", type=int, default=NEIGHBORS_K, help="neighbors kept per passage")
+    parser.add_argument("--data", default="./bible/bible_books")
+    parser.add_argument("--out", default=NEIGHBORS_PATH)
+    args = parser.parse_args()
+    BibleRAG(args.data).build_neighbors(args.k, args.out)
@@ -0,0 +1,71 @@
+# passages.py
+"""
+Passage segmentation of the verse corpus for the vector index.
+
+A passage is a run of whole verses inside one chapter, cut at the
+paragraph/stanza starts recorded in the corpus. Paragraphs longer than
+max_chars are split at verse boundaries (the embedding model only reads its
+first few hundred tokens), and paragraphs shorter than min_chars are joined to
+the next one in the chapter, so headings and one-line stanzas do not become
+vectors of their own.
+
+Passages are stored as sorted start indices into the corpus, so both links
+are cheap: passage -> verses is a slice, verse -> passage a bisect.
+"""
+import bisect
+import os
+
+PASSAGE_CHARS = int(os.getenv("PASSAGE_CHARS", "800"))
+PASSAGE_MIN_CHARS = 200
+
+
+class PassageMap:
+    def __init__(self, corpus, max_chars: int = PASSAGE_CHARS, min_chars: int = PASSAGE_MIN_CHARS):
+        self.corpus = corpus
+        self.max_chars = max_chars
+        starts = []
+        for book in corpus.books:
+            for chapter in range(1, corpus.chapter_count(book) + 1):
+                start, end = corpus.chapter_span(book, chapter)
+                starts.extend(self._segment(start, end, min_chars))
+        self.starts = starts
+        self._ends = starts[1:] + [len(corpus)]
+
+    def _segment(self, start, end, min_chars):
+        corpus = self.corpus
+        paragraphs = set(corpus.paragraph_starts(start, end))
+        out, size = [], 0
+        for i in range(start, end):
+            length = len(corpus.text(i)) + 1
+            if not out or size + length > self.max_chars or (i in paragraphs and size >= min_chars):
+                out.append(i)
+                size = 0
+            size += length
+        return out
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, p: int):
+        """[start, end) verse indices of passage p."""
+        return self.starts[p], self._ends[p]
+
+    def of_verse(self, index: int) -> int:
+        """The passage containing verse index."""
+        return bisect.bisect_right(self.starts, index) - 1
+
+    def book_passages(self, book: str):
+        """range of the passages of a book."""
+        start, end = self.corpus.book_span(book)
+        return range(bisect.bisect_left(self.starts, start), bisect.bisect_left(self.starts, end))
+
+    def text(self, p: int) -> str:
+        start, end = self.span(p)
+        return " ".join(self.corpus.text(i) for i in range(start, end))
+
+    def metadata(self, p: int) -> dict:
+        """Document metadata: the first verse, and the last as end_verse."""
+        start, end = self.span(p)
+        book, chapter, verse = self.corpus.locate(start)
+        return {"book": book, "chapter": chapter, "verse": verse,
+                "end_verse": self.corpus.verse_number(end - 1)}
@@ -0,0 +1,74 @@
+# prefix_cache.py
+"""
+Keep the KV cache of a fixed prompt preamble resident in llama.cpp.
+
+Every answer prompt starts with the same INSTRUCTIONS block. The preamble is
+evaluated once, its llama state (KV cache + token ids) is kept in memory and
+saved next to the model file, so a restarted process skips that prefill too.
+
+Before a prompt that starts with the preamble is generated, prime() restores
+the saved state when the context currently holds something else. The
+completion call then finds the preamble tokens as a prefix match and only
+prefills the request-specific tail (context passages + question).
+"""
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+
+class PrefixCache:
+    def __init__(self, llm, prefix: str, model_path: str, n_ctx: int):
+        self.llm = llm
+        self.prefix = prefix
+        self.tokens = llm.tokenize(prefix.encode("utf-8"))
+        self.state = None
+        self.path = Path(f"{model_path}.prefix-{self._key(model_path, n_ctx)}.state")
+
+    def _key(self, model_path, n_ctx):
+        try:
+            import llama_cpp
+            version = getattr(llama_cpp, "__version__", "")
+        except ImportError:
+            version = ""
+        try:
+            st = os.stat(model_path)
+            model_id = f"{os.path.basename(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            model_id = str(model_path)
+        blob = "\0".join([self.prefix, model_id, str(n_ctx), version])
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+    def warm(self):
+        """Load the preamble state from disk, or evaluate it once and save it."""
+        if self.path.exists():
+            try:
+                with open(self.path, "rb") as f:
+                    self.state = pickle.load(f)
+                self.llm.load_state(self.state)
+                print(f"✅ Prompt preamble state loaded ({len(self.tokens)} tokens).")
+                return
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable preamble state ({e}).")
+                self.state = None
+
+        self.llm.reset()
+        self.llm.eval(self.tokens)
+        self.state = self.llm.save_state()
+        try:
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")   # pool workers may race
+            with open(tmp, "wb") as f:
+                pickle.dump(self.state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save preamble state ({e}).")
+        print(f"✅ Prompt preamble evaluated and cached ({len(self.tokens)} tokens).")
+
+    def prime(self, prompt: str):
+        """Make the context start with the preamble before generating prompt."""
+        if self.state is None or not prompt.startswith(self.prefix):
+            return
+        n = len(self.tokens)
+        if self.llm.n_tokens >= n and list(self.llm.input_ids[:n]) == self.tokens:
+            return  # already resident; llama.cpp's prefix match will reuse it
+        self.llm.load_state(self.state)
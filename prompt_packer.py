@@ -0,0 +1,196 @@
+# prompt_packer.py
+"""
+Fits retrieved passages (and recent conversation) into a token budget.
+
+Retrieved hits are passages (dense search, metadata verse..end_verse) and
+single verses (BM25), often overlapping. The packer maps every hit back to its
+corpus verses, drops the duplicates, and merges consecutive verses of a
+chapter into one passage, so the prompt carries each verse's text exactly once.
+
+Passages are then added best-ranked first while they fit; a passage that only
+partly fits keeps its leading verses. History turns (compact session_store
+Turns with stored token counts) fill what is left, newest first. Token
+counts come from the model's tokenizer once it is loaded (cached per text,
+so a verse is tokenized once per process) and from a conservative character
+estimate before that.
+
+    budget = N_CTX - MAX_TOKENS - PROMPT_MARGIN   (PROMPT_BUDGET overrides)
+"""
+import os
+from functools import lru_cache
+from typing import NamedTuple
+
+PROMPT_MARGIN = 16        # tokens kept free for BOS and template rounding
+_CHARS_PER_TOKEN = 3      # estimate used until the tokenizer is available
+
+
+def prompt_budget(max_tokens: int) -> int:
+    """Prompt tokens available for one request."""
+    if os.getenv("PROMPT_BUDGET"):
+        return int(os.getenv("PROMPT_BUDGET"))
+    n_ctx = int(os.getenv("N_CTX", "4096"))
+    return max(256, n_ctx - max_tokens - PROMPT_MARGIN)
+
+
+class TokenCounter:
+    def __init__(self, cache_size: int = None):
+        self._tokenize = None
+        size = cache_size or int(os.getenv("TOKEN_CACHE_SIZE", "8192"))
+        self._cached = lru_cache(maxsize=size)(self._count)
+
+    def bind(self, llm):
+        """Count with llm's tokenizer from now on."""
+        if self._tokenize is None:
+            self._tokenize = llm.tokenize
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenize is not None
+
+    def _count(self, text: str) -> int:
+        return len(self._tokenize(text.encode("utf-8"), add_bos=False))
+
+    def count(self, text: str, cache: bool = True) -> int:
+        if not text:
+            return 0
+        if self._tokenize is None:
+            return len(text) // _CHARS_PER_TOKEN + 1
+        return self._cached(text) if cache else self._count(text)
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+class Passage(NamedTuple):
+    ref: str            # "john 3:16" or "john 3:16-18"
+    verses: tuple       # ((chapter, verse, text), ...); empty for unmapped chunks
+    text: str = ""      # chunk text when it could not be mapped to the corpus
+
+
+class PackedContext(NamedTuple):
+    refs: list          # allowed references, one per packed passage
+    context: str        # passage lines
+    history: str        # "Q: ...\nA: ..." turns that fit, oldest first
+    dropped: int        # passages (or verses) left out for lack of room
+
+
+class PromptPacker:
+    def __init__(self, corpus, counter: TokenCounter, budget: int):
+        self.corpus = corpus
+        self.counter = counter
+        self.budget = budget
+
+    # --- chunks -> passages ---------------------------------------------------
+    def _verse_indices(self, metadata):
+        """Corpus indices of a hit's verses (a passage runs to end_verse)."""
+        try:
+            book, chapter = str(metadata.get("book", "")).strip(), int(metadata["chapter"])
+            first = self.corpus.verse_index(book, chapter, int(metadata["verse"]))
+            last = self.corpus.verse_index(book, chapter, int(metadata.get("end_verse") or metadata["verse"]))
+        except (KeyError, TypeError, ValueError):
+            return None
+        if first is None:
+            return None
+        return range(first, (last if last is not None and last >= first else first) + 1)
+
+    def passages(self, docs):
+        """Merge retrieved Documents into passages, best-ranked first."""
+        ranked = []            # (rank, verse index)
+        loose = []             # (rank, Passage) for chunks outside the corpus
+        seen = set()
+        for rank, d in enumerate(docs):
+            m = d.metadata or {}
+            indices = self._verse_indices(m)
+            if indices is None:
+                ref = f"{m.get('book', '')} {m.get('chapter', '?')}:{m.get('verse', '?')}".strip()
+                loose.append((rank, Passage(ref, (), d.page_content)))
+                continue
+            for index in indices:
+                if index not in seen:
+                    seen.add(index)
+                    ranked.append((rank, index))
+
+        # Consecutive verses of one chapter become one run, ranked by its best hit
+        runs = []
+        for rank, index in sorted(ranked, key=lambda r: r[1]):
+            if runs and index == runs[-1][2] + 1 and self._same_chapter(runs[-1][2], index):
+                runs[-1][0] = min(runs[-1][0], rank)
+                runs[-1][2] = index
+            else:
+                runs.append([rank, index, index])
+        out = [(rank, self._passage(first, last)) for rank, first, last in runs] + loose
+        return [p for _, p in sorted(out, key=lambda r: r[0])]
+
+    def _same_chapter(self, a, b):
+        return self.corpus.locate(a)[:2] == self.corpus.locate(b)[:2]
+
+    def _passage(self, first, last):
+        book, chapter, verse = self.corpus.locate(first)
+        end = self.corpus.verse_number(last)
+        ref = f"{book} {chapter}:{verse}" if first == last else f"{book} {chapter}:{verse}-{end}"
+        verses = tuple((chapter, self.corpus.verse_number(i), self.corpus.text(i))
+                       for i in range(first, last + 1))
+        return Passage(ref, verses)
+
+    def spans(self, found):
+        """Passages for Bible.lookup() results, in reference order."""
+        out = []
+        for ref, (start, end) in found:
+            verses = tuple((c, v, text) for _, c, v, text in self.corpus.iter_range(start, end))
+            out.append(Passage(ref.label(), verses))
+        return out
+
+    # --- packing --------------------------------------------------------------
+    @staticmethod
+    def _lines(passage, verses):
+        if not passage.verses:
+            return [f"{passage.ref} — {passage.text}"]
+        if len(passage.verses) == 1:
+            return [f"{passage.ref} — {verses[0][2]}"]
+        return [passage.ref] + [f"{c}:{v} — {text}" for c, v, text in verses]
+
+    def pack(self, fixed: str, passages, history=(), max_verses: int = None) -> PackedContext:
+        """Choose the passages and history turns that fit next to fixed (the
+        rest of the prompt) within the budget. max_verses caps the verses
+        taken from multi-verse passages."""
+        count = self.counter.count
+        left = self.budget - count(fixed, cache=False)
+        refs, lines, dropped = [], [], 0
+        for passage in passages:
+            # "; ref" in the allowed list plus the header line
+            cost = count(passage.ref) + 2 + (count(passage.ref) + 1 if len(passage.verses) > 1 else 0)
+            taken = []
+            for c, v, text in passage.verses or ((None, None, passage.text),):
+                if max_verses is not None and len(taken) >= max_verses:
+                    break
+                verse_cost = count(text) + 4   # "c:v — " and the newline
+                if cost + verse_cost > left:
+                    break
+                cost += verse_cost
+                taken.append((c, v, text))
+            if not taken:
+                dropped += 1
+                continue
+            if len(taken) < len(passage.verses):
+                dropped += len(passage.verses) - len(taken)
+                last = taken[-1]
+                first = taken[0]
+                book = passage.ref.rsplit(" ", 1)[0]
+                label = f"{book} {first[0]}:{first[1]}" if len(taken) == 1 else \
+                    f"{book} {first[0]}:{first[1]}-{last[1]}" if first[0] == last[0] else \
+                    f"{book} {first[0]}:{first[1]}-{last[0]}:{last[1]}"
+                passage = passage._replace(ref=label)
+            if max_verses is not None and passage.verses:
+                max_verses -= len(taken)
+            left -= cost
+            refs.append(passage.ref)
+            lines.extend(self._lines(passage, taken))
+
+        turns = []
+        for turn in reversed(list(history)):
+            cost = turn.tokens + 1
+            if cost > left:
+                break
+            left -= cost
+            turns.append(turn.text)
+        return PackedContext(refs, "\n".join(lines), "\n".join(reversed(turns)), dropped)
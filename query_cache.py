@@ -0,0 +1,188 @@
+# query_cache.py
+"""
+Two-level cache for BibleRAG queries.
+
+    embeddings: normalized question -> query vector    (skips the encoder)
+    results:    (question, k, scope, mode) -> top-k    (skips the search too)
+
+Each level is an in-memory LRU, optionally backed by a SQLite file so repeat
+questions stay fast across restarts. Every entry is tagged with a stamp
+derived from the index manifest and embedding model; when the stamp changes,
+older entries are dropped automatically.
+
+The SQLite tier is bounded like the answer cache: rows unused for ttl_seconds
+are purged, and beyond max_rows or max_bytes the least recently used rows are
+deleted down to 90% of the caps, so pruning runs once per batch of inserts
+rather than on every one.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+_SPACES = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?.!]+$")
+_PRUNE_TO = 0.9
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive cache key."""
+    return _TRAILING.sub("", _SPACES.sub(" ", question.strip().lower()))
+
+
+class _LRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+
+class QueryCache:
+    KINDS = ("embedding", "results")
+
+    def __init__(self, maxsize: int = 1024, path=None, max_rows: int = 50000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 30 * 24 * 3600):
+        self.stamp = None
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._mem = {kind: _LRU(maxsize) for kind in self.KINDS}
+        self._counters = {f"{kind}_{c}": 0 for kind in self.KINDS for c in ("hits", "misses", "disk_hits")}
+        self._counters["disk_evictions"] = 0
+        self._db = None
+        self._rows = self._bytes = 0   # SQLite tier size, exact after each _prune
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(cache)")}
+            if columns and "used" not in columns:
+                self._db.execute("DROP TABLE cache")   # unbounded layout from before size tracking
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " kind TEXT, key TEXT, stamp TEXT, value BLOB, size INTEGER, used REAL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+            self._prune(1.0)
+
+    def set_stamp(self, stamp: str):
+        """Bind the cache to an index/model version, discarding other versions."""
+        with self._lock:
+            if stamp == self.stamp:
+                return
+            self.stamp = stamp
+            for lru in self._mem.values():
+                lru.data.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE stamp != ?", (stamp,))
+                self._prune(1.0)
+
+    def _prune(self, fill: float):
+        """Purge expired rows, then delete least recently used rows until the
+        tier is within fill x (max_rows, max_bytes)."""
+        self._db.execute("DELETE FROM cache WHERE used < ?", (time.time() - self.ttl,))
+        rows, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if rows > self.max_rows or size > self.max_bytes:
+            keep_rows, keep_bytes = int(self.max_rows * fill), int(self.max_bytes * fill)
+            deleted = self._db.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM ("
+                " SELECT rowid, ROW_NUMBER() OVER newest AS n, SUM(size) OVER newest AS total FROM cache"
+                " WINDOW newest AS (ORDER BY used DESC ROWS UNBOUNDED PRECEDING))"
+                " WHERE n > ? OR total > ?)", (keep_rows, keep_bytes),
+            ).rowcount
+            self._counters["disk_evictions"] += deleted
+            rows, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        self._rows, self._bytes = rows, size
+        self._db.commit()
+
+    # --- generic get/put ----------------------------------------------------
+    def _get(self, kind, key, decode):
+        with self._lock:
+            value = self._mem[kind].get(key)
+            if value is not None:
+                self._counters[f"{kind}_hits"] += 1
+                return value
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM cache WHERE kind = ? AND key = ? AND stamp = ?",
+                    (kind, key, self.stamp),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE cache SET used = ? WHERE kind = ? AND key = ?",
+                                     (time.time(), kind, key))
+                    self._db.commit()
+                    value = decode(row[0])
+                    self._mem[kind].put(key, value)
+                    self._counters[f"{kind}_hits"] += 1
+                    self._counters[f"{kind}_disk_hits"] += 1
+                    return value
+            self._counters[f"{kind}_misses"] += 1
+            return None
+
+    def _put(self, kind, key, value, encoded):
+        with self._lock:
+            self._mem[kind].put(key, value)
+            if self._db is not None and self.stamp is not None:
+                size = len(key) + len(encoded) + 64
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (kind, key, stamp, value, size, used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, key, self.stamp, encoded, size, time.time()),
+                )
+                # Counts a replaced row twice; _prune recounts exactly
+                self._rows += 1
+                self._bytes += size
+                if self._rows > self.max_rows or self._bytes > self.max_bytes:
+                    self._prune(_PRUNE_TO)
+                else:
+                    self._db.commit()
+
+    # --- embeddings ---------------------------------------------------------
+    def get_embedding(self, question: str):
+        return self._get("embedding", normalize_question(question),
+                         lambda blob: np.frombuffer(blob, dtype=np.float32))
+
+    def put_embedding(self, question: str, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        self._put("embedding", normalize_question(question), vector, vector.tobytes())
+
+    # --- top-k results ------------------------------------------------------
+    @staticmethod
+    def results_key(question: str, **params) -> str:
+        return json.dumps([normalize_question(question), params], sort_keys=True, default=list)
+
+    def get_results(self, key: str):
+        """Cached [(page_content, metadata)] for a results_key, or None."""
+        return self._get("results", key, lambda blob: json.loads(blob))
+
+    def put_results(self, key: str, results):
+        results = [[text, dict(meta)] for text, meta in results]
+        self._put("results", key, results, json.dumps(results))
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counters)
+            for kind, lru in self._mem.items():
+                out[f"{kind}_entries"] = len(lru.data)
+                out[f"{kind}_evictions"] = lru.evictions
+            if self._db is not None:
+                out["disk_rows"], out["disk_bytes"] = self._rows, self._bytes
+            return out
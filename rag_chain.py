@@ -1,66 +1,589 @@
 # rag_chain.py
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
+# langchain, Chroma and the sentence-transformers/torch stack are imported
+# where they are first used, so importing this module (and answering verse
+# lookups or phrase searches) never pays for them.
 from pathlib import Path
+import hashlib
 import json
+import os
+import re
+import threading
+import numpy as np
+from corpus import load_corpus, BOOK_ORDER, TESTAMENTS
+from flat_index import FlatIndex
+from lexical_index import load_lexical_index
+from neighbors import NeighborGraph, NEIGHBORS_K, NEIGHBORS_PATH
+from passages import PassageMap, PASSAGE_CHARS
+from query_cache import QueryCache
+from telemetry import Telemetry
 
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Vectors are paragraph/stanza passages of whole verses (see passages.py)
+CHUNKING = "paragraph"
+
+# Written next to the Chroma files; records what the store was built from
+MANIFEST_FILENAME = "bible_manifest.json"
+MANIFEST_VERSION = 2
+_MANIFEST_SETTINGS = ("version", "embed_model", "chunking", "passage_chars")
+
+# "chroma": persistent Chroma/HNSW store (default)
+# "flat":   exact in-process NumPy index over mmap'd float16/int8 embeddings
+VECTOR_BACKENDS = ("chroma", "flat")
+DEFAULT_PERSIST_DIRS = {"chroma": ".chromadb", "flat": ".flatindex"}
+
+# "auto":    quoted/phrase-like queries hit the inverted index only; others hybrid
+# "dense":   vector search only
+# "lexical": BM25 only (no embedding call)
+# "hybrid":  reciprocal-rank fusion of BM25 and dense results
+RETRIEVAL_MODES = ("auto", "dense", "lexical", "hybrid")
+RRF_K = 60
+
+_QUOTED = re.compile(r"[\"“]([^\"“”]{3,})[\"”]|(?:^|\s)[‘']([^‘’']{3,})[’'](?=[\s?.!,]|$)")
+_SAYS = re.compile(r"\b(?:where|which verse|what verse|who)\b.*?\b(?:says?|said)\s+(.{6,}?)[\s?.!]*$", re.IGNORECASE)
+
+
+def _document(text, metadata):
+    from langchain_core.documents import Document
+    return Document(page_content=text, metadata=metadata)
+
+
+class LazyEmbeddings:
+    """Loads the sentence-transformers model on first use, so opening a
+    store whose manifest is current never touches it. Implements the
+    langchain Embeddings interface (embed_documents/embed_query)."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.model.embed_query(text)
+
 
 class BibleRAG:
-    def __init__(self, bible_data_path: Path):
+    def __init__(self, bible_data_path: Path, backend: str = None, telemetry: Telemetry = None):
         self.bible_data_path = Path(bible_data_path)
-        self.embedding = HuggingFaceEmbeddings(model_name=EMBED_MODEL_NAME)
+        self.telemetry = telemetry or Telemetry(enabled=False)
+        self.backend = (backend or os.getenv("VECTOR_BACKEND", "chroma")).lower()
+        if self.backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown VECTOR_BACKEND '{self.backend}' (choose from {VECTOR_BACKENDS})")
+        self.embedding = LazyEmbeddings(EMBED_MODEL_NAME)
         self.vectorstore = None
+        self._store_lock = threading.Lock()
+        self._store_ready = False
+        # Guards the lazily built indexes below; retrieval runs on several threads
+        self._index_lock = threading.RLock()
+        self._corpus = None
+        self._lexical = None
+        self._passages = None
+        self._neighbors = None
+        # Query embedding + top-k result cache; QUERY_CACHE_PATH="" keeps it in memory only
+        self.cache = QueryCache(
+            maxsize=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+            path=os.getenv("QUERY_CACHE_PATH", ".query_cache.sqlite") or None,
+            max_rows=int(os.getenv("QUERY_CACHE_ROWS", "50000")),
+            max_bytes=int(os.getenv("QUERY_CACHE_BYTES", str(64 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", str(30 * 24 * 3600))),
+        )
 
-    def load_bible_documents(self):
+    def load_bible_documents(self, books=None):
         documents = []
-        for book_file in self.bible_data_path.glob("*.json"):
-            book = book_file.stem
-            with open(book_file, encoding="utf-8") as f:
-                verses = json.load(f)
-            for v in verses:
-                if v.get("type") != "paragraph text":
-                    continue
-                chapter = v["chapterNumber"]
-                verse = v["verseNumber"]
-                text = v["value"]
+        # Same compiled corpus Bible uses: merged verse fragments, poetry included
+        corpus = self.corpus
+        for book in (corpus.books if books is None else books):
+            span = corpus.book_span(book)
+            if span is None:
+                continue
+            for _, chapter, verse, text in corpus.iter_range(*span):
                 metadata = {"book": book, "chapter": chapter, "verse": verse}
-                documents.append(Document(page_content=text, metadata=metadata))
+                documents.append(_document(text, metadata))
         return documents
 
-    def load_or_build_vectorstore(self, persist_directory=".chromadb"):
+    # --- manifest ---------------------------------------------------------
+    def _expected_manifest(self):
+        order = {b: i for i, b in enumerate(BOOK_ORDER)}
+        files = sorted(self.bible_data_path.glob("*.json"),
+                       key=lambda f: (order.get(f.stem.lower(), len(order)), f.stem.lower()))
+        return {
+            "version": MANIFEST_VERSION,
+            "embed_model": EMBED_MODEL_NAME,
+            "chunking": CHUNKING,
+            "passage_chars": PASSAGE_CHARS,
+            "books": {f.stem.lower(): hashlib.sha256(f.read_bytes()).hexdigest() for f in files},
+        }
 
+    @staticmethod
+    def _read_manifest(path: Path):
         try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_manifest(path: Path, manifest):
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, path)
+
+    # --- index maintenance ------------------------------------------------
+    @property
+    def corpus(self):
+        """The compiled verse corpus, opened on first use. Its source files
+        are re-checked when the vector store is (re)loaded, not per query."""
+        if self._corpus is None:
+            with self._index_lock:
+                if self._corpus is None:
+                    self._corpus = load_corpus(self.bible_data_path)
+        return self._corpus
+
+    def _refresh_corpus(self):
+        """Re-check the corpus against its source files; indexes derived from
+        a replaced corpus are dropped and rebuilt on next use."""
+        with self._index_lock:
+            corpus = self.corpus
+            if self._corpus is not None and corpus is not self._corpus:
+                self._passages = self._lexical = self._neighbors = None
+            self._corpus = corpus
+
+    @property
+    def passages(self):
+        """Passage segmentation of the corpus, shared by indexing and fusion."""
+        if self._passages is None:
+            with self._index_lock:
+                if self._passages is None:
+                    self._passages = PassageMap(self.corpus)
+        return self._passages
+
+    def _book_chunks(self, book):
+        """One book's passages as Documents with stable ids (book:chapter:verse).
+        metadata["end_verse"] is the passage's last verse."""
+        passages = self.passages
+        chunks, ids = [], []
+        for p in passages.book_passages(book):
+            metadata = passages.metadata(p)
+            chunks.append(_document(passages.text(p), metadata))
+            ids.append(f"{metadata['book']}:{metadata['chapter']}:{metadata['verse']}")
+        return chunks, ids
+
+    def _delete_book(self, book):
+        ids = self.vectorstore.get(where={"book": book}, include=[])["ids"]
+        if ids:
+            self.vectorstore.delete(ids=ids)
+
+    def ensure_vectorstore(self):
+        """Open (or build) the default vector store unless it is already open.
+        Concurrent callers wait for the one load in progress."""
+        if not self._store_ready:
+            with self._store_lock:
+                if not self._store_ready:
+                    self.load_or_build_vectorstore()
+        return self.vectorstore
+
+    def load_or_build_vectorstore(self, persist_directory=None, batch_size=None):
+        persist_directory = persist_directory or DEFAULT_PERSIST_DIRS[self.backend]
+        batch_size = batch_size or int(os.getenv("EMBED_BATCH", "256"))
+        self._refresh_corpus()
+        expected = self._expected_manifest()
+        if self.backend == "flat":
+            self._load_or_build_flat(persist_directory, batch_size, expected)
+        else:
+            self._load_or_build_chroma(persist_directory, batch_size, expected)
+
+        # Cached embeddings/results are only valid for this exact index + model
+        stamp = dict(expected, backend=self.backend, persist_directory=str(persist_directory))
+        if self.backend == "flat":
+            stamp["dtype"] = self.vectorstore.dtype
+        self.cache.set_stamp(hashlib.sha256(json.dumps(stamp, sort_keys=True).encode("utf-8")).hexdigest())
+        self._store_ready = True
+
+    def _load_or_build_flat(self, persist_directory, batch_size, expected):
+        index = FlatIndex(persist_directory, self.embedding,
+                          dtype=os.getenv("FLAT_INDEX_DTYPE", "float16"))
+        index.open()
+        current = index.manifest or {}
+        if current.get("dtype") != index.dtype or any(
+            current.get(k) != expected[k] for k in _MANIFEST_SETTINGS + ("books",)
+        ):
+            index.build(expected, self._book_chunks, batch_size)
+            print("✅ Flat vector index built and saved.")
+        else:
+            print("✅ Flat vector index loaded from disk.")
+        self.vectorstore = index
+
+    def _load_or_build_chroma(self, persist_directory, batch_size, expected):
+        """Open the store, re-embedding only books whose source changed.
+
+        The manifest is checked without loading the embedding model. Each
+        book is recorded in the manifest as soon as its last batch is
+        written, so an interrupted build resumes from the next book.
+        """
+        from langchain_chroma import Chroma
+
+        persist = Path(persist_directory)
+        persist.mkdir(parents=True, exist_ok=True)
+        manifest_path = persist / MANIFEST_FILENAME
+
+        manifest = self._read_manifest(manifest_path)
+        reset = (
+            manifest is None
+            or any(manifest.get(k) != expected[k] for k in _MANIFEST_SETTINGS)
+            or not (persist / "chroma.sqlite3").exists()
+        )
+
+        self.vectorstore = Chroma(
+            embedding_function=self.embedding,
+            persist_directory=persist_directory
+        )
+        if reset:
+            if manifest is not None:
+                print("⚠️ Vector store settings changed or data missing. Rebuilding...")
+            self.vectorstore.delete_collection()
             self.vectorstore = Chroma(
                 embedding_function=self.embedding,
                 persist_directory=persist_directory
             )
-            # Check for actual data
-            results = self.vectorstore.similarity_search("Jesus", k=1)
-            if not results:
-                raise RuntimeError("Vectorstore appears empty.")
+            manifest = {k: expected[k] for k in _MANIFEST_SETTINGS}
+            manifest["books"] = {}
+
+        done = manifest["books"]
+        stale = [b for b in done if expected["books"].get(b) != done[b]]
+        for book in stale:
+            self._delete_book(book)
+            del done[book]
+        if stale:
+            self._write_manifest(manifest_path, manifest)
+
+        todo = [b for b in expected["books"] if b not in done]
+        if not todo:
             print("✅ Vector store loaded from disk.")
-        except Exception as e:
-            print(f"⚠️ Vectorstore error ({e}). Building a new one...")
-            documents = self.load_bible_documents()
-            splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=20)
-            chunks = splitter.split_documents(documents)
-            self.vectorstore = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embedding,
-                persist_directory=persist_directory
-            )
-            self.vectorstore.persist()
-            print("✅ Vector store built and saved.")
+            return
+
+        print(f"⚠️ Embedding {len(todo)} of {len(expected['books'])} books into the vector store...")
+        for i, book in enumerate(todo, 1):
+            # Drop partial chunks left by an interrupted run before re-adding
+            self._delete_book(book)
+            chunks, ids = self._book_chunks(book)
+            for start in range(0, len(chunks), batch_size):
+                end = start + batch_size
+                self.vectorstore.add_documents(chunks[start:end], ids=ids[start:end])
+                print(f"   [{i}/{len(todo)}] {book}: {min(end, len(chunks))}/{len(chunks)} chunks", end="\r")
+            print()
+            done[book] = expected["books"][book]
+            self._write_manifest(manifest_path, manifest)
+        print("✅ Vector store built and saved.")
+
+    @staticmethod
+    def _scope(book=None, chapter=None, verses=None, testament=None):
+        """Normalize query constraints to (books, chapter, verses)."""
+        books = None
+        if book:
+            books = [book]
+        elif testament:
+            books = list(TESTAMENTS[testament.lower()])
+        if not books or len(books) > 1:
+            chapter = verses = None
+        if chapter is None:
+            verses = None
+        return books, chapter, verses
+
+    @staticmethod
+    def _chroma_where(books, chapter, verses):
+        clauses = []
+        if books:
+            clauses.append({"book": books[0]} if len(books) == 1 else {"book": {"$in": books}})
+        if chapter is not None:
+            clauses.append({"chapter": int(chapter)})
+        if verses:
+            # Passages overlapping the range
+            clauses.append({"end_verse": {"$gte": int(verses[0])}})
+            clauses.append({"verse": {"$lte": int(verses[1])}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    @property
+    def lexical(self):
+        """BM25/phrase index over the verse corpus, loaded (or built) on first
+        use. Concurrent callers wait for the one load in progress."""
+        if self._lexical is None:
+            with self._index_lock:
+                if self._lexical is None:
+                    self._lexical = load_lexical_index(self.corpus)
+        return self._lexical
+
+    @staticmethod
+    def _phrase_of(question: str):
+        """Return the quoted or half-remembered phrase in a question, if any."""
+        m = _QUOTED.search(question)
+        if m:
+            return m.group(1) or m.group(2)
+        m = _SAYS.search(question.strip())
+        return m.group(1) if m else None
+
+    def _scope_mask(self, books, chapter, verses):
+        if not books:
+            return None
+        corpus = self.corpus
+        mask = np.zeros(len(corpus), dtype=bool)
+        for book in books:
+            if chapter is None:
+                span = corpus.book_span(book)
+            else:
+                first, last = verses or (None, None)
+                span = corpus.range_span(book, chapter, first, chapter, last)
+            if span:
+                mask[span[0]:span[1]] = True
+        return mask
+
+    def _verse_documents(self, indices):
+        corpus = self.corpus
+        docs = []
+        for i in indices:
+            book, chapter, verse = corpus.locate(i)
+            metadata = {"book": book, "chapter": chapter, "verse": verse}
+            docs.append(_document(corpus.text(i), metadata))
+        return docs
+
+    def embed_question(self, question):
+        """Query embedding for a question, through the query cache."""
+        vector = self.cache.get_embedding(question)
+        if vector is None:
+            self.telemetry.count("query_embedding.miss")
+            with self.telemetry.span("embed"):
+                vector = self.embedding.embed_query(question)
+            self.cache.put_embedding(question, vector)
+        else:
+            self.telemetry.count("query_embedding.hit")
+        return [float(x) for x in vector]
+
+    def embed_questions(self, questions):
+        """embed_question for many questions: one encoder call for every
+        question the cache does not already hold."""
+        vectors = [self.cache.get_embedding(q) for q in questions]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        self.telemetry.count("query_embedding.hit", len(questions) - len(missing))
+        self.telemetry.count("query_embedding.miss", len(missing))
+        if missing:
+            # The sentence-transformers model encodes queries and documents alike
+            with self.telemetry.span("embed"):
+                fresh = self.embedding.embed_documents([questions[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                self.cache.put_embedding(questions[i], vector)
+                vectors[i] = vector
+        return [[float(x) for x in v] for v in vectors]
+
+    def _dense_docs_many(self, vectors, k, books, chapter, verses):
+        self.ensure_vectorstore()
+        with self.telemetry.span("search.dense"):
+            if self.backend == "flat":
+                return self.vectorstore.similarity_search_by_vectors(
+                    vectors, k=k, books=books, chapter=chapter, verses=verses)
+            where = self._chroma_where(books, chapter, verses)
+            return [self.vectorstore.similarity_search_by_vector(v, k=k, filter=where) for v in vectors]
+
+    def _dense_docs(self, question, k, books, chapter, verses):
+        self.ensure_vectorstore()
+        vector = self.embed_question(question)
+        with self.telemetry.span("search.dense"):
+            if self.backend == "flat":
+                return self.vectorstore.similarity_search_by_vector(vector, k=k, books=books, chapter=chapter, verses=verses)
+            where = self._chroma_where(books, chapter, verses)
+            return self.vectorstore.similarity_search_by_vector(vector, k=k, filter=where)
+
+    def query_docs(self, question: str, k: int = 5, book=None, chapter=None, verses=None,
+                   testament=None, mode=None):
+        """Top-k passages, optionally restricted to a book (corpus id such as
+        "1john"), a chapter of that book, a (first, last) verse range of that
+        chapter, or a testament ("old"/"new"). Constraints are applied inside
+        the search, before top-k, so results are always in scope.
+
+        mode is one of RETRIEVAL_MODES (default: RETRIEVAL_MODE env or "auto").
+        """
+        mode = self._mode(mode)
+        books, chapter, verses = self._scope(book, chapter, verses, testament)
+
+        # Repeat questions skip both the encoder and the search
+        key = self.cache.results_key(question, k=k, books=books, chapter=chapter,
+                                     verses=verses, mode=mode)
+        cached = self.cache.get_results(key)
+        if cached is not None:
+            self.telemetry.count("query_results.hit")
+            return [_document(text, dict(meta)) for text, meta in cached]
+        self.telemetry.count("query_results.miss")
+        docs = self._search(question, k, books, chapter, verses, mode)
+        self.cache.put_results(key, [(d.page_content, d.metadata) for d in docs])
+        return docs
+
+    def query_docs_batch(self, queries, k: int = 5, mode=None):
+        """query_docs for a list of (question, scope) pairs, where scope is a
+        dict of query_docs keyword arguments (book, chapter, verses, testament).
+
+        Questions not in the results cache are embedded in one encoder call,
+        and the dense search runs as one block per distinct scope.
+        """
+        mode = self._mode(mode)
+        results = [None] * len(queries)
+        todo = []
+        for i, (question, scope) in enumerate(queries):
+            books, chapter, verses = self._scope(**scope)
+            key = self.cache.results_key(question, k=k, books=books, chapter=chapter,
+                                         verses=verses, mode=mode)
+            cached = self.cache.get_results(key)
+            self.telemetry.count("query_results.hit" if cached is not None else "query_results.miss")
+            if cached is not None:
+                results[i] = [_document(text, dict(meta)) for text, meta in cached]
+            else:
+                todo.append((i, question, books, chapter, verses, key))
+
+        # Dense candidates for every question whose search will need them
+        need = [t for t in todo if mode != "lexical" and not (mode == "auto" and self._phrase_of(t[1]))]
+        dense = {}
+        if need:
+            n = k if mode == "dense" else 2 * k
+            groups = {}
+            for t, vector in zip(need, self.embed_questions([t[1] for t in need])):
+                scope = (tuple(t[2] or ()), t[3], tuple(t[4]) if t[4] else None)
+                groups.setdefault(scope, []).append((t[0], vector))
+            for (books, chapter, verses), members in groups.items():
+                hits = self._dense_docs_many([v for _, v in members], n, list(books) or None, chapter, verses)
+                for (i, _), docs in zip(members, hits):
+                    dense[i] = docs
+
+        for i, question, books, chapter, verses, key in todo:
+            docs = self._search(question, k, books, chapter, verses, mode, dense=dense.get(i))
+            self.cache.put_results(key, [(d.page_content, d.metadata) for d in docs])
+            results[i] = docs
+        return results
+
+    @staticmethod
+    def _mode(mode):
+        mode = (mode or os.getenv("RETRIEVAL_MODE", "auto")).lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}' (choose from {RETRIEVAL_MODES})")
+        return mode
+
+    def _search(self, question, k, books, chapter, verses, mode, dense=None):
+        """dense: precomputed dense candidates (k for "dense", 2k otherwise)."""
+        if mode == "dense":
+            return dense if dense is not None else self._dense_docs(question, k, books, chapter, verses)
+
+        mask = self._scope_mask(books, chapter, verses)
+        if mode == "auto":
+            # Fast path: answer quotations straight from the positional postings
+            phrase = self._phrase_of(question)
+            if phrase:
+                with self.telemetry.span("search.phrase"):
+                    hits = self.lexical.phrase(phrase, limit=k, mask=mask)
+                if hits:
+                    return self._verse_documents(hits)
+            mode = "hybrid"
+
+        with self.telemetry.span("search.lexical"):
+            lexical = self.lexical.bm25(question, k=k if mode == "lexical" else 2 * k, mask=mask)
+        if mode == "lexical":
+            return self._verse_documents(d for d, _ in lexical)
+
+        # Reciprocal-rank fusion keyed by passage: a BM25 verse hit inside a
+        # dense passage hit adds to that passage's score
+        if dense is None:
+            dense = self._dense_docs(question, 2 * k, books, chapter, verses)
+        corpus = self.corpus
+        fused, docs = {}, {}
+        for rank, d in enumerate(dense):
+            m = d.metadata
+            index = corpus.verse_index(m.get("book"), m.get("chapter"), m.get("verse"))
+            key = self.passages.of_verse(index) if index is not None else (m.get("book"), m.get("chapter"), m.get("verse"))
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, d)
+        for rank, (index, _) in enumerate(lexical):
+            key = self.passages.of_verse(index)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            if key not in docs:
+                docs[key] = self._verse_documents([index])[0]
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [docs[key] for key in best]
+
+    # --- related passages -------------------------------------------------
+    def _neighbors_stamp(self):
+        manifest = json.dumps(self._expected_manifest(), sort_keys=True)
+        return hashlib.sha256(manifest.encode("utf-8")).hexdigest()
+
+    def passage_vectors(self):
+        """Unit embeddings of every passage, in PassageMap order, read from
+        the vector store (rows the store lacks stay zero)."""
+        self.ensure_vectorstore()
+        if self.backend == "flat":
+            metadata, matrix = self.vectorstore.vectors()
+        else:
+            got = self.vectorstore.get(include=["embeddings", "metadatas"])
+            metadata = got["metadatas"]
+            matrix = np.asarray(got["embeddings"], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        corpus = self.corpus
+        passages = self.passages
+        out = np.zeros((len(passages), matrix.shape[1]), dtype=np.float32)
+        for m, vector in zip(metadata, matrix):
+            index = corpus.verse_index(m["book"], m["chapter"], m["verse"])
+            if index is not None:
+                out[passages.of_verse(index)] = vector
+        return out
+
+    def build_neighbors(self, k: int = NEIGHBORS_K, path=NEIGHBORS_PATH):
+        """Offline: compute and save the related-passage graph (neighbors.py)."""
+        corpus = self.corpus
+        passages = self.passages
+        # Neighbors from the passage's own chapter are excluded
+        chapters = {}
+        groups = np.array([chapters.setdefault(corpus.locate(start)[:2], len(chapters))
+                           for start in passages.starts], dtype=np.int32)
+        graph = NeighborGraph.build(self.passage_vectors(), k, groups)
+        graph.save(path, self._neighbors_stamp())
+        self._neighbors = graph
+        print(f"✅ Related-passage graph saved to {path} ({len(graph.indices)} edges).")
+        return graph
+
+    @property
+    def neighbors(self):
+        """The saved related-passage graph, or None if it was not built (or
+        is stale). Loaded on first use; never builds at query time."""
+        if self._neighbors is None:
+            with self._index_lock:
+                if self._neighbors is None:
+                    graph = NeighborGraph.load(NEIGHBORS_PATH, self._neighbors_stamp())
+                    self._neighbors = graph if graph is not None else False
+        return self._neighbors or None
 
+    def related_passages(self, start: int, end: int, k: int = 5):
+        """[(passage, score)] most related to the verses [start, end) of the
+        corpus: neighbors of the passages covering them."""
+        graph = self.neighbors
+        if graph is None or end <= start:
+            return []
+        passages = self.passages
+        own = range(passages.of_verse(start), passages.of_verse(end - 1) + 1)
+        with self.telemetry.span("related"):
+            return graph.related(own, k)
 
-        # add this method
-    def query_docs(self, question: str, k: int = 5):
-        if not self.vectorstore:
-            raise RuntimeError("Vectorstore not initialized")
-        return self.vectorstore.similarity_search(question, k=k)
+    def related_documents(self, start: int, end: int, k: int = 5):
+        """related_passages as Documents (metadata with end_verse)."""
+        passages = self.passages
+        return [_document(passages.text(p), passages.metadata(p))
+                for p, _ in self.related_passages(start, end, k)]
 
     # keep existing query if you like, or refactor it to call query_docs
     def query(self, question: str) -> str:
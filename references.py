@@ -0,0 +1,142 @@
+# references.py
+"""
+Scripture reference parsing and resolution.
+
+Understands reference lists as users paste them from reading plans:
+
+    John 3:16-4:2; Rom 8:28, 31-39     verse, cross-chapter and continuation ranges
+    Psalm 23 / Psalm 23-24             whole chapters and chapter ranges
+    Matthew 5:3-                       open range (to the end of the chapter)
+
+Each parsed reference resolves to one [start, end) slice of the compiled
+corpus index (see VerseCorpus.range_span), so resolution cost does not depend
+on how many verses a range covers.
+"""
+import re
+from typing import NamedTuple, Optional
+
+from book_resolver import display_name
+
+_DASH = r"\s*[-–—]\s*"
+_ITEM = rf"\d{{1,3}}(?::\d{{1,3}})?(?:{_DASH}(?:\d{{1,3}}(?::\d{{1,3}})?)?)?"
+_ORDINAL = r"(?:[1-3](?:st|nd|rd)?|iii|ii|i|first|second|third)"
+
+# Book words followed by a list of items separated by "," or ";". An item
+# that is really the ordinal of the next book ("; 1 John 4") is left for the
+# next search.
+_REF_RE = re.compile(
+    rf"\b(?P<book>(?:{_ORDINAL}\s*)?[a-z][a-z]*\.?(?:\s+of\s+[a-z]+)?)\s*"
+    rf"(?P<items>{_ITEM}(?:\s*[,;]\s*{_ITEM}(?!\s*[a-z]+\.?\s*\d))*)",
+    re.IGNORECASE,
+)
+_ITEM_RE = re.compile(
+    rf"(?P<c>\d+)(?::(?P<v>\d+))?(?:(?P<dash>{_DASH})(?:(?P<c2>\d+)(?::(?P<v2>\d+))?)?)?"
+)
+
+
+class Reference(NamedTuple):
+    """A parsed reference. verse/end_verse of None mean "chapter edge"."""
+    book: str
+    chapter: int
+    verse: Optional[int]
+    end_chapter: int
+    end_verse: Optional[int]
+
+    def label(self) -> str:
+        name = display_name(self.book)
+        c, v, c2, v2 = self.chapter, self.verse, self.end_chapter, self.end_verse
+        if v is None:
+            return f"{name} {c}" if c2 == c else f"{name} {c}–{c2}"
+        if c2 == c and v2 == v:
+            return f"{name} {c}:{v}"
+        if v2 is None:
+            return f"{name} {c}:{v}–" if c2 == c else f"{name} {c}:{v}–{c2}"
+        if c2 == c:
+            return f"{name} {c}:{v}–{v2}"
+        return f"{name} {c}:{v}–{c2}:{v2}"
+
+
+class ReferenceParser:
+    """Find every reference in free text, using a BookResolver for names.
+
+    single_chapter_books lists books (Obadiah, Philemon, Jude, ...) where a
+    bare number is a verse: "Jude 3" is Jude 1:3. Book names must be exact
+    aliases unless a chapter:verse follows ("Genisis 1:1").
+    """
+
+    def __init__(self, resolver, single_chapter_books=()):
+        self.resolver = resolver
+        self.single_chapter_books = frozenset(single_chapter_books)
+
+    def parse(self, text: str):
+        """Return a list of Reference in the order they appear in text."""
+        return self.scan(text)[0]
+
+    def spans_whole_text(self, text: str) -> bool:
+        """True when text is nothing but references ("Psalm 23; John 1")."""
+        return self.scan(text)[1]
+
+    def scan(self, text: str):
+        """parse() and spans_whole_text() in one pass: (refs, whole)."""
+        refs = []
+        rest = []
+        pos = covered = 0
+        while True:
+            m = _REF_RE.search(text, pos)
+            if not m:
+                break
+            # Misspelled names are only trusted in front of a chapter:verse;
+            # elsewhere any word before a number ("these 7", "there 1") would
+            # fuzzy-match some book
+            book = self.resolver.resolve(m.group("book"), fuzzy=":" in m.group("items"))
+            if book is None:
+                # not a book ("in 1 John 4", "chapter 3"); retry one word later
+                pos = m.start("book") + 1
+                continue
+            refs.extend(self._parse_items(book, m.group("items"), book in self.single_chapter_books))
+            rest.append(text[covered:m.start()])
+            pos = covered = m.end()
+        rest.append(text[covered:])
+        whole = bool(refs) and not re.sub(r"[\s,;.!?]+", "", "".join(rest))
+        return refs, whole
+
+    @staticmethod
+    def _parse_items(book: str, items: str, single_chapter: bool = False):
+        refs = []
+        chapter = 1 if single_chapter else None   # current chapter context
+        verse_level = single_chapter              # did the previous item name a verse?
+        for m in _ITEM_RE.finditer(items):
+            c, v = int(m.group("c")), m.group("v")
+            c2, v2 = m.group("c2"), m.group("v2")
+            open_ended = m.group("dash") is not None and c2 is None
+
+            if v is None and verse_level and chapter is not None:
+                # "Rom 8:28, 31-39": bare numbers continue the verse context
+                start_c, start_v = chapter, c
+            elif v is None:
+                start_c, start_v = c, None
+            else:
+                start_c, start_v = c, int(v)
+
+            if open_ended:
+                end_c, end_v = start_c, None
+            elif c2 is None:
+                end_c, end_v = start_c, start_v
+            elif v2 is not None:
+                end_c, end_v = int(c2), int(v2)
+            elif start_v is not None:
+                end_c, end_v = start_c, int(c2)      # "3:16-18"
+            else:
+                end_c, end_v = int(c2), None         # "23-24" (chapters)
+
+            if (end_c, end_v or 10**6) < (start_c, start_v or 0):
+                continue
+            refs.append(Reference(book, start_c, start_v, end_c, end_v))
+            chapter = end_c
+            verse_level = start_v is not None
+        return refs
+
+
+def resolve(corpus, ref: Reference):
+    """Return the [start, end) corpus slice for a reference, or None."""
+    return corpus.range_span(ref.book, ref.chapter, ref.verse, ref.end_chapter, ref.end_verse)
@@ -0,0 +1,288 @@
+# service.py
+"""
+Multi-user service around one loaded BibleChatAgent: JSON lines over a local
+TCP (or Unix) socket.
+
+Requests, one JSON object per line:
+
+    {"id": 1, "session": "anna", "question": "What does Romans 8 say about hope?"}
+    {"id": 1, "cancel": true}
+    {"id": 2, "stats": true}
+    {"id": 3, "metrics": true}                     Prometheus text of the stage timings
+
+Responses, one JSON object per line, tagged with the request id:
+
+    {"id": 1, "piece": "..."}                      streamed answer text
+    {"id": 1, "done": true, "answer": "...", "ms": 812.4}
+    {"id": 1, "error": "busy" | "timeout" | "cancelled" | "bad_request" | "internal", "message": "..."}
+
+Scheduling:
+  - plan() (classification, retrieval, answer-cache lookup) runs in a thread
+    pool, so requests waiting for the model still get their retrieval done;
+  - plans that need no LLM (casual replies, cached answers, bad references)
+    are answered straight away and never queue behind generation;
+  - LLM work goes through a bounded queue to one generation slot per model
+    context: one thread that owns the Llama, or one per worker process with
+    LLM_WORKERS > 1 (each session's turns go to the same worker). A full
+    queue rejects new questions with "busy" (backpressure), a job that
+    waits longer than QUEUE_TIMEOUT fails with "timeout", and decoding stops
+    at GEN_TIMEOUT, on a cancel request, or when the client disconnects.
+
+Each session keeps its own history in the agent's session store (compact,
+persisted; see session_store.py); turns within a session run in order.
+
+Run:  python service.py   (SERVICE_HOST/SERVICE_PORT, or SERVICE_SOCKET for a Unix socket)
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class ServiceError(Exception):
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class _LLMJob:
+    def __init__(self, plan, loop):
+        self.plan = plan
+        self.loop = loop
+        self.out = asyncio.Queue()          # pieces, then None or a ServiceError
+        self.cancelled = threading.Event()
+        self.enqueued = time.monotonic()
+        self.started = None
+
+    def emit(self, item):
+        self.loop.call_soon_threadsafe(self.out.put_nowait, item)
+
+
+class Scheduler:
+    def __init__(self, agent, retrieval_workers: int = 4, queue_size: int = 16,
+                 queue_timeout: float = 120.0, gen_timeout: float = 180.0,
+                 max_sessions: int = 1000):
+        self.agent = agent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.gen_timeout = gen_timeout
+        self.max_sessions = max_sessions
+        self.retrieval = ThreadPoolExecutor(retrieval_workers, thread_name_prefix="retrieval")
+        self.slots = getattr(agent, "llm_workers", 1)   # concurrent generations
+        self.llm_thread = ThreadPoolExecutor(self.slots, thread_name_prefix="llm")
+        self.sessions = OrderedDict()       # session id -> asyncio.Lock
+        self.queue = None
+        self.counters = {k: 0 for k in ("direct", "llm", "prompt_tokens", "busy", "timeout", "cancelled", "errors")}
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self._workers = [asyncio.create_task(self._llm_worker()) for _ in range(self.slots)]
+
+    # --- sessions -----------------------------------------------------------
+    def _session(self, session_id):
+        lock = self.sessions.get(session_id)
+        if lock is None:
+            lock = self.sessions[session_id] = asyncio.Lock()
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            oldest = next(iter(self.sessions))
+            if self.sessions[oldest].locked():
+                break
+            del self.sessions[oldest]
+        return lock
+
+    # --- LLM worker ---------------------------------------------------------
+    async def _llm_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            if job.cancelled.is_set():
+                continue   # its client gave up or timed out while it was queued
+            await loop.run_in_executor(self.llm_thread, self._generate, job)
+
+    def _generate(self, job):
+        job.started = time.monotonic()
+        self.agent.telemetry.record("queue_wait", job.started - job.enqueued)
+        deadline = job.started + self.gen_timeout
+        stream = self.agent.generate(job.plan)
+        try:
+            for piece in stream:
+                job.emit(piece)
+                if job.cancelled.is_set():
+                    job.emit(ServiceError("cancelled", "Request cancelled."))
+                    return
+                if time.monotonic() > deadline:
+                    job.emit(ServiceError("timeout", f"Answer took longer than {self.gen_timeout:.0f}s."))
+                    return
+            job.emit(None)
+        except Exception as e:
+            job.emit(ServiceError("internal", str(e)))
+        finally:
+            stream.close()   # stops decoding
+
+    # --- public API ---------------------------------------------------------
+    async def ask(self, session_id: str, question: str):
+        """Async generator of answer pieces for one turn of a session."""
+        async with self._session(session_id):
+            loop = asyncio.get_running_loop()
+            plan = await loop.run_in_executor(
+                self.retrieval, partial(self.agent.plan, question, session=session_id))
+            pieces = []
+            if not plan.needs_llm:
+                self.counters["direct"] += 1
+                for piece in self.agent.generate(plan):
+                    pieces.append(piece)
+                    yield piece
+            else:
+                job = _LLMJob(plan, loop)
+                try:
+                    self.queue.put_nowait(job)
+                except asyncio.QueueFull:
+                    self.counters["busy"] += 1
+                    raise ServiceError("busy", "The model is busy; please retry shortly.")
+                self.counters["llm"] += 1
+                self.counters["prompt_tokens"] += plan.prompt_tokens
+                try:
+                    async for piece in self._drain(job):
+                        pieces.append(piece)
+                        yield piece
+                finally:
+                    # No-op once finished; otherwise stops or skips the job
+                    job.cancelled.set()
+            await loop.run_in_executor(self.retrieval, self.agent.remember, session_id, plan, "".join(pieces))
+
+    async def _drain(self, job):
+        while True:
+            if job.started is None:
+                wait = job.enqueued + self.queue_timeout - time.monotonic()
+                try:
+                    item = await asyncio.wait_for(job.out.get(), max(wait, 0.001))
+                except asyncio.TimeoutError:
+                    if job.started is not None:
+                        continue
+                    self.counters["timeout"] += 1
+                    raise ServiceError("timeout", f"Waited more than {self.queue_timeout:.0f}s for the model.")
+            else:
+                item = await job.out.get()
+            if item is None:
+                return
+            if isinstance(item, ServiceError):
+                self.counters[item.code if item.code in self.counters else "errors"] += 1
+                raise item
+            yield item
+
+    def stats(self):
+        return dict(
+            self.counters,
+            queued=self.queue.qsize() if self.queue is not None else 0,
+            queue_size=self.queue_size,
+            llm_slots=self.slots,
+            sessions=len(self.sessions),
+            telemetry=self.agent.telemetry.snapshot(),
+        )
+
+
+async def handle_connection(scheduler, reader, writer):
+    tasks = {}
+    write_lock = asyncio.Lock()
+
+    async def send(obj):
+        async with write_lock:
+            writer.write((json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    async def answer(req_id, session, question):
+        t0 = time.monotonic()
+        pieces = []
+        stream = scheduler.ask(session, question)
+        try:
+            async for piece in stream:
+                pieces.append(piece)
+                await send({"id": req_id, "piece": piece})
+            await send({"id": req_id, "done": True, "answer": "".join(pieces),
+                        "ms": round((time.monotonic() - t0) * 1000, 1)})
+        except ServiceError as e:
+            await send({"id": req_id, "error": e.code, "message": str(e)})
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            scheduler.counters["errors"] += 1
+            await send({"id": req_id, "error": "internal", "message": str(e)})
+        finally:
+            await stream.aclose()   # releases the session and cancels queued work
+            tasks.pop(req_id, None)
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                req = json.loads(line)
+                req_id = req.get("id")
+            except (ValueError, AttributeError):
+                await send({"id": None, "error": "bad_request", "message": "Expected one JSON object per line."})
+                continue
+            if req.get("stats"):
+                await send({"id": req_id, "stats": scheduler.stats()})
+            elif req.get("metrics"):
+                await send({"id": req_id, "metrics": scheduler.agent.telemetry.prometheus()})
+            elif req.get("cancel"):
+                task = tasks.get(req_id)
+                if task is not None and task.cancel():
+                    await asyncio.gather(task, return_exceptions=True)
+                    await send({"id": req_id, "error": "cancelled", "message": "Request cancelled."})
+            elif isinstance(req.get("question"), str) and req["question"].strip():
+                if req_id in tasks:
+                    await send({"id": req_id, "error": "bad_request", "message": "Request id already in use."})
+                    continue
+                session = str(req.get("session") or "default")
+                tasks[req_id] = asyncio.create_task(answer(req_id, session, req["question"]))
+            else:
+                await send({"id": req_id, "error": "bad_request", "message": "Missing 'question'."})
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        # Client went away: stop whatever it was still waiting for
+        for task in list(tasks.values()):
+            task.cancel()
+        writer.close()
+
+
+async def serve(agent, host="127.0.0.1", port=8765, unix_path=None):
+    scheduler = Scheduler(
+        agent,
+        retrieval_workers=int(os.getenv("RETRIEVAL_WORKERS", str(min(4, os.cpu_count() or 1)))),
+        queue_size=int(os.getenv("LLM_QUEUE_SIZE", "16")),
+        queue_timeout=float(os.getenv("QUEUE_TIMEOUT", "120")),
+        gen_timeout=float(os.getenv("GEN_TIMEOUT", "180")),
+    )
+    await scheduler.start()
+    handler = lambda r, w: handle_connection(scheduler, r, w)
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, unix_path)
+        print(f"📡 Serving on unix socket {unix_path}")
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        print(f"📡 Serving on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    from chat_agent import BibleChatAgent
+
+    agent = BibleChatAgent("./bible/bible_books")
+    try:
+        asyncio.run(serve(
+            agent,
+            host=os.getenv("SERVICE_HOST", "127.0.0.1"),
+            port=int(os.getenv("SERVICE_PORT", "8765")),
+            unix_path=os.getenv("SERVICE_SOCKET") or None,
+        ))
+    except KeyboardInterrupt:
+        print("👋 Service stopped.")
@@ -0,0 +1,169 @@
+# session_store.py
+"""
+Bounded, persistent conversation memory.
+
+A turn is kept compactly: the question, the references it cited and a short
+digest of the answer (its opening sentences), with the token count of that
+rendering computed once when the turn is stored. Prompts therefore carry a
+few dozen tokens per earlier turn instead of whole answers, and fitting
+history into a budget is a sum over stored counts.
+
+Memory is capped: at most max_turns per session, and sessions are evicted
+least-recently-used beyond max_sessions or max_bytes. Every turn is written
+through to SQLite, so an evicted or restarted session is reloaded on its next
+use; turns older than ttl_seconds are purged on open.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import NamedTuple
+
+DIGEST_CHARS = 240
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class Turn(NamedTuple):
+    question: str
+    refs: tuple     # references cited in the question or answer
+    digest: str     # opening of the answer
+    tokens: int     # tokens of text
+    created: float
+
+    @property
+    def text(self) -> str:
+        """The turn as it appears in a prompt's history block."""
+        cited = f" [{'; '.join(self.refs)}]" if self.refs else ""
+        return f"Q: {self.question}\nA: {self.digest}{cited}"
+
+    @property
+    def size(self) -> int:
+        return len(self.question) + len(self.digest) + sum(len(r) for r in self.refs) + 64
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut.rstrip(",;:") + "…"
+
+
+def digest(answer: str, limit: int = DIGEST_CHARS) -> str:
+    """Whole opening sentences of answer up to limit characters."""
+    out = ""
+    for sentence in _SENTENCE_END.split(" ".join(answer.split())):
+        if out and len(out) + len(sentence) + 1 > limit:
+            break
+        out = f"{out} {sentence}" if out else sentence
+    return _shorten(out, limit)
+
+
+class SessionStore:
+    def __init__(self, count=None, path=None, max_turns: int = 10, max_sessions: int = 1000,
+                 max_bytes: int = 4 * 1024 * 1024, ttl_seconds: float = 30 * 24 * 3600):
+        # count(text) -> tokens; the agent passes its TokenCounter
+        self.count = count or (lambda text: len(text) // 3 + 1)
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()   # session id -> deque of Turns
+        self._bytes = 0
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                " session TEXT, seq INTEGER, question TEXT, refs TEXT, digest TEXT,"
+                " tokens INTEGER, created REAL, PRIMARY KEY (session, seq))"
+            )
+            self._db.execute("DELETE FROM turns WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # --- internal bookkeeping ----------------------------------------------
+    def _load(self, session):
+        turns = self._sessions.get(session)
+        if turns is None:
+            turns = deque(maxlen=self.max_turns)
+            if self._db is not None:
+                rows = self._db.execute(
+                    "SELECT question, refs, digest, tokens, created FROM turns"
+                    " WHERE session = ? ORDER BY seq DESC LIMIT ?", (session, self.max_turns)
+                ).fetchall()
+                for question, refs, text, tokens, created in reversed(rows):
+                    turns.append(Turn(question, tuple(filter(None, refs.split("\n"))), text, tokens, created))
+            self._sessions[session] = turns
+            self._bytes += sum(t.size for t in turns)
+        self._sessions.move_to_end(session)
+        return turns
+
+    def _evict(self):
+        # Memory only: evicted sessions stay on disk and reload on next use
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            _, turns = self._sessions.popitem(last=False)
+            self._bytes -= sum(t.size for t in turns)
+
+    # --- public API -----------------------------------------------------------
+    def compact(self, question: str, answer: str, refs=()) -> Turn:
+        """A stored form of one turn."""
+        turn = Turn(_shorten(question, DIGEST_CHARS), tuple(refs), digest(answer), 0, time.time())
+        return turn._replace(tokens=self.count(turn.text))
+
+    def append(self, session: str, question: str, answer: str, refs=()) -> Turn:
+        turn = self.compact(question, answer, refs)
+        with self._lock:
+            turns = self._load(session)
+            if len(turns) == turns.maxlen:
+                self._bytes -= turns[0].size
+            turns.append(turn)
+            self._bytes += turn.size
+            if self._db is not None:
+                seq = self._db.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE session = ?", (session,)
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (session, seq, turn.question, "\n".join(turn.refs), turn.digest, turn.tokens, turn.created),
+                )
+                self._db.execute("DELETE FROM turns WHERE session = ? AND seq <= ?", (session, seq - self.max_turns))
+                self._db.commit()
+            self._evict()
+        return turn
+
+    def turns(self, session: str) -> list:
+        """Stored turns of a session, oldest first."""
+        with self._lock:
+            turns = list(self._load(session))
+            self._evict()
+        return turns
+
+    def recent(self, session: str, budget: int) -> list:
+        """The newest turns whose tokens fit budget, oldest first."""
+        out, left = [], budget
+        for turn in reversed(self.turns(session)):
+            if turn.tokens + 1 > left:
+                break
+            left -= turn.tokens + 1
+            out.append(turn)
+        return out[::-1]
+
+    def history_block(self, session: str, budget: int) -> str:
+        """recent() rendered as prompt text."""
+        return "\n".join(t.text for t in self.recent(session, budget))
+
+    def clear(self, session: str):
+        with self._lock:
+            turns = self._sessions.pop(session, None)
+            if turns:
+                self._bytes -= sum(t.size for t in turns)
+            if self._db is not None:
+                self._db.execute("DELETE FROM turns WHERE session = ?", (session,))
+                self._db.commit()
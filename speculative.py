@@ -0,0 +1,74 @@
+# speculative.py
+"""
+Prompt-lookup speculative decoding with acceptance accounting.
+
+Answers quote the retrieved verses, so the next few tokens of the output are
+often a verbatim continuation of something already in the prompt. The draft
+finds the latest occurrence of the output's trailing n-gram in the prompt and
+proposes the tokens that followed it there; llama.cpp evaluates the proposal
+together with the current token in one batch and keeps the prefix the model
+agrees with. A correct proposal turns several sequential decode steps into
+one batched step; a wrong one costs little more than one normal step.
+
+    SPECULATIVE=prompt_lookup   enable (default: off)
+    SPEC_NUM_PRED=10            tokens proposed per step
+    SPEC_NGRAM=2                longest n-gram matched against the prompt
+
+llama-cpp-python does not report how many drafted tokens were kept, so the
+draft works it out itself: at each call the tokens appended since its last
+proposal are what the model actually produced, and the common prefix with
+that proposal is the accepted part.
+"""
+import os
+
+SPECULATIVE_MODES = ("off", "prompt_lookup")
+
+
+class PromptLookupDraft:
+    """A llama_cpp draft model (LlamaPromptLookupDecoding) that counts
+    proposed and accepted tokens."""
+
+    def __init__(self, num_pred_tokens: int = 10, max_ngram_size: int = 2):
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+        self._lookup = LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens, max_ngram_size=max_ngram_size)
+        self.proposed = 0
+        self.accepted = 0
+        self._pending = None    # (position, proposed tokens) awaiting the model's verdict
+
+    def __call__(self, input_ids, **kwargs):
+        self.settle(input_ids)
+        draft = self._lookup(input_ids, **kwargs)
+        if len(draft):
+            self._pending = (len(input_ids), [int(t) for t in draft])
+            self.proposed += len(draft)
+        return draft
+
+    def settle(self, input_ids):
+        """Count how much of the pending proposal input_ids confirms."""
+        if self._pending is None:
+            return
+        position, draft = self._pending
+        self._pending = None
+        produced = input_ids[position:position + len(draft)]
+        for proposed, actual in zip(draft, produced):
+            if proposed != int(actual):
+                break
+            self.accepted += 1
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.proposed if self.proposed else None
+
+
+def draft_from_env():
+    """The draft model selected by SPECULATIVE, or None."""
+    mode = os.getenv("SPECULATIVE", "off").lower()
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(f"Unknown SPECULATIVE mode '{mode}' (choose from {SPECULATIVE_MODES})")
+    if mode == "off":
+        return None
+    return PromptLookupDraft(
+        num_pred_tokens=int(os.getenv("SPEC_NUM_PRED", "10")),
+        max_ngram_size=int(os.getenv("SPEC_NGRAM", "2")),
+    )
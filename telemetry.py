@@ -0,0 +1,241 @@
+# telemetry.py
+"""
+Lightweight timing spans and counters for the answer pipeline.
+
+    with telemetry.span("retrieve"):     time a stage (nests; thread-safe)
+    telemetry.count("query_cache.hit")   bump a counter
+
+Every stage keeps a rolling window of its latest durations (percentiles for
+/stats) plus a running count and sum (Prometheus summaries). A Trace groups
+the spans of one turn: plan() opens it, generate() adds prefill and decode
+and closes it, and with TELEMETRY_LOG set each closed trace is appended to
+that file as one JSON line. The trace is carried on the TurnPlan, so a turn
+planned in one thread and generated in another stays one record.
+
+TELEMETRY=0 turns all of it into no-ops: span() returns a shared null
+context and count()/record() return immediately.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+_NAMESPACE = "bible_bot"
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTrace(_NullContext):
+    __slots__ = ()
+
+    def record(self, name, seconds, parent=None):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def finish(self, **fields):
+        pass
+
+
+_NULL = _NullContext()
+_NULL_TRACE = _NullTrace()
+
+
+class _Span:
+    __slots__ = ("telemetry", "name", "t0", "parent")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        local = self.telemetry._local
+        self.parent = getattr(local, "span", None)
+        local.span = self.name
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        local = self.telemetry._local
+        local.span = self.parent
+        self.telemetry.record(self.name, seconds, parent=self.parent)
+        return False
+
+
+class Trace:
+    """The spans and counters of one turn."""
+
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+        self.t0 = time.perf_counter()
+        self.started = time.time()
+        self.spans = []
+        self.counters = {}
+        self._outer = None
+
+    def __enter__(self):
+        # Spans opened in this thread until exit belong to this trace
+        local = self.telemetry._local
+        self._outer = getattr(local, "trace", None)
+        local.trace = self
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry._local.trace = self._outer
+        return False
+
+    def record(self, name, seconds, parent=None):
+        self.telemetry.record(name, seconds, parent, trace=self)
+
+    def count(self, name, n=1):
+        self.telemetry.count(name, n, trace=self)
+
+    def finish(self, **fields):
+        self.telemetry.record("turn", time.perf_counter() - self.t0, trace=self)
+        self.telemetry._log(dict(
+            fields,
+            ts=round(self.started, 3),
+            spans=self.spans,
+            counters=self.counters,
+        ))
+
+
+class Telemetry:
+    def __init__(self, enabled: bool = None, window: int = None, log_path: str = None):
+        if enabled is None:
+            enabled = os.getenv("TELEMETRY", "1") != "0"
+        self.enabled = enabled
+        self.window = window or int(os.getenv("TELEMETRY_WINDOW", "512"))
+        self.log_path = log_path if log_path is not None else os.getenv("TELEMETRY_LOG") or None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = {}      # stage -> deque of ms
+        self._totals = {}      # stage -> [count, seconds]
+        self._counters = {}
+
+    # --- recording ------------------------------------------------------------
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else _NULL
+
+    def trace(self):
+        return Trace(self) if self.enabled else _NULL_TRACE
+
+    def record(self, name: str, seconds: float, parent=None, trace=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            recent = self._recent.get(name)
+            if recent is None:
+                recent = self._recent[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            recent.append(seconds * 1000)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+        trace = trace or getattr(self._local, "trace", None)
+        if trace is not None:
+            entry = {"name": name, "ms": round(seconds * 1000, 3)}
+            if parent:
+                entry["parent"] = parent
+            trace.spans.append(entry)
+
+    def count(self, name: str, n: int = 1, trace=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        trace = trace or getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.counters[name] = trace.counters.get(name, 0) + n
+
+    def _log(self, record):
+        if self.log_path is None:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    # --- reading --------------------------------------------------------------
+    @staticmethod
+    def _quantile(ordered, q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        """Per-stage rolling percentiles (ms), counters and cache hit rates."""
+        with self._lock:
+            recent = {name: sorted(values) for name, values in self._recent.items()}
+            totals = {name: list(t) for name, t in self._totals.items()}
+            counters = dict(self._counters)
+        stages = {}
+        for name, ordered in recent.items():
+            if not ordered:
+                continue
+            stages[name] = {
+                "count": totals[name][0],
+                "p50": round(self._quantile(ordered, 0.50), 3),
+                "p95": round(self._quantile(ordered, 0.95), 3),
+                "p99": round(self._quantile(ordered, 0.99), 3),
+                "max": round(ordered[-1], 3),
+            }
+        hit_rates = {}
+        for name in counters:
+            cache, _, outcome = name.rpartition(".")
+            if outcome in ("hit", "miss") and cache not in hit_rates:
+                hits, misses = counters.get(cache + ".hit", 0), counters.get(cache + ".miss", 0)
+                hit_rates[cache] = round(hits / (hits + misses), 3) if hits + misses else None
+        return {"enabled": self.enabled, "stages": stages, "counters": counters, "hit_rates": hit_rates}
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition: one summary per stage, one counter per event."""
+        snap = self.snapshot()
+        with self._lock:
+            totals = {name: list(t) for name, t in self._totals.items()}
+        lines = [
+            f"# HELP {_NAMESPACE}_stage_seconds Latency of each answer pipeline stage.",
+            f"# TYPE {_NAMESPACE}_stage_seconds summary",
+        ]
+        for name, stats in sorted(snap["stages"].items()):
+            for q in ("p50", "p95", "p99"):
+                quantile = f"0.{q[1:]}"
+                lines.append(f'{_NAMESPACE}_stage_seconds{{stage="{name}",quantile="{quantile}"}} '
+                             f"{stats[q] / 1000:.6f}")
+            count, seconds = totals[name]
+            lines.append(f'{_NAMESPACE}_stage_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+            lines.append(f'{_NAMESPACE}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines += [
+            f"# HELP {_NAMESPACE}_events_total Token counts and cache hits/misses.",
+            f"# TYPE {_NAMESPACE}_events_total counter",
+        ]
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f'{_NAMESPACE}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def format_stats(self) -> str:
+        """Rolling latency table for the terminal /stats command."""
+        snap = self.snapshot()
+        if not snap["enabled"]:
+            return "Telemetry is off (TELEMETRY=0)."
+        if not snap["stages"]:
+            return "No timings recorded yet."
+        lines = [f"{'stage':<16}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}"]
+        for name, s in sorted(snap["stages"].items(), key=lambda item: -item[1]["p50"]):
+            lines.append(f"{name:<16}{s['count']:>7}{s['p50']:>11.2f}{s['p95']:>11.2f}"
+                         f"{s['p99']:>11.2f}{s['max']:>11.2f}")
+        if snap["hit_rates"]:
+            rates = ", ".join(f"{c} {r:.0%}" for c, r in sorted(snap["hit_rates"].items()) if r is not None)
+            lines.append(f"hit rates (caches, speculative drafts): {rates}")
+        tokens = {k: v for k, v in snap["counters"].items() if k.endswith("_tokens")}
+        if tokens:
+            lines.append("tokens: " + ", ".join(f"{k} {v}" for k, v in sorted(tokens.items())))
+        return "\n".join(lines)
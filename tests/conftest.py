@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope="session")
+def bible():
+    from bible_loader import Bible
+    return Bible(ROOT / "bible" / "bible_books")
@@ -0,0 +1,27 @@
+def test_range_past_last_chapter_runs_to_end_of_book(bible):
+    corpus = bible.corpus
+    start, end = corpus.range_span("john", 21, 20, 22, 5)
+    assert corpus.locate(start) == ("john", 21, 20)
+    assert (start, end) == (start, corpus.book_span("john")[1])
+
+
+def test_range_within_book(bible):
+    corpus = bible.corpus
+    start, end = corpus.range_span("john", 3, 16, 3, 18)
+    assert [corpus.locate(i)[2] for i in range(start, end)] == [16, 17, 18]
+
+
+def test_rag_checks_source_files_once(monkeypatch):
+    import corpus as corpus_module
+    from conftest import ROOT
+    from rag_chain import BibleRAG
+
+    monkeypatch.setenv("QUERY_CACHE_PATH", "")
+    rag = BibleRAG(ROOT / "bible" / "bible_books")
+    calls = []
+    real = corpus_module.source_fingerprint
+    monkeypatch.setattr(corpus_module, "source_fingerprint", lambda path: calls.append(path) or real(path))
+    for _ in range(3):
+        rag._scope_mask(["john"], 3, None)
+        rag.passages.of_verse(0)
+    assert len(calls) == 1
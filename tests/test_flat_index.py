@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from flat_index import FlatIndex, MANIFEST_FILENAME
+
+
+class _Doc:
+    def __init__(self, text, metadata):
+        self.page_content, self.metadata = text, metadata
+
+
+class _Embedding:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0, float(i)] for i, t in enumerate(texts)]
+
+
+def _chunks(book):
+    return [_Doc(f"{book} {v}", {"chapter": 1, "verse": v, "end_verse": v}) for v in (1, 2)], None
+
+
+def test_interrupted_rebuild_leaves_no_manifest(tmp_path, monkeypatch):
+    index = FlatIndex(tmp_path, _Embedding())
+    index.build({"version": 1, "books": {"ruth": "a"}}, _chunks)
+    assert index.open()
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(np, "save", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        index.build({"version": 1, "books": {"ruth": "b"}}, _chunks)
+    assert not (tmp_path / MANIFEST_FILENAME).exists()
+    assert not FlatIndex(tmp_path, _Embedding()).open()
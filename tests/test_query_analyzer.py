@@ -0,0 +1,26 @@
+import pytest
+
+from direct_answers import DirectResponder
+from query_analyzer import QueryAnalyzer
+
+
+@pytest.fixture(scope="module")
+def analyzer(bible):
+    return QueryAnalyzer(bible, DirectResponder(bible), {"hello": "Hi!"})
+
+
+@pytest.mark.parametrize("question", [
+    "Are there 2 witnesses in Revelation?",
+    "Could 2 people agree on prayer?",
+    "What are these 7 seals?",
+    "Is there 1 way to heaven",
+])
+def test_no_scope_from_words_before_numbers(analyzer, question):
+    analysis = analyzer.analyze(question)
+    assert (analysis.book, analysis.chapter) == (None, None)
+    assert analysis.category == "bible_question"
+
+
+def test_scope_from_named_chapter(analyzer):
+    analysis = analyzer.analyze("What does Romans 8 teach about hope?")
+    assert (analysis.book, analysis.chapter) == ("romans", 8)
@@ -0,0 +1,34 @@
+import sqlite3
+
+import numpy as np
+
+from query_cache import QueryCache
+
+
+def _disk_keys(path):
+    with sqlite3.connect(str(path)) as db:
+        return {key for (key,) in db.execute("SELECT key FROM cache")}
+
+
+def test_disk_tier_drops_least_recently_used(tmp_path):
+    path = tmp_path / "query.sqlite"
+    cache = QueryCache(maxsize=1, path=path, max_rows=10)
+    cache.set_stamp("v1")
+    for i in range(10):
+        cache.put_embedding(f"q{i}", np.ones(4))
+    assert cache.get_embedding("q0") is not None   # disk hit refreshes q0
+    cache.put_embedding("q10", np.ones(4))
+    keys = _disk_keys(path)
+    assert len(keys) <= 10 and {"q0", "q10"} <= keys and "q1" not in keys
+    assert cache.stats()["disk_evictions"] >= 1
+
+
+def test_disk_tier_byte_cap_and_ttl(tmp_path):
+    path = tmp_path / "query.sqlite"
+    cache = QueryCache(maxsize=1, path=path, max_bytes=2000)
+    cache.set_stamp("v1")
+    for i in range(20):
+        cache.put_embedding(f"q{i}", np.ones(64))   # 256 bytes each
+    assert cache.stats()["disk_bytes"] <= 2000
+    expired = QueryCache(path=path, ttl_seconds=-1)
+    assert expired.stats()["disk_rows"] == 0
@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.mark.parametrize("text", [
+    "Is there 1 way to heaven",
+    "What are these 7 seals?",
+    "In the beginning God created the heavens and the earth. 6 days later",
+    "Could 2 people agree on prayer?",
+    "Are those 3 the same?",
+    "Are there 2 witnesses in Revelation?",
+])
+def test_words_before_numbers_are_not_books(bible, text):
+    assert bible.references.parse(text) == []
+
+
+def test_exact_aliases_in_free_text(bible):
+    refs = bible.references.parse("What does Romans 8 teach about hope?")
+    assert [(r.book, r.chapter) for r in refs] == [("romans", 8)]
+
+
+def test_misspelled_book_with_chapter_and_verse(bible):
+    refs = bible.references.parse("Genisis 1:1")
+    assert [(r.book, r.chapter, r.verse) for r in refs] == [("genesis", 1, 1)]
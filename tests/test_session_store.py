@@ -0,0 +1,27 @@
+from session_store import SessionStore
+
+
+def test_turns_are_capped_and_persisted(tmp_path):
+    path = tmp_path / "sessions.sqlite"
+    store = SessionStore(path=path, max_turns=2)
+    for i in range(3):
+        store.append("s", f"q{i}", f"Answer {i}.", ["John 3:16"])
+    assert [t.question for t in store.turns("s")] == ["q1", "q2"]
+    reopened = SessionStore(path=path, max_turns=2)
+    assert [(t.question, t.refs) for t in reopened.turns("s")] == [("q1", ("John 3:16",)), ("q2", ("John 3:16",))]
+
+
+def test_remember_stores_resolved_refs(monkeypatch, tmp_path):
+    monkeypatch.setenv("WARMUP", "0")
+    monkeypatch.setenv("SESSION_STORE_PATH", "")
+    monkeypatch.setenv("QUERY_CACHE_PATH", "")
+    monkeypatch.setenv("RELATED_VERSES", "0")
+    monkeypatch.chdir(tmp_path)
+    from chat_agent import BibleChatAgent
+    from conftest import ROOT
+
+    agent = BibleChatAgent(ROOT / "bible" / "bible_books")
+    answer = agent.ask("Genesis 1:1-2", session="s")
+    assert answer.startswith("Genesis 1:1–2")
+    # "earth. 2 ..." in the rendered verses must not become a reference
+    assert agent.sessions.turns("s")[0].refs == ("Genesis 1:1–2",)
@@ -0,0 +1,52 @@
+import random
+
+from chat_agent import BibleChatAgent, StreamTidier
+
+
+def _stream(text, sizes):
+    tidy, out, pos = StreamTidier(), [], 0
+    for size in sizes:
+        out.append(tidy.feed(text[pos:pos + size]))
+        pos += size
+    out.append(tidy.feed(text[pos:]))
+    return "".join(out) + tidy.finish()
+
+
+def _tidy(text):
+    return BibleChatAgent._tidy_answer(None, text)
+
+
+def test_plain_text_is_released_at_once():
+    tidy = StreamTidier()
+    assert [tidy.feed(t) for t in ["Grace", " is", " a", " gift"]] == ["Grace", " is", " a", " gift"]
+
+
+def test_unfinished_quoted_verse_is_dropped():
+    text = 'Grace is a gift. As John 3:16 says, "For God so loved'
+    assert _stream(text, [5] * 20) == _tidy(text) == "Grace is a gift. As John"
+
+
+def test_citation_digits_wait_for_the_next_character():
+    tidy = StreamTidier()
+    assert tidy.feed("Chapter 3") == "Chapter"
+    assert tidy.feed(" has") == " 3 has"
+    assert tidy.feed(" 3:1") == ""
+
+
+def test_finished_quote_is_kept():
+    text = 'As John 3:16 says, "For God so loved the world." Amen.\n'
+    assert _stream(text, [3] * 30) == _tidy(text) == text.strip()
+
+
+def test_held_line_followed_by_another_line_is_kept():
+    text = 'See Romans 8:28 "all things\nwork together.'
+    assert _stream(text, [1] * 50) == _tidy(text) == text
+
+
+def test_stream_matches_tidy_answer():
+    rng = random.Random(0)
+    alphabet = ["a", "b", " ", " ", ".", "!", "\n", '"', "“", "”", "3", "16", ":", "John "]
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        sizes = [rng.randint(1, 6) for _ in range(10)]
+        assert _stream(text, sizes) == _tidy(text), repr(text)